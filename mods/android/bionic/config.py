@@ -22,6 +22,20 @@ from make_to_ninja import MakefileNinjaTranslator
 
 _LOADER_TEXT_SECTION_START_ADDRESS = '0x20000'
 
+# The libc modules compiled in jumbo source files with --enable-jumbo-build.
+_LIBC_JUMBO_MODULES = ['libc', 'libc_bionic', 'libc_common']
+_LIBC_JUMBO_EXCLUDE = [
+    # dlmalloc.c includes malloc.c, which defines many macros and static
+    # functions.
+    'android/bionic/libc/bionic/dlmalloc.c',
+    # memcpy.c defines MEMCOPY and includes bcopy.c, which the other mem*
+    # functions must not see.
+    'android/bionic/libc/bionic/mem*.c',
+    # The sources from the BSDs define the same local macros and static
+    # functions as each other.
+    'android/bionic/libc/stdio/*',
+    'android/bionic/libc/upstream-*']
+
 # TODO(crbug.com/315954): Enable more Cortex-A15 *.S files once we get -t=ba
 # (Bare Metal ARM) configuration.
 _ARM_ASM_FILES = ['android/bionic/libc/arch-arm/bionic/memcmp16.S']
@@ -75,7 +89,8 @@ def _generate_naclized_asm_ninja(ninja_name, rule_name,
   # NaClize *.S files and write them as bionic_gen_sources/*.S.
   script_path = staging.as_staging(script_path)
   n.rule(rule_name,
-         command=('python %s $in > $out' % script_path),
+         command=('python %s $in > $out' %
+                  build_common.get_build_helper_command(script_path)),
          description=rule_name + ' $out')
   all_generated_files = []
   for f in asm_files:
@@ -454,6 +469,9 @@ def _generate_libc_ninja():
     if not _dispatch_libc_sub_filters(vars):
       return False
 
+    if vars.get_module_name() in _LIBC_JUMBO_MODULES:
+      vars.enable_jumbo(exclude=_LIBC_JUMBO_EXCLUDE)
+
     _add_bare_metal_flags_to_make_to_ninja_vars(vars)
     if is_for_linker:
       module_name = vars.get_module_name()
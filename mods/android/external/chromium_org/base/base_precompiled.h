@@ -0,0 +1,21 @@
+// Copyright 2014 The Chromium Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+//
+// The headers precompiled for libchromium_base. They are included before
+// every C++ source of it, so only the headers most of the sources include
+// anyway are listed here.
+
+#ifndef BASE_BASE_PRECOMPILED_H_
+#define BASE_BASE_PRECOMPILED_H_
+
+#include <map>
+#include <string>
+#include <vector>
+
+#include "base/basictypes.h"
+#include "base/logging.h"
+#include "base/memory/ref_counted.h"
+#include "base/memory/scoped_ptr.h"
+
+#endif  // BASE_BASE_PRECOMPILED_H_
@@ -23,9 +23,15 @@ def _add_chromium_base_compiler_flags(n):
 def _generate_chromium_base_ninja():
   base_path = 'android/external/chromium_org/base'
   n = ninja_generator.ArchiveNinjaGenerator(
-      'libchromium_base', base_path=base_path, instances=2)
+      'libchromium_base', base_path=base_path, instances=2,
+      enable_jumbo=True,
+      # The third party sources define macros and static functions with
+      # common names.
+      jumbo_exclude=[os.path.join(base_path, 'third_party/*')])
   n.add_compiler_flags('-fvisibility=hidden')  # for libposix_translation.so
   _add_chromium_base_compiler_flags(n)
+  n.set_precompiled_header(os.path.join(base_path, 'base_precompiled.h'),
+                           languages=['c++'])
 
   def relevant(f):
     f = f.lstrip('android/external/chromium_org/')
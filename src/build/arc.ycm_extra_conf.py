@@ -23,11 +23,9 @@
 #   * Not all files have correct completion information since ninja does not use
 #     gomacc for all C++ files.
 #
-#   * You can avoid the call to ninja every time a file is saved/loaded by
-#     creating a JSON compilation database with the following command:
-#       $ ninja -t compdb cxx.nacl_i686 cc.nacl_i686 > \
-#         ycm/compile_commands.json
-#     Replacing 'nacl_i686' with the current ARC target.
+#   * ./configure writes a JSON compilation database, compile_commands.json,
+#     in the ARC root.  The flags are looked up in it, and ninja is only
+#     called for files which are not in it.
 #
 # Hacking notes:
 #
@@ -43,7 +41,9 @@
 #   * This has only been tested on gPrecise.
 
 
+import json
 import os
+import shlex
 import subprocess
 
 
@@ -68,6 +68,12 @@ def _get_arc_root():
       os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
 
 
+# The compilation database loaded by _load_compilation_database(), and the
+# modification time of the file when it was loaded.
+_compilation_database = None
+_compilation_database_mtime = None
+
+
 def _get_source_filename(filename):
   """Gets the corresponding source file for headers.
 
@@ -90,12 +96,71 @@ def _get_source_filename(filename):
   return filename
 
 
+def _load_compilation_database(arc_root):
+  """Loads compile_commands.json written by configure.
+
+  The database is loaded again only when the file is updated.
+
+  Args:
+    arc_root: (String) Path to the root of the ARC repository.
+
+  Returns:
+    (Dictionary) Maps a source path to its command line, or None if there
+      is no database.
+  """
+  global _compilation_database, _compilation_database_mtime
+  path = os.path.join(arc_root, 'compile_commands.json')
+  try:
+    mtime = os.path.getmtime(path)
+  except OSError:
+    return None
+  if mtime != _compilation_database_mtime:
+    with open(path) as f:
+      entries = json.load(f)
+    database = {}
+    for entry in entries:
+      # Keep the first command for a source built more than once.
+      database.setdefault(entry['file'], entry['command'])
+    _compilation_database = database
+    _compilation_database_mtime = mtime
+  return _compilation_database
+
+
+def _get_clang_command_compilation_database(arc_root, filename):
+  """Looks up the command line to build |filename| in the database.
+
+  For a header, the command of the companion source file is used if it is
+  built. Otherwise the command of a source file in the same directory is
+  used.
+
+  Args:
+    arc_root: (String) Path to the root of the ARC repository.
+    filename: (String) Path to source file being edited.
+
+  Returns:
+    (List of Strings) Command line arguments for clang.
+  """
+  database = _load_compilation_database(arc_root)
+  if not database:
+    return []
+  filename = os.path.abspath(filename)
+  command = database.get(_get_source_filename(filename))
+  if command is None and os.path.splitext(filename)[1] == '.h':
+    dirname = os.path.dirname(filename)
+    siblings = sorted(path for path in database
+                      if os.path.dirname(path) == dirname)
+    if siblings:
+      command = database[siblings[0]]
+  if command is None:
+    return []
+  return shlex.split(command)
+
+
 def _get_staging_relative_filename(arc_root, filename):
   if not (arc_root and filename.startswith(arc_root)):
     return filename
 
-  # For ARC, ninja and the compilation database it writes out both use file
-  # paths relative to the staging directory.
+  # For ARC, ninja uses file paths relative to the staging directory.
   rel_filename = filename[len(arc_root) + 1:]
 
   if rel_filename.startswith('mods/'):
@@ -108,35 +173,6 @@ def _get_staging_relative_filename(arc_root, filename):
   return os.path.join(arc_root, rel_filename)
 
 
-def _get_clang_command_compdb(arc_root, compilation_database_folder,
-                              filename):
-  """Query the compdb to get the compiler flags for |filename|.
-
-  This avoids calling ninja every time YCM needs to get the compiler
-  flags. The compilation database must be regenerated every time a file
-  is added, or ./configure is called. See here for more details:
-  http://clang.llvm.org/docs/JSONCompilationDatabase.html
-
-  Args:
-    compilation_database_folder: (String) The path of the JSON compilation
-      database: the ycm/ directory.
-    arc_root: (String) Path to the root of the ARC repository.
-    filename: (String) Path to source file being edited.
-
-  Returns:
-    (List of Strings) Command line arguments for clang.
-  """
-  import ycm_core
-  filename = _get_staging_relative_filename(arc_root, filename)
-  database = ycm_core.CompilationDatabase(compilation_database_folder)
-  compilation_info = database.GetCompilationInfoForFile(filename)
-
-  if not compilation_info:
-    return []
-
-  return compilation_info.compiler_flags_
-
-
 def _get_compiled_output_file_from_ninja(arc_root, filename):
   stdout = subprocess.check_output(
       ['ninja', '-v', '-C', arc_root, '-t', 'query', filename])
@@ -252,18 +288,12 @@ def FlagsForFile(filename):
       'do_cache': (Boolean) True if the result should be cached.
   """
   arc_root = _get_arc_root()
-  compilation_database_folder = os.path.join(arc_root, 'ycm')
-  filename = _get_source_filename(filename)
-  arc_flags = []
   # Try reading the compilation database first
-  if os.path.exists(compilation_database_folder):
-    arc_flags = _get_clang_command_compdb(arc_root,
-                                          compilation_database_folder,
-                                          filename)
+  arc_flags = _get_clang_command_compilation_database(arc_root, filename)
   # Fall back to getting it from ninja
   if not arc_flags:
     arc_flags = _get_clang_command_ninja(arc_root,
-                                         filename)
+                                         _get_source_filename(filename))
   final_flags = default_flags + _process_flags(arc_root, arc_flags)
   return {
       'flags': final_flags,
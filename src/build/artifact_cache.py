@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Caches the outputs of deterministic build steps by their inputs.
+
+The ninja rules for javac, dx, dexopt, aapt and llvm-rs-cc produce the same
+outputs for the same command line and the same inputs, but they run again
+after 'ninja -t clean', after switching branches, and on every bot.  With
+--artifact-cache-dir, configure wraps these rules with this script:
+
+  src/build/artifact_cache.py run --cache-dir DIR --max-size MB \\
+      --outputs $out --inputs $in $cache_inputs \\
+      --command-file $cache_command_file
+
+The command is written to the command file by ninja as the response file of
+the rule, so that the values of the ninja variables in it are passed as they
+are, without being quoted for the shell again.
+
+The key of the outputs is the hash of the command line and the contents of
+the inputs.  An input prefixed with @ is a response file listing inputs, and
+an input directory stands for all the files in it.  When the key is in the
+cache, the outputs are restored from the cache without running the command.
+Otherwise the command runs, and its outputs are stored in the cache when it
+succeeds.
+
+The cache is accessed through an ArtifactCacheBackend so that a cache shared
+between machines can be added.  LocalDirectoryBackend keeps the outputs in a
+local directory, and removes the least recently used ones when the directory
+grows larger than the limit.
+
+Usage:
+  # Remove the least recently used outputs now.
+  $ src/build/artifact_cache.py trim --cache-dir DIR --max-size MB
+"""
+
+import argparse
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Bump this to invalidate all the cached outputs, e.g. when the layout of the
+# cache or the computation of the key changes.
+_CACHE_VERSION = 1
+
+# The minimum interval in seconds between trimming the cache.
+_TRIM_INTERVAL = 300
+
+_READ_CHUNK_SIZE = 1024 * 1024
+
+
+def _remove_path(path):
+  if os.path.isdir(path) and not os.path.islink(path):
+    shutil.rmtree(path)
+  elif os.path.lexists(path):
+    os.unlink(path)
+
+
+def _makedirs(path):
+  try:
+    os.makedirs(path)
+  except OSError as e:
+    if e.errno != errno.EEXIST:
+      raise
+
+
+def _hash_file(path, digest):
+  with open(path, 'rb') as f:
+    while True:
+      chunk = f.read(_READ_CHUNK_SIZE)
+      if not chunk:
+        break
+      digest.update(chunk)
+
+
+def _hash_input(path, digest):
+  digest.update('\0%s\0' % path)
+  if os.path.isdir(path):
+    for dirpath, dirnames, filenames in os.walk(path):
+      dirnames.sort()
+      for name in sorted(filenames):
+        file_path = os.path.join(dirpath, name)
+        digest.update('\0%s\0' % os.path.relpath(file_path, path))
+        if os.path.exists(file_path):
+          _hash_file(file_path, digest)
+  elif os.path.exists(path):
+    _hash_file(path, digest)
+  else:
+    digest.update('\0missing\0')
+
+
+def _expand_inputs(inputs):
+  """Returns the sorted list of |inputs| with response files expanded."""
+  expanded = set()
+  for path in inputs:
+    if path.startswith('@'):
+      with open(path[1:]) as f:
+        expanded.update(f.read().split())
+    else:
+      expanded.add(path)
+  return sorted(expanded)
+
+
+def compute_key(command, inputs):
+  """Returns the key of the outputs of |command| run with |inputs|."""
+  digest = hashlib.sha1()
+  digest.update('%d\0%s\0' % (_CACHE_VERSION, command))
+  for path in _expand_inputs(inputs):
+    _hash_input(path, digest)
+  return digest.hexdigest()
+
+
+def _link_or_copy_file(source, dest):
+  try:
+    os.link(source, dest)
+  except OSError:
+    # E.g. the cache is on another file system.
+    shutil.copy2(source, dest)
+
+
+def _copy_tree(source, dest):
+  """Copies a directory.  Symbolic links are copied as links."""
+  shutil.copytree(source, dest, symlinks=True)
+
+
+class ArtifactCacheBackend(object):
+  """The interface of the storage of the cached outputs."""
+
+  def fetch(self, key, outputs):
+    """Restores |outputs| stored for |key|.
+
+    Returns True if all of them are restored, and False if |key| is not in
+    the cache.
+    """
+    raise NotImplementedError()
+
+  def store(self, key, outputs):
+    """Stores |outputs| for |key|."""
+    raise NotImplementedError()
+
+  def trim(self):
+    """Removes outputs to keep the size of the cache within its limit."""
+    raise NotImplementedError()
+
+
+class LocalDirectoryBackend(ArtifactCacheBackend):
+  """Keeps the outputs in a local directory.
+
+  The outputs for a key are stored in <cache_dir>/<key[:2]>/<key>/ by the
+  index of each output.  Files are restored as hard links when the cache is
+  on the same file system, as the cached rules replace their outputs rather
+  than updating them.  Directories are restored as copies, as other rules
+  may add files to them, e.g. the class files extracted from jars into the
+  directory javac writes to.  The mtime of the directory for a key records
+  when it was used last.
+  """
+
+  def __init__(self, cache_dir, max_size):
+    self._cache_dir = cache_dir
+    self._max_size = max_size
+
+  def _get_entry_path(self, key):
+    return os.path.join(self._cache_dir, key[:2], key)
+
+  def _get_tmp_dir(self):
+    return os.path.join(self._cache_dir, 'tmp')
+
+  def fetch(self, key, outputs):
+    entry_path = self._get_entry_path(key)
+    if not os.path.isdir(entry_path):
+      return False
+    try:
+      for index, output in enumerate(outputs):
+        source = os.path.join(entry_path, str(index))
+        _remove_path(output)
+        if os.path.dirname(output):
+          _makedirs(os.path.dirname(output))
+        if os.path.isdir(source):
+          _copy_tree(source, output)
+        else:
+          _link_or_copy_file(source, output)
+        # Restored outputs must look newer than the inputs to ninja.
+        os.utime(output, None)
+      os.utime(entry_path, None)
+    except (IOError, OSError, shutil.Error):
+      # The entry might be removed by trim() in another process.
+      for output in outputs:
+        _remove_path(output)
+      return False
+    return True
+
+  def store(self, key, outputs):
+    entry_path = self._get_entry_path(key)
+    if os.path.isdir(entry_path):
+      return
+    _makedirs(os.path.dirname(entry_path))
+    _makedirs(self._get_tmp_dir())
+    # The entry is created in a temporary directory and renamed, so that
+    # other processes never see an incomplete entry.
+    tmp_path = tempfile.mkdtemp(dir=self._get_tmp_dir())
+    try:
+      for index, output in enumerate(outputs):
+        dest = os.path.join(tmp_path, str(index))
+        if os.path.isdir(output):
+          _copy_tree(output, dest)
+        else:
+          _link_or_copy_file(output, dest)
+      try:
+        os.rename(tmp_path, entry_path)
+      except OSError:
+        # Another process stored the same outputs.
+        pass
+    finally:
+      if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    self._maybe_trim()
+
+  def _maybe_trim(self):
+    stamp_path = os.path.join(self._cache_dir, 'trim.stamp')
+    try:
+      if time.time() - os.path.getmtime(stamp_path) < _TRIM_INTERVAL:
+        return
+    except OSError:
+      pass
+    with open(stamp_path, 'a'):
+      os.utime(stamp_path, None)
+    self.trim()
+
+  def _get_entries(self):
+    """Returns the list of (last used time, size, path) of the entries."""
+    entries = []
+    for prefix in os.listdir(self._cache_dir):
+      prefix_path = os.path.join(self._cache_dir, prefix)
+      if len(prefix) != 2 or not os.path.isdir(prefix_path):
+        continue
+      for key in os.listdir(prefix_path):
+        entry_path = os.path.join(prefix_path, key)
+        try:
+          size = 0
+          for dirpath, _, filenames in os.walk(entry_path):
+            for name in filenames:
+              size += os.lstat(os.path.join(dirpath, name)).st_size
+          entries.append((os.path.getmtime(entry_path), size, entry_path))
+        except OSError:
+          # Removed by another process.
+          continue
+    return entries
+
+  def trim(self):
+    if not os.path.isdir(self._cache_dir):
+      return
+    with open(os.path.join(self._cache_dir, 'trim.lock'), 'w') as lock:
+      try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+      except IOError:
+        # Another process is trimming the cache.
+        return
+      _makedirs(self._get_tmp_dir())
+      entries = sorted(self._get_entries())
+      total_size = sum(size for _, size, _ in entries)
+      for _, size, entry_path in entries:
+        if total_size <= self._max_size:
+          break
+        # Move the entry out of the way first so that fetch() never sees a
+        # partially removed entry.
+        removed_path = tempfile.mkdtemp(dir=self._get_tmp_dir())
+        try:
+          os.rename(entry_path, os.path.join(removed_path, 'entry'))
+        except OSError:
+          pass
+        shutil.rmtree(removed_path, ignore_errors=True)
+        total_size -= size
+
+
+# The backends by the scheme of the location of the cache.  A location
+# without a scheme is a local directory.
+_BACKENDS = {
+    'file': LocalDirectoryBackend,
+}
+
+
+def get_backend(location, max_size):
+  """Returns the backend for the cache at |location|.
+
+  |max_size| is the maximum size of the cache in bytes.
+  """
+  scheme, separator, path = location.partition('://')
+  if not separator:
+    scheme, path = 'file', location
+  if scheme not in _BACKENDS:
+    raise Exception('Unknown artifact cache backend: ' + location)
+  return _BACKENDS[scheme](path, max_size)
+
+
+def _run_command(command):
+  status = subprocess.call(command, shell=True)
+  if status < 0:
+    # Killed by a signal.
+    return 128 - status
+  return status
+
+
+def run(backend, command, outputs, inputs):
+  """Runs |command| unless its outputs are in the cache.
+
+  Returns the exit status of |command|, or 0 if the outputs are restored.
+  Errors of the cache are reported, but do not fail the build.
+  """
+  try:
+    key = compute_key(command, inputs)
+    if backend.fetch(key, outputs):
+      return 0
+  except Exception as e:
+    print 'artifact_cache: Failed to look up %s: %s' % (outputs[0], e)
+    key = None
+
+  # Remove the outputs first, as they might be hard links to the cache, and
+  # the command might update them in place.
+  for output in outputs:
+    _remove_path(output)
+  status = _run_command(command)
+  if status == 0 and key:
+    try:
+      backend.store(key, outputs)
+    except Exception as e:
+      print 'artifact_cache: Failed to store %s: %s' % (outputs[0], e)
+  return status
+
+
+def _parse_args(args):
+  parser = argparse.ArgumentParser()
+  subparsers = parser.add_subparsers(dest='mode')
+
+  run_parser = subparsers.add_parser(
+      'run', help='Run a command unless its outputs are in the cache.')
+  trim_parser = subparsers.add_parser(
+      'trim', help='Remove the least recently used outputs.')
+  for subparser in (run_parser, trim_parser):
+    subparser.add_argument('--cache-dir', required=True,
+                           help='The location of the cache.')
+    subparser.add_argument('--max-size', type=int, required=True,
+                           metavar='MB', help='The maximum size of the cache.')
+  run_parser.add_argument('--outputs', nargs='+', required=True,
+                          help='The files and directories the command '
+                          'writes.')
+  run_parser.add_argument('--inputs', nargs='*', default=[],
+                          help='The files and directories the command '
+                          'reads.  @file reads the list of inputs from file.')
+  run_parser.add_argument('--command-file', required=True,
+                          help='The file containing the shell command to '
+                          'run.')
+  return parser.parse_args(args)
+
+
+def main():
+  args = _parse_args(sys.argv[1:])
+  backend = get_backend(args.cache_dir, args.max_size * 1024 * 1024)
+  if args.mode == 'trim':
+    backend.trim()
+    return 0
+  with open(args.command_file) as f:
+    command = f.read()
+  return run(backend, command, args.outputs, args.inputs)
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tests for artifact_cache."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import artifact_cache
+
+
+class ArtifactCacheTest(unittest.TestCase):
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._original_cwd = os.getcwd()
+    os.chdir(self._temp_dir)
+    self._backend = artifact_cache.get_backend('cache', 1024 * 1024)
+    self._write('in.txt', 'input')
+
+  def tearDown(self):
+    os.chdir(self._original_cwd)
+    shutil.rmtree(self._temp_dir)
+
+  def _write(self, path, content):
+    with open(path, 'w') as f:
+      f.write(content)
+
+  def _read(self, path):
+    with open(path) as f:
+      return f.read()
+
+  def _run(self, command, outputs, inputs):
+    # Count the runs of the command.
+    command = 'echo >> runs && ' + command
+    status = artifact_cache.run(self._backend, command, outputs, inputs)
+    return status, self._read('runs').count('\n')
+
+  def test_compute_key(self):
+    key = artifact_cache.compute_key('cat in.txt', ['in.txt'])
+    self.assertEquals(key, artifact_cache.compute_key('cat in.txt',
+                                                      ['in.txt', 'in.txt']))
+    self.assertNotEquals(key, artifact_cache.compute_key('cat  in.txt',
+                                                         ['in.txt']))
+    self._write('in.txt', 'modified')
+    self.assertNotEquals(key, artifact_cache.compute_key('cat in.txt',
+                                                         ['in.txt']))
+
+  def test_response_file_and_directory_inputs(self):
+    os.mkdir('dir')
+    self._write('dir/a', 'a')
+    self._write('inputs.rsp', 'in.txt\ndir\n')
+    key = artifact_cache.compute_key('true', ['@inputs.rsp'])
+    self.assertEquals(key, artifact_cache.compute_key('true',
+                                                      ['in.txt', 'dir']))
+    self._write('dir/b', 'b')
+    self.assertNotEquals(key, artifact_cache.compute_key('true',
+                                                         ['@inputs.rsp']))
+
+  def test_run(self):
+    command = 'cp in.txt out.txt'
+    self.assertEquals((0, 1), self._run(command, ['out.txt'], ['in.txt']))
+    os.unlink('out.txt')
+    # The output is restored without running the command.
+    self.assertEquals((0, 1), self._run(command, ['out.txt'], ['in.txt']))
+    self.assertEquals('input', self._read('out.txt'))
+
+    self._write('in.txt', 'modified')
+    self.assertEquals((0, 2), self._run(command, ['out.txt'], ['in.txt']))
+    self.assertEquals('modified', self._read('out.txt'))
+    # The output restored as a hard link is replaced, not updated.
+    self._write('in.txt', 'input')
+    self.assertEquals((0, 2), self._run(command, ['out.txt'], ['in.txt']))
+    self.assertEquals('input', self._read('out.txt'))
+    self._write('in.txt', 'modified')
+    self.assertEquals((0, 2), self._run(command, ['out.txt'], ['in.txt']))
+    self.assertEquals('modified', self._read('out.txt'))
+
+  def test_run_directory_output(self):
+    command = 'mkdir -p out && cp in.txt out/a.txt && touch out.stamp'
+    outputs = ['out.stamp', 'out']
+    self.assertEquals((0, 1), self._run(command, outputs, ['in.txt']))
+    shutil.rmtree('out')
+    self.assertEquals((0, 1), self._run(command, outputs, ['in.txt']))
+    self.assertEquals('input', self._read('out/a.txt'))
+
+  def test_run_failure(self):
+    command = 'touch out.txt && false'
+    self.assertEquals((1, 1), self._run(command, ['out.txt'], ['in.txt']))
+    # Outputs of failed commands are not stored.
+    self.assertEquals((1, 2), self._run(command, ['out.txt'], ['in.txt']))
+
+  def test_main_command_file(self):
+    # The command is run as written in the command file, quotes included.
+    self._write('command.txt', 'echo "it\'s $(cat in.txt)" > out.txt')
+    original_argv = sys.argv
+    sys.argv = ['artifact_cache.py', 'run', '--cache-dir', 'cache',
+                '--max-size', '1', '--outputs', 'out.txt',
+                '--inputs', 'in.txt', '--command-file', 'command.txt']
+    try:
+      self.assertEquals(0, artifact_cache.main())
+      self.assertEquals("it's input\n", self._read('out.txt'))
+      os.unlink('out.txt')
+      self._write('command.txt', 'false')
+      self.assertEquals(1, artifact_cache.main())
+    finally:
+      sys.argv = original_argv
+
+  def test_trim(self):
+    self._write('a', 'a' * 600)
+    self._write('b', 'b' * 600)
+    backend = artifact_cache.get_backend('file://cache', 1000)
+    backend.store('aaaa', ['a'])
+    os.utime(os.path.join('cache', 'aa', 'aaaa'), (0, 0))
+    backend.store('bbbb', ['b'])
+    backend.trim()
+    os.unlink('a')
+    os.unlink('b')
+    self.assertFalse(backend.fetch('aaaa', ['a']))
+    self.assertTrue(backend.fetch('bbbb', ['b']))
+    self.assertEquals('b' * 600, self._read('b'))
+
+  def test_unknown_backend(self):
+    with self.assertRaises(Exception):
+      artifact_cache.get_backend('unknown://cache', 1000)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -21,8 +21,11 @@ import tempfile
 import time
 import urllib2
 
+import dependency_inspection
 from build_options import OPTIONS
+from util import filesystem_snapshot
 from util import launch_chrome_util
+from util import ninja_jobs
 from util import platform_util
 
 OUT_DIR = 'out'
@@ -518,6 +521,10 @@ def get_java_revision_file():
   return os.path.join(OUT_DIR, 'STAMP.jre')
 
 
+def get_filesystem_snapshot_file():
+  return os.path.join(OUT_DIR, 'filesystem_snapshot.pickle')
+
+
 def get_generated_ninja_dir():
   return os.path.join(OUT_DIR, 'generated_ninja')
 
@@ -528,10 +535,22 @@ def get_test_output_handler(use_crash_analyzer=False):
   if use_crash_analyzer:
     # Note that crash_analyzer outputs nothing if it cannot find a
     # crash message.
-    analyzer = ' python src/build/crash_analyzer.py $out.tmp;'
+    analyzer = ' python %s $out.tmp;' % get_build_helper_command(
+        'src/build/crash_analyzer.py')
   return _TEST_OUTPUT_HANDLER % analyzer
 
 
+def get_build_helper_command(script):
+  """Returns the command to run the Python |script| in a build rule.
+
+  With --enable-build-helper, the script runs in the build helper server if
+  it is running. See build_helper.py.
+  """
+  if OPTIONS.enable_build_helper():
+    return 'src/build/build_helper.py run ' + script
+  return script
+
+
 def get_tools_dir():
   return os.path.join(OUT_DIR, 'tools')
 
@@ -635,7 +654,7 @@ def _generate_all_files(base_paths, matcher, use_staging, relative,
     base = base_path
     if use_staging:
       base_path = os.path.join(get_staging_root(), base_path)
-    for root, dirs, files in os.walk(base_path, followlinks=True):
+    for root, dirs, files in filesystem_snapshot.walk(base_path):
       if not include_subdirectories:
         dirs[:] = []
       if use_staging:
@@ -668,18 +687,18 @@ def find_all_files(base_paths, suffixes=None, include_tests=False,
   """
 
   # For debugging/diffing purposes, sort the file list.
-  return sorted(_generate_all_files(
+  result = sorted(_generate_all_files(
       base_paths,
       matcher=_build_matcher(exclude, include_tests, suffixes, filenames),
       use_staging=use_staging, relative=relative,
       include_subdirectories=include_subdirectories))
-
-
-def _get_ninja_jobs_argument():
-  # -j200 might be good because having more tasks doesn't help a
-  # lot and Z620 doesn't die even if everything runs locally for
-  # some reason.
-  return ['-j200', '-l40'] if OPTIONS.set_up_goma() else []
+  dependency_inspection.add_file_listing(
+      dict(base_paths=base_paths, suffixes=suffixes,
+           include_tests=include_tests, use_staging=use_staging,
+           exclude=exclude, relative=relative, filenames=filenames,
+           include_subdirectories=include_subdirectories),
+      result)
+  return result
 
 
 class RunNinjaException(Exception):
@@ -689,11 +708,9 @@ class RunNinjaException(Exception):
 
 
 def run_ninja(args=None, cwd=None):
-  cmd = ['ninja'] + _get_ninja_jobs_argument()
-  if args:
-    cmd = cmd + args
-
-  res = subprocess.call(cmd, cwd=cwd)
+  # The -j and -l values are chosen and adjusted for this machine.
+  controller = ninja_jobs.NinjaJobController(OPTIONS.set_up_goma())
+  res, cmd = controller.run(args or [], cwd=cwd)
   if res != 0:
     raise RunNinjaException('Ninja error %d' % res, ' '.join(cmd))
 
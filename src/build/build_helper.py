@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Runs the Python helper scripts of build rules in a persistent server.
+
+Many ninja rules run a Python script for each edge, such as symbol_tool.py
+and make_table_of_contents.py.  Each of them starts a new interpreter,
+imports build_options and toolchain, and parses out/configure.options.  With
+--enable-build-helper, the rules run the scripts through this client instead:
+
+  src/build/build_helper.py run src/build/symbol_tool.py --clean in > out
+
+The client sends the request to the server over a Unix socket.  The server
+runs the script in a process forked from it, where the modules are already
+imported and the options are already parsed, and sends the output and the
+exit status of the script back to the client.  When the server is not
+running, the client runs the script directly.
+
+Usage:
+  # Start the server in the background.
+  $ src/build/build_helper.py start
+  # Stop the server.
+  $ src/build/build_helper.py stop
+  # Run the server in the foreground for debugging.
+  $ src/build/build_helper.py serve
+
+The server exits by itself when a module it imported is modified, so that the
+scripts never run with stale code.
+"""
+
+import json
+import os
+import socket
+import struct
+import sys
+
+_BUILD_DIR = os.path.dirname(os.path.realpath(__file__))
+_ARC_ROOT = os.path.dirname(os.path.dirname(_BUILD_DIR))
+
+# The scripts run by the server.  Other scripts are run directly.
+_HELPER_MODULES = ['crash_analyzer', 'filter_dexopt_warnings',
+                   'filter_java_warnings', 'make_table_of_contents',
+                   'naclize_i686', 'symbol_tool']
+
+# Each message from the server has a header of the stream and the length.
+_HEADER_FORMAT = '>BI'
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+_STREAM_EXIT = 0
+_STREAM_STDOUT = 1
+_STREAM_STDERR = 2
+
+# The seconds to wait for the server to start.
+_START_TIMEOUT = 10
+# The seconds to wait for a client to send its request.
+_REQUEST_TIMEOUT = 10
+
+
+def _get_socket_path():
+  return os.path.join(_ARC_ROOT, 'out', 'build_helper.sock')
+
+
+def _connect():
+  """Connects to the server, or returns None if it is not running."""
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    # The relative path is used as the length of the path of a Unix socket
+    # is limited.
+    sock.connect(os.path.relpath(_get_socket_path()))
+  except socket.error:
+    sock.close()
+    return None
+  return sock
+
+
+def _receive_exactly(sock, size):
+  chunks = []
+  while size:
+    chunk = sock.recv(size)
+    if not chunk:
+      return None
+    chunks.append(chunk)
+    size -= len(chunk)
+  return ''.join(chunks)
+
+
+def _send_message(sock, stream, data):
+  sock.sendall(struct.pack(_HEADER_FORMAT, stream, len(data)) + data)
+
+
+def _request(argv, stdout, stderr):
+  """Runs |argv| in the server, and returns the exit status.
+
+  The output of the script is written to |stdout| and |stderr|.  None is
+  returned when the server is not running, or when it closed the connection
+  without running the script, e.g. because it exited for modified modules.
+  """
+  sock = _connect()
+  if not sock:
+    return None
+  try:
+    sock.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd(),
+                             'env': dict(os.environ)}))
+    sock.shutdown(socket.SHUT_WR)
+    received = False
+    while True:
+      header = _receive_exactly(sock, _HEADER_SIZE)
+      if header is None:
+        if not received:
+          return None
+        stderr.write('build_helper: The server exited while running %s\n' %
+                     argv[0])
+        return 1
+      received = True
+      stream, size = struct.unpack(_HEADER_FORMAT, header)
+      data = _receive_exactly(sock, size) if size else ''
+      if data is None:
+        continue
+      if stream == _STREAM_EXIT:
+        return int(data)
+      output = stdout if stream == _STREAM_STDOUT else stderr
+      output.write(data)
+      output.flush()
+  except socket.error:
+    if received:
+      stderr.write('build_helper: Lost the server while running %s\n' %
+                   argv[0])
+      return 1
+    return None
+  finally:
+    sock.close()
+
+
+def _run(argv):
+  script = argv[0]
+  if os.path.splitext(os.path.basename(script))[0] in _HELPER_MODULES:
+    status = _request(argv, sys.stdout, sys.stderr)
+    if status is not None:
+      return status
+  # Run the script directly.
+  os.execv(sys.executable, [sys.executable] + argv)
+
+
+def _get_module_mtimes():
+  """Returns the mtimes of the modules in the ARC tree imported so far."""
+  mtimes = {}
+  for module in sys.modules.values():
+    path = getattr(module, '__file__', None)
+    if not path or not os.path.abspath(path).startswith(_ARC_ROOT + os.sep):
+      continue
+    if path.endswith('.pyc'):
+      path = path[:-1]
+    try:
+      mtimes[path] = os.path.getmtime(path)
+    except OSError:
+      mtimes[path] = None
+  return mtimes
+
+
+def _run_script(module_name):
+  """Runs the module as a script in this process, and returns the status."""
+  import runpy
+  import traceback
+  try:
+    runpy.run_module(module_name, run_name='__main__')
+  except SystemExit as e:
+    if e.code is None:
+      return 0
+    if isinstance(e.code, int):
+      return e.code
+    sys.stderr.write('%s\n' % e.code)
+    return 1
+  except Exception:
+    traceback.print_exc()
+    return 1
+  return 0
+
+
+def _receive_request(sock):
+  sock.settimeout(_REQUEST_TIMEOUT)
+  chunks = []
+  while True:
+    chunk = sock.recv(65536)
+    if not chunk:
+      break
+    chunks.append(chunk)
+  sock.settimeout(None)
+  return json.loads(''.join(chunks))
+
+
+def _handle_request(sock, request):
+  """Runs the script of |request|, and sends its output back to |sock|."""
+  import select
+
+  argv = [str(arg) for arg in request['argv']]
+  stdout_read, stdout_write = os.pipe()
+  stderr_read, stderr_write = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    status = 1
+    try:
+      sock.close()
+      os.close(stdout_read)
+      os.close(stderr_read)
+      devnull = os.open(os.devnull, os.O_RDONLY)
+      os.dup2(devnull, 0)
+      os.dup2(stdout_write, 1)
+      os.dup2(stderr_write, 2)
+      os.chdir(request['cwd'])
+      os.environ.clear()
+      os.environ.update(
+          (str(key), str(value)) for key, value in request['env'].iteritems())
+      sys.argv = argv
+      status = _run_script(os.path.splitext(os.path.basename(argv[0]))[0])
+    finally:
+      sys.stdout.flush()
+      sys.stderr.flush()
+      os._exit(status)
+
+  os.close(stdout_write)
+  os.close(stderr_write)
+  streams = {stdout_read: _STREAM_STDOUT, stderr_read: _STREAM_STDERR}
+  while streams:
+    readable, _, _ = select.select(streams.keys(), [], [])
+    for fd in readable:
+      data = os.read(fd, 65536)
+      if data:
+        _send_message(sock, streams[fd], data)
+      else:
+        os.close(fd)
+        del streams[fd]
+  _, status = os.waitpid(pid, 0)
+  if os.WIFSIGNALED(status):
+    status = 128 + os.WTERMSIG(status)
+  else:
+    status = os.WEXITSTATUS(status)
+  _send_message(sock, _STREAM_EXIT, str(status))
+
+
+def _serve():
+  """Serves the requests until it is stopped or a module is modified."""
+  import signal
+
+  os.chdir(_ARC_ROOT)
+  sys.path.insert(0, _BUILD_DIR)
+  # Import the scripts and the modules they use before serving.
+  for module_name in _HELPER_MODULES:
+    __import__(module_name)
+  import toolchain
+  from build_options import OPTIONS
+
+  socket_path = _get_socket_path()
+  server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  # Only the user running the server can connect to it.
+  umask = os.umask(077)
+  try:
+    server.bind(os.path.relpath(socket_path))
+  finally:
+    os.umask(umask)
+  server.listen(128)
+  # The request handlers are reaped automatically.
+  signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+  module_mtimes = _get_module_mtimes()
+  try:
+    while True:
+      conn, _ = server.accept()
+      try:
+        request = _receive_request(conn)
+      except (socket.error, ValueError):
+        conn.close()
+        continue
+      if request.get('command') == 'stop':
+        conn.close()
+        break
+      module_name = os.path.splitext(os.path.basename(request['argv'][0]))[0]
+      if module_name not in _HELPER_MODULES:
+        # Closing the connection makes the client run the script directly.
+        conn.close()
+        continue
+      if _get_module_mtimes() != module_mtimes:
+        print 'Exiting as modules are modified.'
+        conn.close()
+        break
+      # The options are parsed again only when configure updates them, and
+      # the handlers inherit them.
+      OPTIONS.parse_configure_file()
+      toolchain.get_tool(OPTIONS.target(), 'addr2line')
+      sys.stdout.flush()
+      if os.fork() == 0:
+        try:
+          server.close()
+          signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+          _handle_request(conn, request)
+        finally:
+          os._exit(0)
+      conn.close()
+  finally:
+    server.close()
+    if os.path.exists(socket_path):
+      os.unlink(socket_path)
+  return 0
+
+
+def _start():
+  sock = _connect()
+  if sock:
+    sock.close()
+    print 'The build helper server is already running.'
+    return 0
+  socket_path = _get_socket_path()
+  if os.path.exists(socket_path):
+    # Left by a server which did not exit normally.
+    os.unlink(socket_path)
+  if not os.path.isdir(os.path.dirname(socket_path)):
+    os.makedirs(os.path.dirname(socket_path))
+  if os.fork() == 0:
+    os.setsid()
+    log = os.open(os.path.join(os.path.dirname(socket_path),
+                               'build_helper.log'),
+                  os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0644)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(log, 1)
+    os.dup2(log, 2)
+    status = 1
+    try:
+      status = _serve()
+    finally:
+      sys.stdout.flush()
+      os._exit(status)
+
+  import time
+  deadline = time.time() + _START_TIMEOUT
+  while time.time() < deadline:
+    sock = _connect()
+    if sock:
+      sock.close()
+      print 'Started the build helper server.'
+      return 0
+    time.sleep(0.1)
+  print 'Failed to start the build helper server. See out/build_helper.log.'
+  return 1
+
+
+def _stop():
+  sock = _connect()
+  if not sock:
+    print 'The build helper server is not running.'
+    return 0
+  try:
+    sock.sendall(json.dumps({'command': 'stop'}))
+    sock.shutdown(socket.SHUT_WR)
+    # Wait until the server closes the connection.
+    sock.recv(1)
+  finally:
+    sock.close()
+  print 'Stopped the build helper server.'
+  return 0
+
+
+def main():
+  if len(sys.argv) >= 3 and sys.argv[1] == 'run':
+    return _run(sys.argv[2:])
+  if len(sys.argv) == 2 and sys.argv[1] == 'start':
+    return _start()
+  if len(sys.argv) == 2 and sys.argv[1] == 'stop':
+    return _stop()
+  if len(sys.argv) == 2 and sys.argv[1] == 'serve':
+    return _serve()
+  sys.stderr.write('Usage: %s run <script> [args...] | start | stop | serve\n'
+                   % sys.argv[0])
+  return 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tests for build_helper."""
+
+import os
+import shutil
+import StringIO
+import tempfile
+import time
+import unittest
+
+import build_helper
+
+
+class BuildHelperTest(unittest.TestCase):
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._original_get_socket_path = build_helper._get_socket_path
+    build_helper._get_socket_path = (
+        lambda: os.path.join(self._temp_dir, 'build_helper.sock'))
+    self._server_pid = None
+
+  def tearDown(self):
+    if self._server_pid:
+      build_helper._stop()
+      os.waitpid(self._server_pid, 0)
+    build_helper._get_socket_path = self._original_get_socket_path
+    shutil.rmtree(self._temp_dir)
+
+  def _start_server(self):
+    self._server_pid = os.fork()
+    if self._server_pid == 0:
+      status = 1
+      try:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        status = build_helper._serve()
+      finally:
+        os._exit(status)
+    for _ in xrange(100):
+      sock = build_helper._connect()
+      if sock:
+        sock.close()
+        return
+      time.sleep(0.1)
+    self.fail('The server did not start.')
+
+  def _request(self, argv):
+    stdout = StringIO.StringIO()
+    stderr = StringIO.StringIO()
+    status = build_helper._request(argv, stdout, stderr)
+    return status, stdout.getvalue(), stderr.getvalue()
+
+  def test_no_server(self):
+    self.assertEquals((None, '', ''),
+                      self._request(['src/build/naclize_i686.py', 'a.S']))
+
+  def test_run_script(self):
+    self._start_server()
+    source = os.path.join(self._temp_dir, 'test.S')
+    with open(source, 'w') as f:
+      f.write('  ret\n.p2align 4;\n')
+    status, stdout, stderr = self._request(
+        ['src/build/naclize_i686.py', source])
+    self.assertEquals(0, status)
+    self.assertEquals(
+        '// Generated by src/build/naclize_i686.py from\n'
+        '// %s. Do not edit.\n'
+        '  naclret\n'
+        '.p2align 5;\n' % source, stdout)
+    self.assertEquals('', stderr)
+
+    # The exit status is sent back.
+    status, stdout, stderr = self._request(['src/build/naclize_i686.py'])
+    self.assertEquals(1, status)
+    self.assertEquals('Usage: naclize_i686.py <file_name>\n', stdout)
+
+  def test_unknown_script(self):
+    self._start_server()
+    # The client runs the script directly.
+    self.assertEquals((None, '', ''),
+                      self._request(['src/build/configure.py']))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -73,6 +73,7 @@ _MAKE_TO_NINJA_LOGGING = 'make-to-ninja'
 _MEMORY_USAGE = 'memory-usage'
 _NOTICES_LOGGING = 'notices'
 _POSIX_TRANSLATION_DEBUG = 'posix-translation-debug'
+_TARGET_GROUPS_LOGGING = 'target-groups'
 _VERBOSE_MEMORY_VIEWER = 'verbose-memory-viewer'
 _ALLOWED_LOGGING = [_ANSI_FB_LOGGING,
                     _ANSI_SF_LAYER_LOGGING,
@@ -92,8 +93,12 @@ _ALLOWED_LOGGING = [_ANSI_FB_LOGGING,
                     _MEMORY_USAGE,
                     _NOTICES_LOGGING,
                     _POSIX_TRANSLATION_DEBUG,
+                    _TARGET_GROUPS_LOGGING,
                     _VERBOSE_MEMORY_VIEWER]
 
+# The ninja pools of memory-heavy build steps.
+_ALLOWED_NINJA_POOLS = ['aapt', 'dexopt', 'javac', 'link']
+
 # -W options
 _ALLOWED_WARNING_LEVEL = ['all',
                           'yes',  # all except -Wunused-*.
@@ -106,6 +111,7 @@ class _Options(object):
     self._loggers = {}
     self._goma_ctl_process = None
     self._goma_dir = None
+    self._ninja_pool_depths = {}
     self._system_packages = []
     self._values = {}
     self.parse([])
@@ -121,6 +127,10 @@ class _Options(object):
       return lambda: self._values[name]
     raise AttributeError("'_Options' object has no attribute '" + name + "'")
 
+  def get_all_values(self):
+    """Returns a dict from option names to the values."""
+    return dict(self._values)
+
   def get_target_bitsize(self):
     return 64 if self.target().endswith('_x86_64') else 32
 
@@ -220,6 +230,9 @@ class _Options(object):
   def is_posix_translation_debug(self):
     return _POSIX_TRANSLATION_DEBUG in self._loggers
 
+  def is_target_groups_logging(self):
+    return _TARGET_GROUPS_LOGGING in self._loggers
+
   def is_hw_renderer(self):
     return self.renderer() == _RENDERER_HW
 
@@ -238,6 +251,11 @@ class _Options(object):
   def get_system_packages(self):
     return self._system_packages
 
+  def get_ninja_pool_depths(self):
+    """Returns a dict from the ninja pools to the depths set by --ninja-pools.
+    """
+    return self._ninja_pool_depths
+
   @staticmethod
   def _is_nacl_target(target):
     return target.startswith('nacl_')
@@ -298,11 +316,22 @@ class _Options(object):
     return args
 
   def parse(self, args):
+    self._configure_file_content = None
     parser = argparse.ArgumentParser(
         usage=os.path.basename(sys.argv[0]) + ' <options>',
         epilog=_Options._help_epilog(),
         formatter_class=argparse.RawTextHelpFormatter)
 
+    parser.add_argument('--artifact-cache-dir', metavar='DIR', help='Restore '
+                        'the outputs of javac, dx, dexopt, aapt, and '
+                        'llvm-rs-cc from the cache in DIR when their inputs '
+                        'are unchanged.  See src/build/artifact_cache.py.')
+
+    parser.add_argument('--artifact-cache-size', default=10240, type=int,
+                        metavar='MB', help='The maximum size of the artifact '
+                        'cache.  The least recently used outputs are removed '
+                        'when it grows larger.')
+
     parser.add_argument('--cc-wrapper', metavar='[cc-wrapper]', help='Compiler '
                         'wrapper used by goma')
 
@@ -342,6 +371,16 @@ class _Options(object):
     parser.add_argument('--enable-binder', action='store_true', help='Enable '
                         'Binder calls for all services.')
 
+    parser.add_argument('--enable-build-helper', action='store_true',
+                        help='Run the Python helper scripts of build rules '
+                        'in the server started by src/build/build_helper.py '
+                        'start, when it is running.')
+
+    parser.add_argument('--enable-jumbo-build', action='store_true',
+                        help='Compile the C/C++ sources of the libraries '
+                        'which support it in jumbo source files, each of '
+                        'which includes many sources in a directory.')
+
     # TODO(crbug.com/411271): Remove this option once PNaCl clang has
     # become ready.
     parser.add_argument('--enable-pnacl-clang', action='store_true',
@@ -375,6 +414,13 @@ class _Options(object):
     parser.add_argument('--logging', metavar=str(_ALLOWED_LOGGING), help='A '
                         'comma-separated list of logging to enable on build.')
 
+    parser.add_argument('--ninja-pools', metavar='POOL=DEPTH,...', help='The '
+                        'number of memory-heavy build steps ninja runs at '
+                        'once, e.g. link=2,javac=1.  The pools are ' +
+                        ', '.join(_ALLOWED_NINJA_POOLS) + '.  The depths '
+                        'not set are computed from the RAM and the number '
+                        'of CPUs.')
+
     parser.add_argument('--notest', action='store_false', dest='run_tests',
                         help='Disable automatic running of unit tests during '
                         'build.')
@@ -385,12 +431,21 @@ class _Options(object):
     parser.add_argument('--opt', '-O', action='store_true', help='Enable '
                         'optimizations.')
 
+    parser.add_argument('--incremental-configure', action='store_true',
+                        help='Reuse the results of generate_ninjas functions '
+                        'whose inputs are unchanged since the previous '
+                        'configure.')
+
     parser.add_argument('--internal-apks-source',
                         choices=_ALLOWED_INTERNAL_APKS_SOURCES,
                         default=_DEFAULT_INTERNAL_APKS_SOURCES,
                         help='Source of play-services and '
                         'GoogleContactsSyncAdapter APKs.')
 
+    parser.add_argument('--profile-configure', metavar='FILE', help='Write '
+                        'a timeline of configure to FILE in the Chrome trace '
+                        'event format, viewable in chrome://tracing.')
+
     parser.add_argument('--regen-build-prop', action='store_true', help=
                         'Forces regeneration of the build.prop file which '
                         'contains git HEAD information for release purposes.  '
@@ -451,6 +506,17 @@ class _Options(object):
     if args.system_packages:
       self._system_packages = args.system_packages.split(',')
 
+    self._ninja_pool_depths = {}
+    if args.ninja_pools:
+      for pool in args.ninja_pools.split(','):
+        name, _, depth = pool.partition('=')
+        if (name not in _ALLOWED_NINJA_POOLS or not depth.isdigit() or
+            int(depth) < 1):
+          print 'Invalid ninja pool:', pool
+          parser.print_help()
+          return -1
+        self._ninja_pool_depths[name] = int(depth)
+
     # ARM Chrome OS does not have a lot of storage and it takes a lot
     # of time to transfer binaries. Note that you still have debug
     # symbols in out/target/<target>/lib.
@@ -598,7 +664,12 @@ class _Options(object):
     options_file = input_file or self.get_configure_options_file()
     if os.path.exists(options_file):
       with open(options_file) as f:
-        self.parse(f.read().split())
+        content = f.read()
+      # The build helper server (see build_helper.py) runs many scripts with
+      # the options it parsed, so they are not parsed again when unchanged.
+      if content != self._configure_file_content:
+        self.parse(content.split())
+        self._configure_file_content = content
     elif input_file:
       raise IOError('File ' + input_file + ' does not exist.')
 
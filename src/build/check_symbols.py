@@ -8,11 +8,9 @@
 
 import logging
 import os
-import subprocess
 import sys
 
-import toolchain
-from build_options import OPTIONS
+from util import elf_symbols
 
 
 # Be careful when you add a symbol to this list. You must not add
@@ -47,21 +45,12 @@ _WHITELISTS = {
 
 
 def get_defined_symbols(filename):
-  output = subprocess.check_output([toolchain.get_tool(OPTIONS.target(), 'nm'),
-                                    '--defined-only', '-D', filename])
-  syms = set()
-  for line in output.splitlines():
-    toks = line.split()
-    # Empty lines or a filename line.
-    if len(toks) <= 1:
-      continue
-    addr, sym_type, name = line.split()
-    syms.add(name)
-  return syms
+  return set(symbol.name
+             for symbol in elf_symbols.get_symbols(filename, dynamic=True)
+             if symbol.is_defined)
 
 
 def main():
-  OPTIONS.parse_configure_file()
   logging.getLogger().setLevel(logging.INFO)
 
   if len(sys.argv) != 3:
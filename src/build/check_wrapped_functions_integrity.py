@@ -6,25 +6,16 @@
 #
 # Check consistency between --wrap for the linker and defined symbols.
 
-import re
-import subprocess
 import sys
 
-import toolchain
 import wrapped_functions
-from build_options import OPTIONS
+from util import elf_symbols
 
 
 def _get_defined_functions(library):
-  nm = toolchain.get_tool(OPTIONS.target(), 'nm')
-  nm_output = subprocess.check_output([nm, '-D', '--defined-only', library])
-
-  functions = []
-  for line in nm_output.splitlines():
-    matched = re.search(r' [TW] (\w+)', line)
-    if matched:
-      functions.append(matched.group(1))
-  return functions
+  return sorted(symbol.name
+                for symbol in elf_symbols.get_symbols(library, dynamic=True)
+                if symbol.nm_type in ('T', 'W'))
 
 
 def _check_wrapper_functions_are_defined(functions, arc_nexe):
@@ -85,8 +76,6 @@ def _check_wrapped_functions_are_defined(functions, libc_libraries):
 
 
 def main():
-  OPTIONS.parse_configure_file()
-
   if len(sys.argv) < 3:
     print 'Usage: %s arc.nexe libc.so...'
     return 1
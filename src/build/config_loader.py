@@ -2,39 +2,179 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
-"""Finds and loads config.py files scattered through the source code tree."""
+"""Finds and loads config.py files scattered through the source code tree.
 
+The config.py files are not imported until they are needed.  An index of the
+top-level names each file defines is built by parsing the source, and is
+cached on disk keyed by the modification time and the size of each file.
+find_name() and find_config_modules() import only the files which may define
+the requested name.
+"""
+
+import ast
+import cPickle
 import imp
 import os
 import os.path
 import sys
 
+import build_common
+import dependency_inspection
 from build_common import get_arc_root
 
+# Bump this when the format of the index file changes.
+_INDEX_VERSION = 1
+
+# Sorted list of (path, module name) of all config files found.
+_config_files = []
+
+# The index of the names defined by each config file, keyed by the path.
+# See _compute_defined_names() for the values.
+_index = {}
 
-# List of all modules loaded by this module.
-_config_modules = []
+# All modules loaded by this module, keyed by the path of the config file.
+_loaded_modules = {}
+
+# Module names of the config files, keyed by the module name, and parent
+# module names, which do not have their own config file.
+_module_name_to_path = {}
+_parent_module_names = set()
 
 
 def find_name(attribute_name):
-  """Iterates over all loaded config modules and does a name lookup on them."""
-  for module in _config_modules:
-    if hasattr(module, attribute_name):
-      yield getattr(module, attribute_name)
+  """Iterates over all config modules and does a name lookup on them."""
+  for module in find_config_modules(attribute_name):
+    yield getattr(module, attribute_name)
 
 
 def find_config_modules(attribute_name):
-  """Finds the loaded config modules that have the specified attribute name."""
-  for module in _config_modules:
+  """Finds the config modules that have the specified attribute name."""
+  for path, module_name in _config_files:
+    if not _may_define(path, attribute_name):
+      continue
+    module = _load_module(path, module_name)
     if hasattr(module, attribute_name):
       yield module
 
 
-def _all_config_files(base_paths):
+def _may_define(path, attribute_name):
+  names = _index[path][2]
+  # Dunder names such as __file__ are defined by the import machinery.
+  return (names is None or attribute_name in names or
+          attribute_name.startswith('__'))
+
+
+def _add_target_names(target, names):
+  if isinstance(target, ast.Name):
+    names.add(target.id)
+  elif isinstance(target, (ast.Tuple, ast.List)):
+    for element in target.elts:
+      _add_target_names(element, names)
+
+
+def _add_defined_names(statements, names):
+  """Adds the names which |statements| may define to |names|.
+
+  Returns False if the names cannot be determined statically.
+  """
+  for statement in statements:
+    if isinstance(statement, (ast.FunctionDef, ast.ClassDef)):
+      names.add(statement.name)
+    elif isinstance(statement, ast.Assign):
+      for target in statement.targets:
+        _add_target_names(target, names)
+    elif isinstance(statement, (ast.AugAssign, ast.For)):
+      _add_target_names(statement.target, names)
+    elif isinstance(statement, (ast.Import, ast.ImportFrom)):
+      for alias in statement.names:
+        if alias.name == '*':
+          return False
+        names.add(alias.asname or alias.name.split('.')[0])
+    elif isinstance(statement, (ast.Exec, ast.Global)):
+      return False
+    elif isinstance(statement, ast.With) and statement.optional_vars:
+      _add_target_names(statement.optional_vars, names)
+
+    # Names defined in compound statements, such as in "if" or "try" blocks.
+    for field in ['body', 'orelse', 'finalbody']:
+      if (not isinstance(statement, (ast.FunctionDef, ast.ClassDef)) and
+          not _add_defined_names(getattr(statement, field, []), names)):
+        return False
+    for handler in getattr(statement, 'handlers', []):
+      if handler.name:
+        _add_target_names(handler.name, names)
+      if not _add_defined_names(handler.body, names):
+        return False
+  return True
+
+
+def _compute_defined_names(path):
+  """Returns the frozenset of the top-level names |path| defines.
+
+  Returns None if they cannot be determined statically, for example, because
+  of "from foo import *".  Such a file is always imported.
+  """
+  with open(path) as f:
+    source = f.read()
+  try:
+    tree = ast.parse(source, path)
+  except SyntaxError:
+    # Let the import report the error.
+    return None
+  names = set()
+  if not _add_defined_names(tree.body, names):
+    return None
+  return frozenset(names)
+
+
+def _get_index_file():
+  return os.path.join(get_arc_root(), build_common.OUT_DIR,
+                      'config_loader_index.pickle')
+
+
+def _read_index_file():
+  try:
+    with open(_get_index_file(), 'rb') as f:
+      version, index = cPickle.load(f)
+  except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+    return {}
+  return index if version == _INDEX_VERSION else {}
+
+
+def _write_index_file(index):
+  index_file = _get_index_file()
+  try:
+    build_common.makedirs_safely(os.path.dirname(index_file))
+    build_common.write_atomically(
+        index_file,
+        cPickle.dumps((_INDEX_VERSION, index), cPickle.HIGHEST_PROTOCOL))
+  except (IOError, OSError):
+    # The index is only a cache. It is built again next time.
+    pass
+
+
+def _update_index(paths):
+  """Updates the index for |paths|, reusing the entries of unchanged files."""
+  previous_index = _read_index_file()
+  updated = False
+  for path in paths:
+    stat_result = os.stat(path)
+    entry = previous_index.get(path)
+    if not entry or entry[:2] != (stat_result.st_mtime, stat_result.st_size):
+      entry = (stat_result.st_mtime, stat_result.st_size,
+               _compute_defined_names(path))
+      updated = True
+    _index[path] = entry
+  if updated or set(previous_index) - set(paths):
+    _write_index_file(dict(
+        (path, entry) for path, entry in _index.iteritems()))
+
+
+def _all_config_files(base_paths, config_name):
   for base_path in base_paths:
     for root, dirs, files in os.walk(base_path, followlinks=True):
       for name in files:
-        if name == 'config.py':
+        if name == config_name:
           yield os.path.join(root, name), base_path
 
 
@@ -51,59 +191,119 @@ def _walk_module_path(module_path):
     yield '.'.join(path[:index + 1])
 
 
+def _ensure_module_exists(module_path):
+  if module_path in sys.modules:
+    return
+  if module_path in _module_name_to_path:
+    _load_module(_module_name_to_path[module_path], module_path)
+    return
+  _ensure_parents_exist(module_path)
+  module = imp.new_module(module_path)
+  # Make the module a package so that its children are imported through
+  # _ConfigModuleImporter.
+  module.__path__ = []
+  _register_module(module_path, module)
+
+
 def _ensure_parents_exist(module_path):
   for parent in _walk_module_path(module_path):
-    if parent not in sys.modules:
-      _register_module(parent, imp.new_module(parent))
+    _ensure_module_exists(parent)
+
+
+def _load_module(path, module_name):
+  """Loads the config file at |path| as |module_name| if not loaded yet."""
+  module = _loaded_modules.get(path)
+  if module is not None:
+    return module
+
+  # For safety, acquire the import lock.
+  imp.acquire_lock()
+  try:
+    # Ensure parent modules exist, creating them if needed.
+    _ensure_parents_exist(module_name)
+
+    # Compile and load the source file as a module
+    with open(path, 'r') as config_file:
+      module = imp.load_source(module_name, path, config_file)
+
+    if module_name in _parent_module_names:
+      # Config modules in its subdirectories are imported through
+      # _ConfigModuleImporter.
+      module.__path__ = []
+
+    # Register the module so we can just a later normal looking import to
+    # reference it.
+    _register_module(module_name, module)
+    _loaded_modules[path] = module
+  finally:
+    imp.release_lock()
+  return module
+
+
+class _ConfigModuleImporter(object):
+  """Imports the config modules which are not loaded yet by their names."""
 
+  def find_module(self, fullname, path=None):
+    if (fullname in _module_name_to_path or
+        fullname in _parent_module_names):
+      return self
+    return None
 
-def load_from(base_paths):
-  """Loads all the config.py files found under the base_path.
+  def load_module(self, fullname):
+    _ensure_module_exists(fullname)
+    return sys.modules[fullname]
 
-  The files are loaded as an appropriately named submodule.
-  If this function finds base_path/foo/bar/config.py, a module named
+
+def load_from(base_paths, config_name='config.py'):
+  """Registers all the config.py files found under the base_path.
+
+  The files are loaded as an appropriately named submodule when they are
+  needed.  If this function finds base_path/foo/bar/config.py, a module named
   foo.bar is created with its contents, and can be subsequently
   referenced with an 'import foo.bar' (foo.bar.config seemed redundant).
   No __init__.py files are needed.
-
-  Returns a list of all the modules loaded so that later code can optionally do
-  some introspection to decide what to do with them.
+  The files named |config_name| are registered instead if it is given.
   """
-
   # Get the list and sort it to avoid nondeterministic import issues caused by
   # some modules being set up before others.
-  all_config_files = sorted(_all_config_files(base_paths))
+  all_config_files = sorted(_all_config_files(base_paths, config_name))
+
+  new_config_files = []
+  for path_name, base_path in all_config_files:
+    # Convert the filename into a dotted python module name.
+    # base_path/foo/bar/config.py -> foo.bar
+    top_level_dir = os.path.basename(base_path)
+    dirs = [top_level_dir]
+    relative_path_to_config = os.path.dirname(
+        os.path.relpath(path_name, base_path))
+    if relative_path_to_config:
+      dirs.extend(relative_path_to_config.split(os.sep))
+    module_name = '.'.join(dirs)
+    new_config_files.append((path_name, module_name))
+    _module_name_to_path.setdefault(module_name, path_name)
+    _parent_module_names.update(_walk_module_path(module_name))
+
+    # Configure must rerun when any config file is changed, as the file may
+    # start defining the names it looks up.
+    dependency_inspection.add_files(path_name)
+
+  _update_index([path for path, _ in _config_files + new_config_files])
+  _config_files.extend(new_config_files)
+
+
+def reset():
+  """Forgets all the registered config files.
+
+  This is used to run configure on other config files than the ones of the
+  project, such as the synthetic tree of configure_benchmark.  The config
+  modules already loaded are kept in sys.modules.
+  """
+  del _config_files[:]
+  _module_name_to_path.clear()
+  _parent_module_names.clear()
 
-  # For safety, acquire the import lock.
-  imp.acquire_lock()
-  try:
-    for path_name, base_path in all_config_files:
-      # Convert the filename into a dotted python module name.
-      # base_path/foo/bar/config.py -> foo.bar
-      top_level_dir = os.path.basename(base_path)
-      dirs = [top_level_dir]
-      relative_path_to_config = os.path.dirname(
-          os.path.relpath(path_name, base_path))
-      if relative_path_to_config:
-        dirs.extend(relative_path_to_config.split(os.sep))
-      module_name = '.'.join(dirs)
-
-      # Ensure parent modules exist, creating them if needed.
-      _ensure_parents_exist(module_name)
-
-      # Compile and load the source file as a module
-      with open(path_name, 'r') as config_file:
-        config_module = imp.load_source(module_name, path_name, config_file)
-
-      # Register the module so we can just a later normal looking import to
-      # reference it.
-      _register_module(module_name, config_module)
-
-      _config_modules.append(config_module)
-  finally:
-    imp.release_lock()
 
-  return _config_modules
+sys.meta_path.append(_ConfigModuleImporter())
 
 
 # On the first import, automatically discover all config modules in the project
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tests for config_loader."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import config_loader
+
+
+class ConfigLoaderTest(unittest.TestCase):
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._base_path = os.path.join(self._temp_dir, 'config_loader_test_mods')
+    self._original_state = (
+        config_loader._config_files[:], dict(config_loader._index),
+        dict(config_loader._module_name_to_path),
+        set(config_loader._parent_module_names))
+    self._original_get_index_file = config_loader._get_index_file
+    config_loader._get_index_file = (
+        lambda: os.path.join(self._temp_dir, 'index.pickle'))
+
+  def tearDown(self):
+    config_loader._get_index_file = self._original_get_index_file
+    (config_loader._config_files, config_loader._index,
+     config_loader._module_name_to_path,
+     config_loader._parent_module_names) = self._original_state
+    for name in sys.modules.keys():
+      if name.startswith('config_loader_test_mods'):
+        del sys.modules[name]
+    shutil.rmtree(self._temp_dir)
+
+  def _write_config(self, subdir, content):
+    path = os.path.join(self._base_path, subdir, 'config.py')
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(content)
+    return path
+
+  def test_compute_defined_names(self):
+    path = self._write_config('foo', '\n'.join([
+        'import os.path',
+        'from re import match as m',
+        'A, (B, C) = 1, (2, 3)',
+        'try:',
+        '  import json',
+        'except ImportError:',
+        '  json = None',
+        'if A:',
+        '  def f():',
+        '    local = 1',
+        'class K(object):',
+        '  member = 1',
+        '']))
+    self.assertEquals(
+        frozenset(['os', 'm', 'A', 'B', 'C', 'json', 'f', 'K']),
+        config_loader._compute_defined_names(path))
+    self._write_config('foo', 'from os.path import *\n')
+    self.assertIsNone(config_loader._compute_defined_names(path))
+
+  def test_lazy_load(self):
+    self._write_config('foo', 'config_loader_test_foo = 1\n')
+    self._write_config('bar', 'config_loader_test_bar = 2\n')
+    config_loader.load_from([self._base_path])
+    self.assertNotIn('config_loader_test_mods.foo', sys.modules)
+    self.assertEquals(
+        [2], list(config_loader.find_name('config_loader_test_bar')))
+    self.assertIn('config_loader_test_mods.bar', sys.modules)
+    self.assertNotIn('config_loader_test_mods.foo', sys.modules)
+    # Importing by the module name loads the module too.
+    import config_loader_test_mods.foo
+    self.assertEquals(1, config_loader_test_mods.foo.config_loader_test_foo)
+
+  def test_index_file(self):
+    path = self._write_config('foo', 'config_loader_test_foo = 1\n')
+    config_loader.load_from([self._base_path])
+    self.assertEquals(frozenset(['config_loader_test_foo']),
+                      config_loader._read_index_file()[path][2])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -12,9 +12,12 @@ import pipes
 import shutil
 import subprocess
 import sys
+import time
 
 import build_common
 import config_loader
+import configure_cache
+import configure_profile
 import download_cts_files
 import download_sdk_and_ndk
 import open_source
@@ -27,6 +30,8 @@ from build_options import OPTIONS
 import make_to_ninja
 import ninja_generator
 import ninja_generator_runner
+import notice_index
+from util import filesystem_snapshot
 
 
 def _set_up_git_hooks():
@@ -324,8 +329,8 @@ def _generate_independent_ninjas():
   task_list = list(config_loader.find_name('generate_ninjas'))
   if OPTIONS.run_tests():
     task_list.extend(config_loader.find_name('generate_test_ninjas'))
-  ninja_list = ninja_generator_runner.run_in_parallel(task_list,
-                                                      OPTIONS.configure_jobs())
+  ninja_list = ninja_generator_runner.run_in_parallel(
+      task_list, OPTIONS.configure_jobs(), phase='Independent ninjas')
   timer.done()
 
   return ninja_list
@@ -351,8 +356,9 @@ def _generate_shared_lib_depending_ninjas(ninja_list):
     task_list.extend([(f, installed_shared_libs)
                      for f in test_ninja_generators])
 
-  result = ninja_generator_runner.run_in_parallel(task_list,
-                                                  OPTIONS.configure_jobs())
+  result = ninja_generator_runner.run_in_parallel(
+      task_list, OPTIONS.configure_jobs(),
+      phase='Plugin and packaging ninjas')
   timer.done()
   return result
 
@@ -370,10 +376,11 @@ def _generate_dependent_ninjas(ninja_list):
   dependent_ninjas = ninja_generator_runner.run_in_parallel(
       [(job, root_dir_install_all_targets) for job in
        config_loader.find_name('generate_binaries_depending_ninjas')],
-      OPTIONS.configure_jobs())
+      OPTIONS.configure_jobs(), phase='Dependent ninjas')
 
   notice_ninja = ninja_generator.NoticeNinjaGenerator('notices')
-  notice_ninja.build_notices(ninja_list + dependent_ninjas)
+  with configure_profile.trace('Building notices'):
+    notice_ninja.build_notices(ninja_list + dependent_ninjas)
   dependent_ninjas.append(notice_ninja)
   return dependent_ninjas
 
@@ -382,7 +389,8 @@ def _generate_top_level_ninja(ninja_list):
   """Generate build.ninja.  This must be the last generated ninja."""
   top_ninja = ninja_generator.TopLevelNinjaGenerator('build.ninja')
   top_ninja.emit_subninja_rules(ninja_list)
-  top_ninja.emit_target_groups_rules(ninja_list + [top_ninja])
+  with configure_profile.trace('Computing target groups'):
+    top_ninja.emit_target_groups_rules(ninja_list + [top_ninja])
   return top_ninja
 
 
@@ -396,13 +404,13 @@ def _verify_ninja_generator_list(ninja_list):
     # for the target and the host.
     key = (ninja.get_module_name(), ninja.is_host())
     module_name_count_dict[key] += 1
-    if isinstance(ninja, ninja_generator.ArchiveNinjaGenerator):
+    if ninja.is_kind_of(ninja_generator.ArchiveNinjaGenerator):
       archive_ninja_list.append(ninja)
-    if isinstance(ninja, ninja_generator.SharedObjectNinjaGenerator):
+    if ninja.is_kind_of(ninja_generator.SharedObjectNinjaGenerator):
       shared_ninja_list.append(ninja)
-    if (isinstance(ninja, ninja_generator.ExecNinjaGenerator) and
+    if (ninja.is_kind_of(ninja_generator.ExecNinjaGenerator) and
         # Do not check the used count of tests.
-        not isinstance(ninja, ninja_generator.TestNinjaGenerator)):
+        not ninja.is_kind_of(ninja_generator.TestNinjaGenerator)):
       exec_ninja_list.append(ninja)
 
   # Make sure there is no duplicated ninja modules.
@@ -468,24 +476,44 @@ def _set_up_chromium_org_submodules():
 
 
 def _generate_ninjas():
+  start_time = time.time()
   _set_up_generate_ninja()
   ninja_list = []
-  ninja_list.extend(_generate_independent_ninjas())
-  ninja_list.extend(
-      _generate_shared_lib_depending_ninjas(ninja_list))
-  ninja_list.extend(_generate_dependent_ninjas(ninja_list))
-  ninja_list.append(_generate_top_level_ninja(ninja_list))
-
-  # Run verification before emitting to files.
-  _verify_ninja_generator_list(ninja_list)
-
-  # Emit each ninja script to a file.
+  with configure_profile.trace('Generating independent ninjas'):
+    ninja_list.extend(_generate_independent_ninjas())
+  with configure_profile.trace('Generating plugin and packaging ninjas'):
+    ninja_list.extend(
+        _generate_shared_lib_depending_ninjas(ninja_list))
+  with configure_profile.trace('Generating dependent ninjas'):
+    ninja_list.extend(_generate_dependent_ninjas(ninja_list))
+  with configure_profile.trace('Generating top level ninja'):
+    top_ninja = _generate_top_level_ninja(ninja_list)
+    ninja_list.append(top_ninja)
+
+  # Run verification before emitting build.ninja. The ninja files generated
+  # in the worker processes are already emitted, but they are not used until
+  # build.ninja refers to them.
+  with configure_profile.trace('Verifying ninja generators'):
+    _verify_ninja_generator_list(ninja_list)
+
+  # Emit the ninja scripts generated in this process to files.
   timer = build_common.SimpleTimer()
   timer.start('Emitting ninja scripts', OPTIONS.verbose())
-  for ninja in ninja_list:
-    ninja.emit()
+  with configure_profile.trace('Emitting ninja scripts'):
+    ninja_generator.emit_ninja_files(ninja_list, OPTIONS.configure_jobs())
   timer.done()
 
+  with configure_profile.trace('Writing compilation database'):
+    ninja_generator.write_compile_commands(ninja_list, top_ninja)
+
+  if OPTIONS.incremental_configure():
+    # All results used in this run are marked. Drop the others so that the
+    # cache does not grow forever.
+    configure_cache.remove_stale_entries(start_time)
+
+  notice_index.save()
+  configure_profile.write()
+
 
 def main():
   # Disable line buffering
@@ -519,6 +547,11 @@ def main():
   # Make sure the staging directory is up to date whenever configure
   # runs to make it easy to generate rules by scanning directories.
   staging.create_staging()
+  # Take the snapshot of the directories scanned while generating ninja files.
+  # The worker processes share it.
+  filesystem_snapshot.take_snapshot(
+      [build_common.get_staging_root(), 'src', 'mods'],
+      build_common.get_filesystem_snapshot_file())
 
   _generate_ninjas()
 
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmarks the phases of configure against a synthetic source tree.
+
+The phases of configure.py run against the synthetic tree in
+src/build/tests/configure_benchmark, in a temporary workspace which mirrors
+the checkout, so that out/ and build.ninja of the checkout are not touched.
+Each repetition runs in a new process, and the median of the repetitions is
+recorded for each phase.
+
+Usage:
+  # Run the benchmark, and write the result as JSON.
+  $ src/build/configure_benchmark.py run --output before.json
+  # Compare two results. Exits with 1 if a phase regressed by more than 10%.
+  $ src/build/configure_benchmark.py compare before.json after.json \\
+      --threshold 10
+"""
+
+import argparse
+import json
+import os
+import resource
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import build_common
+
+# Bump this when the format of the result changes.
+_RESULT_VERSION = 1
+
+_BENCHMARK_TREE = 'src/build/tests/configure_benchmark'
+_BENCHMARK_CONFIG_NAME = 'benchmark_config.py'
+
+# The file in the workspace to which each run writes its result.
+_RUN_RESULT_FILE = 'configure_benchmark_run.json'
+
+# The entries of the checkout which are not mirrored in the workspace.
+_EXCLUDED_ENTRIES = ['.ninja_deps', '.ninja_log', 'build.ninja',
+                     build_common.OUT_DIR, _RUN_RESULT_FILE]
+
+# The phases of configure, in the order they run.
+_PHASES = ['set_up_generate_ninja', 'independent_ninjas',
+           'shared_lib_depending_ninjas', 'dependent_ninjas',
+           'top_level_ninja', 'emission']
+
+_METRICS = ['wall_time', 'cpu_time', 'max_rss', 'syscalls', 'output_size']
+
+# Regressions of phases which take less than this in seconds are ignored, as
+# they are dominated by noise.
+_MIN_COMPARED_TIME = 0.05
+
+
+def _get_syscall_count():
+  """Returns the number of read and write syscalls of this process, or None.
+
+  Only the syscalls counted in /proc/self/io are available without tracing.
+  """
+  try:
+    with open('/proc/self/io') as f:
+      counts = dict(line.split(':') for line in f if ':' in line)
+  except IOError:
+    return None
+  return int(counts['syscr']) + int(counts['syscw'])
+
+
+def _get_output_size():
+  """Returns the total size of the ninja files in the workspace."""
+  size = 0
+  if os.path.exists('build.ninja'):
+    size += os.path.getsize('build.ninja')
+  for dirpath, _, filenames in os.walk(build_common.get_generated_ninja_dir()):
+    for name in filenames:
+      if name.endswith('.ninja'):
+        size += os.path.getsize(os.path.join(dirpath, name))
+  return size
+
+
+class _PhaseMeasurement(object):
+  """Measures a phase, including the worker processes it waited for."""
+
+  def __init__(self):
+    self._start_time = time.time()
+    self._start_times = os.times()
+    self._start_syscalls = _get_syscall_count()
+    self._start_output_size = _get_output_size()
+
+  def get_metrics(self):
+    times = os.times()
+    # The CPU time of the workers is counted when they are waited for, which
+    # is at the end of each phase running them.
+    cpu_time = sum(times[:4]) - sum(self._start_times[:4])
+    max_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    syscalls = _get_syscall_count()
+    if syscalls is not None and self._start_syscalls is not None:
+      syscalls -= self._start_syscalls
+    return {
+        'wall_time': time.time() - self._start_time,
+        'cpu_time': cpu_time,
+        'max_rss': max_rss,
+        'syscalls': syscalls,
+        'output_size': _get_output_size() - self._start_output_size}
+
+
+def _create_workspace():
+  """Creates a workspace mirroring the checkout with symlinks."""
+  workspace = tempfile.mkdtemp(prefix='configure_benchmark.')
+  arc_root = build_common.get_arc_root()
+  for name in os.listdir(arc_root):
+    if name not in _EXCLUDED_ENTRIES:
+      os.symlink(os.path.join(arc_root, name), os.path.join(workspace, name))
+  return workspace
+
+
+def _clean_workspace():
+  """Removes the output of the previous run except the staging directory."""
+  build_common.remove_file_force('build.ninja')
+  if not os.path.isdir(build_common.OUT_DIR):
+    return
+  for name in os.listdir(build_common.OUT_DIR):
+    path = os.path.join(build_common.OUT_DIR, name)
+    if path == build_common.get_staging_root():
+      continue
+    if os.path.isdir(path) and not os.path.islink(path):
+      shutil.rmtree(path)
+    else:
+      os.unlink(path)
+
+
+def _run_once(workspace, configure_args):
+  """Runs the phases of configure once, and returns the metrics of them."""
+  os.chdir(workspace)
+  # Imported here, as importing configure registers the config files of the
+  # checkout.
+  import config_loader
+  import configure
+  import ninja_generator
+  import staging
+  from build_options import OPTIONS
+
+  OPTIONS.parse(configure_args)
+  if not os.path.exists(build_common.get_staging_root()):
+    staging.create_staging()
+  config_loader.reset()
+  config_loader.load_from([os.path.abspath(_BENCHMARK_TREE)],
+                          config_name=_BENCHMARK_CONFIG_NAME)
+
+  ninja_list = []
+  phases = [
+      ('set_up_generate_ninja', configure._set_up_generate_ninja),
+      ('independent_ninjas',
+       lambda: ninja_list.extend(configure._generate_independent_ninjas())),
+      ('shared_lib_depending_ninjas',
+       lambda: ninja_list.extend(
+           configure._generate_shared_lib_depending_ninjas(ninja_list))),
+      ('dependent_ninjas',
+       lambda: ninja_list.extend(
+           configure._generate_dependent_ninjas(ninja_list))),
+      ('top_level_ninja',
+       lambda: ninja_list.append(
+           configure._generate_top_level_ninja(ninja_list))),
+      ('emission',
+       lambda: ninja_generator.emit_ninja_files(
+           ninja_list, OPTIONS.configure_jobs()))]
+  assert [name for name, _ in phases] == _PHASES
+
+  result = {}
+  for name, function in phases:
+    measurement = _PhaseMeasurement()
+    function()
+    result[name] = measurement.get_metrics()
+  return result
+
+
+def _get_median(values):
+  values = sorted(value for value in values if value is not None)
+  if not values:
+    return None
+  middle = len(values) / 2
+  if len(values) % 2:
+    return values[middle]
+  return (values[middle - 1] + values[middle]) / 2.0
+
+
+def _summarize_runs(runs):
+  """Returns the median of each metric of each phase in |runs|."""
+  return dict(
+      (phase, dict((metric, _get_median(run[phase][metric] for run in runs))
+                   for metric in _METRICS))
+      for phase in _PHASES)
+
+
+def _run(args):
+  configure_args = shlex.split(args.configure_args)
+  workspace = _create_workspace()
+  try:
+    runs = []
+    for index in xrange(args.repeat):
+      print 'Running configure benchmark %d/%d' % (index + 1, args.repeat)
+      # Each run is a new process, as configure keeps global states.
+      subprocess.check_call(
+          [sys.executable, os.path.abspath(__file__), '_run_once',
+           '--workspace', workspace, '--configure-args', args.configure_args],
+          cwd=workspace)
+      with open(os.path.join(workspace, _RUN_RESULT_FILE)) as f:
+        runs.append(json.load(f))
+  finally:
+    if args.keep_workspace:
+      print 'The workspace is kept in ' + workspace
+    else:
+      shutil.rmtree(workspace, ignore_errors=True)
+
+  result = {
+      'version': _RESULT_VERSION,
+      'timestamp': time.time(),
+      'configure_args': configure_args,
+      'phases': _summarize_runs(runs),
+      'runs': runs}
+  output_dir = os.path.dirname(args.output)
+  if output_dir:
+    build_common.makedirs_safely(output_dir)
+  with open(args.output, 'w') as f:
+    json.dump(result, f, indent=2, sort_keys=True)
+  _print_table(result['phases'])
+  print 'The result is written to ' + args.output
+  return 0
+
+
+def _print_table(phases):
+  print '%-28s %10s %10s %10s %10s %12s' % (
+      'phase', 'wall (s)', 'cpu (s)', 'rss (KB)', 'syscalls', 'output (B)')
+  for phase in _PHASES:
+    metrics = phases[phase]
+    print '%-28s %10.3f %10.3f %10s %10s %12s' % (
+        phase, metrics['wall_time'], metrics['cpu_time'], metrics['max_rss'],
+        metrics['syscalls'], metrics['output_size'])
+
+
+def find_regressions(base_phases, new_phases, threshold):
+  """Returns the list of (phase, metric, base, new) which regressed.
+
+  A metric regresses when the new value is more than |threshold| percent
+  larger than the base value.
+  """
+  regressions = []
+  for phase in _PHASES:
+    base_metrics = base_phases.get(phase)
+    new_metrics = new_phases.get(phase)
+    if not base_metrics or not new_metrics:
+      continue
+    for metric in _METRICS:
+      base = base_metrics.get(metric)
+      new = new_metrics.get(metric)
+      if not base or new is None:
+        continue
+      if (metric.endswith('_time') and
+          max(base, new) < _MIN_COMPARED_TIME):
+        continue
+      if new > base * (1 + threshold / 100.0):
+        regressions.append((phase, metric, base, new))
+  return regressions
+
+
+def _compare(args):
+  with open(args.base) as f:
+    base = json.load(f)
+  with open(args.new) as f:
+    new = json.load(f)
+  if base.get('version') != _RESULT_VERSION or (
+      new.get('version') != _RESULT_VERSION):
+    print 'The results are recorded by a different version of the benchmark.'
+    return 1
+  if base['configure_args'] != new['configure_args']:
+    print 'WARNING: The results are recorded with different configure args.'
+
+  print 'Base:'
+  _print_table(base['phases'])
+  print 'New:'
+  _print_table(new['phases'])
+  regressions = find_regressions(base['phases'], new['phases'], args.threshold)
+  for phase, metric, base_value, new_value in regressions:
+    print 'REGRESSION: %s %s: %s -> %s (%+.1f%%)' % (
+        phase, metric, base_value, new_value,
+        (new_value - base_value) * 100.0 / base_value)
+  if regressions:
+    return 1
+  print 'No regressions over %g%%.' % args.threshold
+  return 0
+
+
+def _parse_args(args):
+  parser = argparse.ArgumentParser()
+  subparsers = parser.add_subparsers(dest='command')
+
+  run_parser = subparsers.add_parser(
+      'run', help='Run the benchmark and record the result.')
+  run_parser.add_argument(
+      '--configure-args', default='',
+      help='The options passed to configure, e.g. "-t bi --opt".')
+  run_parser.add_argument(
+      '--repeat', type=int, default=3,
+      help='The number of runs. The median of them is recorded.')
+  run_parser.add_argument(
+      '--output', default=os.path.join(build_common.OUT_DIR,
+                                       'configure_benchmark.json'),
+      help='The file to write the result to.')
+  run_parser.add_argument(
+      '--keep-workspace', action='store_true',
+      help='Keep the workspace for debugging.')
+
+  compare_parser = subparsers.add_parser(
+      'compare', help='Compare two results, and report regressions.')
+  compare_parser.add_argument('base', help='The result to compare against.')
+  compare_parser.add_argument('new', help='The result to check.')
+  compare_parser.add_argument(
+      '--threshold', type=float, default=10,
+      help='The percentage of the increase reported as a regression.')
+
+  run_once_parser = subparsers.add_parser('_run_once')
+  run_once_parser.add_argument('--workspace', required=True)
+  run_once_parser.add_argument('--configure-args', default='')
+  return parser.parse_args(args)
+
+
+def main():
+  args = _parse_args(sys.argv[1:])
+  if args.command == 'run':
+    return _run(args)
+  if args.command == 'compare':
+    return _compare(args)
+  result = _run_once(args.workspace, shlex.split(args.configure_args))
+  _clean_workspace()
+  with open(_RUN_RESULT_FILE, 'w') as f:
+    json.dump(result, f)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
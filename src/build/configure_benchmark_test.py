@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tests for configure_benchmark."""
+
+import unittest
+
+import configure_benchmark
+
+
+def _make_metrics(wall_time=1.0, cpu_time=2.0, max_rss=1000, syscalls=100,
+                  output_size=5000):
+  return {'wall_time': wall_time, 'cpu_time': cpu_time, 'max_rss': max_rss,
+          'syscalls': syscalls, 'output_size': output_size}
+
+
+class ConfigureBenchmarkTest(unittest.TestCase):
+  def test_get_median(self):
+    self.assertEquals(2, configure_benchmark._get_median([3, 1, 2]))
+    self.assertEquals(2.5, configure_benchmark._get_median([4, 1, 3, 2]))
+    self.assertEquals(1, configure_benchmark._get_median([None, 1]))
+    self.assertEquals(None, configure_benchmark._get_median([None]))
+
+  def test_find_regressions(self):
+    base = {'independent_ninjas': _make_metrics(),
+            'emission': _make_metrics(wall_time=0.01)}
+    new = {'independent_ninjas': _make_metrics(wall_time=1.05,
+                                               output_size=6000),
+           # Too short to compare.
+           'emission': _make_metrics(wall_time=0.02)}
+    self.assertEquals(
+        [('independent_ninjas', 'output_size', 5000, 6000)],
+        configure_benchmark.find_regressions(base, new, 10))
+    self.assertEquals(
+        [('independent_ninjas', 'wall_time', 1.0, 1.05),
+         ('independent_ninjas', 'output_size', 5000, 6000)],
+        configure_benchmark.find_regressions(base, new, 1))
+
+  def test_find_regressions_missing_values(self):
+    base = {'independent_ninjas': _make_metrics(syscalls=None)}
+    new = {'independent_ninjas': _make_metrics(syscalls=200),
+           'emission': _make_metrics()}
+    self.assertEquals([], configure_benchmark.find_regressions(base, new, 10))
+
+
+if __name__ == '__main__':
+  unittest.main()
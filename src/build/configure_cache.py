@@ -0,0 +1,242 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Caches the results of generate_ninjas tasks across configure runs.
+
+With --incremental-configure, ninja_generator_runner stores the list of
+NinjaGenerator each task creates, together with the inputs the task read
+(see dependency_inspection).  When configure runs next time, a task whose
+code, arguments, configure options and recorded inputs are all unchanged
+returns the stored list instead of running again.
+
+Files are compared by their content.  The modification time and the size are
+checked first, so that only the files which were touched are read.  Checks of
+the file system such as os.path.exists, os.listdir, glob.glob and
+staging.as_real_path are recorded as probes, and the stored list is reused
+only while each probe returns the same result.  Remove the cache directory to
+force every task to run.
+"""
+
+import cPickle
+import hashlib
+import logging
+import os
+import sys
+
+import build_common
+import dependency_inspection
+import toolchain
+from build_options import OPTIONS
+
+# Bump this when the format of the cache entries changes.
+_CACHE_VERSION = 5
+
+# Options which do not affect the generated ninja files.
+_IGNORED_OPTIONS = ['configure_jobs', 'incremental_configure',
+                    'profile_configure', 'verbose']
+
+# Key of everything all tasks depend on. Computed in the parent process
+# before forking the workers, see prepare().
+_environment_key = None
+
+# Memoized digests, keyed by (path, mtime, size).
+_file_digest_cache = {}
+
+# Memoized digests of the config modules, keyed by the module name.
+_module_digest_cache = {}
+
+
+def get_cache_dir():
+  return os.path.join(build_common.get_build_dir(), 'configure_cache')
+
+
+def _get_source_path(module):
+  path = getattr(module, '__file__', None)
+  if not path:
+    return None
+  if path.endswith('.pyc'):
+    path = path[:-1]
+  return os.path.abspath(path)
+
+
+def _is_config_module_path(path):
+  return os.path.basename(path) == 'config.py'
+
+
+def _compute_file_digest(path, stat_result):
+  key = (path, stat_result.st_mtime, stat_result.st_size)
+  digest = _file_digest_cache.get(key)
+  if digest is None:
+    with open(path, 'rb') as f:
+      digest = hashlib.sha1(f.read()).hexdigest()
+    _file_digest_cache[key] = digest
+  return digest
+
+
+def _get_file_state(path):
+  """Returns (realpath, mtime, size, digest) of |path|.
+
+  Returns None if the file does not exist.
+  """
+  try:
+    stat_result = os.stat(path)
+  except OSError:
+    return None
+  return (os.path.realpath(path), stat_result.st_mtime, stat_result.st_size,
+          _compute_file_digest(path, stat_result))
+
+
+def get_file_digest(path):
+  """Returns the digest of the content of |path|, or None if it is missing."""
+  state = _get_file_state(path)
+  return state[3] if state else None
+
+
+def _is_file_state_unchanged(path, state):
+  try:
+    stat_result = os.stat(path)
+  except OSError:
+    return state is None
+  if state is None:
+    return False
+  realpath, mtime, size, digest = state
+  if os.path.realpath(path) != realpath:
+    return False
+  if (stat_result.st_mtime, stat_result.st_size) == (mtime, size):
+    return True
+  return _compute_file_digest(path, stat_result) == digest
+
+
+def _compute_environment_key():
+  """Computes the key of the inputs which all tasks depend on.
+
+  It covers the configure options, the toolchain, and the python scripts
+  loaded into configure, except the config.py files which are handled per
+  task.
+  """
+  options = sorted((name, value) for name, value
+                   in OPTIONS.get_all_values().iteritems()
+                   if name not in _IGNORED_OPTIONS)
+  targets = [OPTIONS.target(), 'host']
+  tools = [(target, sorted(toolchain.get_tool_map(target).iteritems()),
+            toolchain.get_gcc_raw_version(target)) for target in targets]
+
+  arc_root = build_common.get_arc_root()
+  sources = set()
+  for module in sys.modules.values():
+    path = _get_source_path(module)
+    if (path and path.startswith(arc_root + os.sep) and
+        not _is_config_module_path(path)):
+      sources.add(path)
+  source_digests = [(source, _get_file_state(source)[3])
+                    for source in sorted(sources) if os.path.exists(source)]
+
+  return hashlib.sha1(repr(
+      (_CACHE_VERSION, options, tools, source_digests))).hexdigest()
+
+
+def prepare():
+  """Computes the environment key if necessary.
+
+  This should be called before forking the worker processes, so that they
+  share the result.
+  """
+  global _environment_key
+  if _environment_key is None:
+    _environment_key = _compute_environment_key()
+
+
+def _compute_module_digest(module_name):
+  """Computes the digest of the module defining a task.
+
+  Config modules referred from the module are included too, as the task may
+  call their functions.
+  """
+  digest = _module_digest_cache.get(module_name)
+  if digest is None:
+    module = sys.modules[module_name]
+    paths = set([_get_source_path(module)])
+    for value in vars(module).itervalues():
+      path = _get_source_path(value) if type(value) is type(sys) else None
+      if path and _is_config_module_path(path):
+        paths.add(path)
+    digest = hashlib.sha1(repr(
+        [(source, _get_file_state(source)[3]) for source in sorted(paths)]
+    )).hexdigest()
+    _module_digest_cache[module_name] = digest
+  return digest
+
+
+def get_task_key(function, args):
+  """Returns the cache key of the task, or None if it cannot be cached."""
+  if function.__name__ == '<lambda>' or function.func_closure:
+    # Such functions cannot be identified by their names.
+    return None
+  args_repr = repr(args)
+  if ' at 0x' in args_repr:
+    # The arguments contain an object without a stable representation.
+    return None
+  prepare()
+  return hashlib.sha1(repr(
+      (_environment_key, function.__module__, function.__name__, args_repr,
+       _compute_module_digest(function.__module__)))).hexdigest()
+
+
+def _get_entry_path(key):
+  return os.path.join(get_cache_dir(), key[:2], key)
+
+
+def load(key):
+  """Returns the cached result for |key|, or None if it is not valid."""
+  entry_path = _get_entry_path(key)
+  try:
+    with open(entry_path, 'rb') as f:
+      files, listings, probes = cPickle.load(f)
+      for path, state in files.iteritems():
+        if not _is_file_state_unchanged(path, state):
+          return None
+      for query, digest in listings:
+        result = build_common.find_all_files(**query)
+        if dependency_inspection.compute_listing_digest(result) != digest:
+          return None
+      for (name, args), result in probes.iteritems():
+        if dependency_inspection.evaluate_probe(name, args) != result:
+          return None
+      result = cPickle.load(f)
+  except (IOError, EOFError, KeyError, cPickle.UnpicklingError):
+    # KeyError is raised for a probe which is no longer registered.
+    return None
+  # Mark the entry as used, see remove_stale_entries().
+  os.utime(entry_path, None)
+  return result
+
+
+def store(key, files, listings, probes, result):
+  """Stores |result| with the recorded inputs of the task."""
+  try:
+    header = cPickle.dumps(
+        (dict((path, _get_file_state(path)) for path in files),
+         listings.values(), probes),
+        cPickle.HIGHEST_PROTOCOL)
+    body = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+  except (cPickle.PicklingError, TypeError) as e:
+    logging.info('Not caching the result of the task: %s', e)
+    return
+  entry_path = _get_entry_path(key)
+  build_common.makedirs_safely(os.path.dirname(entry_path))
+  build_common.write_atomically(entry_path, header + body)
+
+
+def remove_stale_entries(start_time):
+  """Removes the entries which are not used since |start_time|."""
+  cache_dir = get_cache_dir()
+  if not os.path.isdir(cache_dir):
+    return
+  # File modification times may be truncated to seconds.
+  start_time = int(start_time)
+  for dirpath, _, filenames in os.walk(cache_dir):
+    for filename in filenames:
+      path = os.path.join(dirpath, filename)
+      if os.path.getmtime(path) < start_time:
+        build_common.remove_file_force(path)
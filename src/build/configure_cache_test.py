@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tests for configure_cache."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import build_common
+import configure_cache
+import dependency_inspection
+
+
+class ConfigureCacheTest(unittest.TestCase):
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._cache_dir = os.path.join(self._temp_dir, 'cache')
+    self._input_dir = os.path.join(self._temp_dir, 'input')
+    os.makedirs(self._input_dir)
+    self._input_file = os.path.join(self._input_dir, 'Android.mk')
+    self._write(self._input_file, 'LOCAL_MODULE := foo\n')
+    self._original_get_cache_dir = configure_cache.get_cache_dir
+    configure_cache.get_cache_dir = lambda: self._cache_dir
+
+  def tearDown(self):
+    configure_cache.get_cache_dir = self._original_get_cache_dir
+    shutil.rmtree(self._temp_dir)
+
+  def _write(self, path, content):
+    with open(path, 'w') as f:
+      f.write(content)
+
+  def _store(self, key, result, probe=None):
+    dependency_inspection.start_inspection()
+    dependency_inspection.add_files(self._input_file)
+    build_common.find_all_files(self._input_dir, use_staging=False)
+    if probe:
+      probe()
+    files, _, listings, probes = dependency_inspection.stop_inspection()
+    configure_cache.store(key, files, listings, probes, result)
+
+  def test_unchanged(self):
+    self._store('0123', (['ninja'], []))
+    self.assertEquals((['ninja'], []), configure_cache.load('0123'))
+    self.assertIsNone(configure_cache.load('4567'))
+
+  def test_touched_file(self):
+    self._store('0123', (['ninja'], []))
+    os.utime(self._input_file, (0, 0))
+    self.assertEquals((['ninja'], []), configure_cache.load('0123'))
+
+  def test_modified_file(self):
+    self._store('0123', (['ninja'], []))
+    self._write(self._input_file, 'LOCAL_MODULE := foobar\n')
+    self.assertIsNone(configure_cache.load('0123'))
+
+  def test_removed_file(self):
+    self._store('0123', (['ninja'], []))
+    os.remove(self._input_file)
+    self.assertIsNone(configure_cache.load('0123'))
+
+  def test_added_file(self):
+    self._store('0123', (['ninja'], []))
+    self._write(os.path.join(self._input_dir, 'foo.c'), '')
+    self.assertIsNone(configure_cache.load('0123'))
+
+  def test_probed_file(self):
+    optional_file = os.path.join(self._temp_dir, 'optional.mk')
+    self._store('0123', (['ninja'], []),
+                probe=lambda: os.path.exists(optional_file))
+    self.assertEquals((['ninja'], []), configure_cache.load('0123'))
+    # The file is outside of the directories listed by the task.
+    self._write(optional_file, '')
+    self.assertIsNone(configure_cache.load('0123'))
+
+  def test_remove_stale_entries(self):
+    self._store('0123', (['ninja'], []))
+    self._store('4567', (['ninja'], []))
+    entry = os.path.join(self._cache_dir, '45', '4567')
+    os.utime(entry, (0, 0))
+    configure_cache.remove_stale_entries(1)
+    self.assertIsNotNone(configure_cache.load('0123'))
+    self.assertFalse(os.path.exists(entry))
+
+
+if __name__ == '__main__':
+  unittest.main()
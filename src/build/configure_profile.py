@@ -0,0 +1,115 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Records a timeline of configure for --profile-configure.
+
+The timeline is written in the Chrome trace event format, which can be
+loaded in chrome://tracing.  Each generate_ninjas task is a slice in the row
+of the worker process which ran it.  The phases of configure run in the
+parent process are slices in the row of the parent process.
+"""
+
+import contextlib
+import json
+import os
+import resource
+import threading
+import time
+
+import build_common
+from build_options import OPTIONS
+
+# The trace events recorded in this process.
+_events = []
+_events_lock = threading.Lock()
+
+
+def is_enabled():
+  return bool(OPTIONS.profile_configure())
+
+
+class ResourceUsage(object):
+  """Measures the resources used by this process in a period."""
+
+  def __init__(self):
+    self._start_time = time.time()
+    self._start_cpu_time = self._get_cpu_time()
+
+  @staticmethod
+  def _get_cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+  def get_stats(self):
+    """Returns a dict of the resources used since the object was created.
+
+    'start' and 'wall_time' are in seconds, 'cpu_time' is the user and the
+    system CPU time in seconds, and 'max_rss' is the peak resident set size
+    of the process so far in kilobytes.
+    """
+    return {
+        'start': self._start_time,
+        'wall_time': time.time() - self._start_time,
+        'cpu_time': self._get_cpu_time() - self._start_cpu_time,
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'pid': os.getpid()}
+
+
+def _add_event(name, category, stats, args):
+  event_args = {'cpu_time': stats['cpu_time'], 'max_rss': stats['max_rss']}
+  event_args.update(args)
+  event = {
+      'name': name,
+      'cat': category,
+      'ph': 'X',
+      'ts': int(stats['start'] * 1e6),
+      'dur': int(stats['wall_time'] * 1e6),
+      'pid': stats['pid'],
+      'tid': stats['pid'],
+      'args': event_args}
+  with _events_lock:
+    _events.append(event)
+
+
+def add_task(name, stats, **args):
+  """Records a generate_ninjas task which ran with |stats|.
+
+  |stats| is the result of ResourceUsage.get_stats() in the worker process.
+  """
+  if is_enabled():
+    _add_event(name, 'task', stats, args)
+
+
+@contextlib.contextmanager
+def trace(name, **args):
+  """Records the code run in the with statement as a phase of configure."""
+  if not is_enabled():
+    yield
+    return
+  usage = ResourceUsage()
+  yield
+  _add_event(name, 'phase', usage.get_stats(), args)
+
+
+def _get_process_name_events():
+  parent_pid = os.getpid()
+  pids = set(event['pid'] for event in _events)
+  return [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': pid,
+           'args': {'name': 'configure' if pid == parent_pid else 'worker'}}
+          for pid in sorted(pids)]
+
+
+def write():
+  """Writes the recorded events to the file given by --profile-configure."""
+  if not is_enabled():
+    return
+  path = OPTIONS.profile_configure()
+  output_dir = os.path.dirname(path)
+  if output_dir:
+    build_common.makedirs_safely(output_dir)
+  with _events_lock:
+    events = sorted(_events, key=lambda event: event['ts'])
+  with open(path, 'w') as f:
+    json.dump({'traceEvents': _get_process_name_events() + events,
+               'displayTimeUnit': 'ms'}, f, indent=1)
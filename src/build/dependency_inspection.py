@@ -0,0 +1,169 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Records the inputs which are read while generating ninja files.
+
+Functions that read files to generate build rules (open_dependency,
+find_all_files, make_to_ninja, config_loader) report what they read here.
+
+Two sets of inputs are kept.  The inputs of a generate_ninjas task are
+recorded only between start_inspection() and stop_inspection(), which
+ninja_generator_runner calls around each task, and are used by
+configure_cache.  The regen dependencies, the files which require rerunning
+configure when changed, are recorded all the time.  Those recorded in a task
+are returned by stop_inspection(), so that the worker processes can send them
+back to the parent process, which merges them with add_regen_files().
+
+A task may also decide what to generate by checking the file system, e.g.
+with os.path.exists or glob.glob.  While a task is inspected, such functions
+are replaced with wrappers which record their arguments and results as
+probes, and configure_cache evaluates the probes again to check that the
+results are unchanged.  Other modules register their own probes with
+register_probe_function() and report their calls with add_probe().
+"""
+
+import glob
+import hashlib
+import os
+
+_files = None
+_listings = None
+_task_regen_files = None
+_probes = None
+
+# The functions which are replaced while a task is inspected, as (module,
+# attribute name, probe name).
+_WRAPPED_PROBE_FUNCTIONS = [
+    (os, 'listdir', 'os.listdir'),
+    (os.path, 'exists', 'os.path.exists'),
+    (os.path, 'isdir', 'os.path.isdir'),
+    (os.path, 'isfile', 'os.path.isfile'),
+    (os.path, 'islink', 'os.path.islink'),
+    (os.path, 'lexists', 'os.path.lexists'),
+    (os.path, 'realpath', 'os.path.realpath'),
+    (glob, 'glob', 'glob.glob'),
+]
+
+# The original functions of the probes, by the probe name.
+_probe_functions = dict(
+    (name, getattr(module, attribute))
+    for module, attribute, name in _WRAPPED_PROBE_FUNCTIONS)
+
+# Regen dependencies recorded outside of tasks, or merged from the tasks.
+_regen_files = set()
+
+
+def _wrap_probe_function(name):
+  function = _probe_functions[name]
+
+  def wrapper(*args):
+    result = function(*args)
+    add_probe(name, args, result)
+    return result
+  return wrapper
+
+
+def start_inspection():
+  """Starts recording the inputs. Any previous recording is discarded."""
+  global _files, _listings, _task_regen_files, _probes
+  _files = set()
+  _listings = {}
+  _task_regen_files = set()
+  _probes = {}
+  for module, attribute, name in _WRAPPED_PROBE_FUNCTIONS:
+    setattr(module, attribute, _wrap_probe_function(name))
+
+
+def stop_inspection():
+  """Stops recording the inputs.
+
+  Returns a tuple of the files read, the regen dependencies among them, the
+  directory listings read, and the probes.
+  """
+  global _files, _listings, _task_regen_files, _probes
+  for module, attribute, name in _WRAPPED_PROBE_FUNCTIONS:
+    setattr(module, attribute, _probe_functions[name])
+  result = (_files, _task_regen_files, _listings, _probes)
+  _files = None
+  _listings = None
+  _task_regen_files = None
+  _probes = None
+  return result
+
+
+def is_inspecting():
+  return _files is not None
+
+
+def add_files(*paths):
+  """Records that the files at |paths| are read.
+
+  The files are recorded as regen dependencies too.
+  """
+  paths = [os.path.normpath(path) for path in paths]
+  if _files is None:
+    _regen_files.update(paths)
+    return
+  _files.update(paths)
+  _task_regen_files.update(paths)
+
+
+def add_scanned_files(*paths):
+  """Records that the files at |paths| are read, but not as regen dependencies.
+
+  This is for files which are scanned for information that only changes
+  rarely, such as the tracking tag of every source file, where rerunning
+  configure whenever such a file is edited would be too costly.
+  """
+  if _files is None:
+    return
+  _files.update(os.path.normpath(path) for path in paths)
+
+
+def add_regen_files(paths):
+  """Merges the regen dependencies returned by stop_inspection()."""
+  _regen_files.update(paths)
+
+
+def get_regen_files():
+  """Returns the set of the regen dependencies recorded so far."""
+  return set(_regen_files)
+
+
+def add_file_listing(query, result):
+  """Records that a directory listing is read.
+
+  |query| is the dict of keyword arguments passed to
+  build_common.find_all_files, and |result| is the list of files it returned.
+  Only a digest of the result is kept.
+  """
+  if _listings is None:
+    return
+  key = repr(sorted(query.iteritems()))
+  _listings[key] = (query, compute_listing_digest(result))
+
+
+def compute_listing_digest(result):
+  return hashlib.sha1('\n'.join(result)).hexdigest()
+
+
+def register_probe_function(name, function):
+  """Registers |function| to evaluate the probes named |name| again."""
+  _probe_functions[name] = function
+
+
+def add_probe(name, args, result):
+  """Records that the probe |name| called with |args| returned |result|.
+
+  The probe is kept as a dict from (|name|, |args|) to |result|, so |args|
+  must be a tuple of hashable values.
+  """
+  if _probes is None:
+    return
+  _probes[(name, args)] = result
+
+
+def evaluate_probe(name, args):
+  """Returns the result of the probe |name| called with |args| now."""
+  return _probe_functions[name](*args)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tests for dependency_inspection."""
+
+import os
+import unittest
+
+import dependency_inspection
+
+
+class DependencyInspectionTest(unittest.TestCase):
+  def setUp(self):
+    self._original_regen_files = dependency_inspection.get_regen_files()
+
+  def tearDown(self):
+    dependency_inspection._regen_files = self._original_regen_files
+
+  def test_regen_files_outside_task(self):
+    dependency_inspection.add_files('src/foo/./config.py')
+    dependency_inspection.add_scanned_files('src/foo/foo.c')
+    regen_files = dependency_inspection.get_regen_files()
+    self.assertIn('src/foo/config.py', regen_files)
+    self.assertNotIn('src/foo/foo.c', regen_files)
+
+  def test_regen_files_in_task(self):
+    dependency_inspection.start_inspection()
+    dependency_inspection.add_files('src/foo/Android.mk')
+    dependency_inspection.add_scanned_files('src/foo/foo.c')
+    files, regen_files, _, _ = dependency_inspection.stop_inspection()
+    self.assertEquals(set(['src/foo/Android.mk', 'src/foo/foo.c']), files)
+    self.assertEquals(set(['src/foo/Android.mk']), regen_files)
+    # The files recorded in a task are merged by the caller.
+    self.assertNotIn('src/foo/Android.mk',
+                     dependency_inspection.get_regen_files())
+    dependency_inspection.add_regen_files(regen_files)
+    self.assertIn('src/foo/Android.mk',
+                  dependency_inspection.get_regen_files())
+
+  def test_probes(self):
+    original_exists = os.path.exists
+    dependency_inspection.start_inspection()
+    os.path.exists('/nonexistent')
+    dependency_inspection.add_probe('staging.as_real_path', ('src/foo',),
+                                    'mods/foo')
+    _, _, _, probes = dependency_inspection.stop_inspection()
+    self.assertIs(original_exists, os.path.exists)
+    self.assertEquals({('os.path.exists', ('/nonexistent',)): False,
+                       ('staging.as_real_path', ('src/foo',)): 'mods/foo'},
+                      probes)
+    self.assertFalse(dependency_inspection.evaluate_probe(
+        'os.path.exists', ('/nonexistent',)))
+
+
+if __name__ == '__main__':
+  unittest.main()
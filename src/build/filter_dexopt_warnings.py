@@ -24,7 +24,12 @@ my_filter = warning_filter.WarningFilter('|'.join([
     _AMBIGUOUS_CLASS % 'java/lang/Object',
     _AMBIGUOUS_CLASS % 'java/lang/reflect/AccessibleObject']))
 
-p = filtered_subprocess.Popen(sys.argv[1:])
-p.run_process_filtering_output(my_filter)
 
-sys.exit(p.returncode)
+def main():
+  p = filtered_subprocess.Popen(sys.argv[1:])
+  p.run_process_filtering_output(my_filter)
+  return p.returncode
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -22,7 +22,12 @@ my_filter = warning_filter.WarningFilter(
     r'Note: .* uses unchecked or unsafe operations\.',
     r'Note: Recompile with -Xlint:unchecked for details\.')
 
-p = filtered_subprocess.Popen(sys.argv[1:])
-p.run_process_filtering_output(my_filter)
 
-sys.exit(p.returncode)
+def main():
+  p = filtered_subprocess.Popen(sys.argv[1:])
+  p.run_process_filtering_output(my_filter)
+  return p.returncode
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -13,32 +13,29 @@
 # is updated.  So that the build system can stop re-building a dependant that is
 # dynamically linked to the shared library.
 #
+# Pairs of an input and an output can be passed to make the table of contents
+# of many shared libraries in one process.
+#
 
 import errno
-import subprocess
 import sys
 
 import build_common
-import toolchain
+from util import elf_symbols
 
 
-def make_table_of_contents(target, input_so_path):
-  # List only external dynamic symbol as implied by '-g' and '-D'.
-  # Use posix format of output that implied by '-f','p' as it is easiest to
-  # parse for our usage.
-  external_symbols = subprocess.check_output([
-      toolchain.get_tool(target, 'nm'), '-gD', '-f', 'p', input_so_path
-  ])
+def make_table_of_contents(input_so_path):
+  # List only external dynamic symbols, as 'nm -gD' does.
   symbols = []
-  for line in external_symbols.splitlines():
-    # |line| should contain:
-    # <symbol name> <symbol type> <address>
+  for symbol in elf_symbols.get_symbols(input_so_path, dynamic=True):
+    if not elf_symbols.is_external(symbol):
+      continue
     # Put symbol names and symbol types into the TOC file.
-    # Drop address part since its modification does not require relinking for
+    # Drop addresses since their modification does not require relinking for
     # binaries that are dynamically linked agaist |input_so_path|.
-    symbols.append(' '.join(line.split(' ')[:2]))
+    symbols.append('%s %s' % (symbol.name, symbol.nm_type))
 
-  return '\n'.join(symbols)
+  return '\n'.join(sorted(symbols))
 
 
 def should_update_toc_file(toc, output_toc_path):
@@ -58,16 +55,13 @@ def should_update_toc_file(toc, output_toc_path):
 
 
 def main(args):
-  if len(args) != 3:
+  if not args or len(args) % 2:
     return -1
 
-  target = args[0]
-  input_so_path = args[1]
-  output_toc_path = args[2]
-  toc = make_table_of_contents(target, input_so_path)
-
-  if should_update_toc_file(toc, output_toc_path):
-    build_common.write_atomically(output_toc_path, toc)
+  for input_so_path, output_toc_path in zip(args[::2], args[1::2]):
+    toc = make_table_of_contents(input_so_path)
+    if should_update_toc_file(toc, output_toc_path):
+      build_common.write_atomically(output_toc_path, toc)
   return 0
 
 
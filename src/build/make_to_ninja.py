@@ -7,15 +7,23 @@
 # TODO(igorc): Support codegen rules. Perhaps needs a rework to parse resulting
 # commands rather than dumping variable names.
 
+import collections
+import hashlib
+import json
 import os
 import re
 import shlex
 import shutil
 import stat
 import subprocess
+import sys
 import tarfile
+import traceback
+import zlib
 
 import build_common
+import configure_cache
+import dependency_inspection
 import ninja_generator
 import staging
 import toolchain
@@ -63,9 +71,28 @@ _CANNED_GEN_SOURCES_TAR = os.path.join(
 _VARS_PREFIX = '=== VARIABLES FOR: '
 _VAR_PREFIX = '=== VARIABLE '
 _READING_MAKEFILE_PREFIX = 'Reading makefile '
+# Make 3.81 quotes the name as `name', and later versions as 'name'.
+_READING_MAKEFILE_RE = re.compile(r"^Reading makefile [`'](.*?)'")
+# Make prints this line with --debug=v after it has read all makefiles.
+_UPDATING_MAKEFILES_PREFIX = 'Updating makefiles'
+# Printed before including each Android.mk, to split the output of make.
+_MAKEFILE_PREFIX = '=== MAKEFILE: '
 
 _TARGET_MAKEFILE = 'TARGET_MAKEFILE'
 
+# The output of make is cached here. The directory is shared by all targets,
+# as the cache key contains everything which differs between them.
+_MAKE_CACHE_DIR = os.path.join(build_common.OUT_DIR, 'make_to_ninja_cache')
+_MAKE_CACHE_MANIFESTS_DIR = os.path.join(_MAKE_CACHE_DIR, 'manifests')
+_MAKE_CACHE_OBJECTS_DIR = os.path.join(_MAKE_CACHE_DIR, 'objects')
+# The least recently used entries are removed beyond this size.
+_MAKE_CACHE_MAX_SIZE = 512 * 1024 * 1024
+# Bump this when the format of the cache entries changes.
+_MAKE_CACHE_VERSION = 2
+
+# The number of make processes run, see get_make_process_count().
+_make_process_count = 0
+
 # Android build system (make) will use default behavior (empty values)
 # when variables are not set. We are enabling those as warnings and turning
 # them into script errors. This allows us to produce warnings when new unknown
@@ -347,7 +374,7 @@ printvars:
     f.write(contents)
 
 
-def _create_main_makefile(file_name, extra_env_vars):
+def _create_main_makefile(file_names, extra_env_vars):
   _ENV_VARS = {
       'ANDROID_BUILD_TOP': _ARC_ROOT,
       # TODO(crbug.com/233769): Renderscript is not enabled.
@@ -451,8 +478,6 @@ def _create_main_makefile(file_name, extra_env_vars):
         'WITH_JIT': 'false'}  # Android enables this by default on ARM only.
     _ENV_VARS.update(x86_vars)
 
-  abs_path = os.path.abspath(file_name)
-
   main_makefile = []
   # The real build/core/main.mk sets up various variables before
   # calling config.mk. We try to set most of the same vars here.
@@ -463,12 +488,19 @@ def _create_main_makefile(file_name, extra_env_vars):
   main_makefile.extend([
       'PWD:=.\n',
       'include $(BUILD_SYSTEM)/config.mk',
-      'include $(BUILD_SYSTEM)/definitions.mk',
-      '%s:=%s' % (_TARGET_MAKEFILE, file_name),
-      # Support direct use of sub-makefiles
-      # (they may expect LOCAL_PATH from parent)
-      'LOCAL_PATH:=$(dir %s)' % abs_path,
-      'include %s' % abs_path,
+      'include $(BUILD_SYSTEM)/definitions.mk'])
+  # Like the real Android build, all the files are included in one make
+  # process, after the common makefiles.
+  for file_name in file_names:
+    abs_path = os.path.abspath(file_name)
+    main_makefile.extend([
+        '$(info %s%s)' % (_MAKEFILE_PREFIX, file_name),
+        '%s:=%s' % (_TARGET_MAKEFILE, file_name),
+        # Support direct use of sub-makefiles
+        # (they may expect LOCAL_PATH from parent)
+        'LOCAL_PATH:=$(dir %s)' % abs_path,
+        'include %s' % abs_path])
+  main_makefile.extend([
       '.PHONY: droid',
       'droid:'])
   return '\n'.join(main_makefile)
@@ -648,6 +680,7 @@ def prepare_make_to_ninja():
   _create_tool_scripts()
 
   build_common.makedirs_safely(_MAKE_BUILD_DIR)
+  _remove_least_recently_used_make_cache()
 
 
 def _filter_make_output(stdout, stderr):
@@ -660,22 +693,162 @@ def _filter_make_output(stdout, stderr):
     errors.append('MAKE STDERR: ' + line)
   assert not errors, 'make exited with warnings: ' + '\n'.join(errors)
 
-  # Print and filter out "Reading makefile" lines from stdout if necessary.
-  result = []
+  # Split stdout into the output for each Android.mk. Filter out "Reading
+  # makefile" lines, and collect the makefiles from them. Print them if
+  # necessary.
+  common_makefiles = []
+  sections = {}
+  lines, makefiles = [], common_makefiles
   has_logging = OPTIONS.is_make_to_ninja_logging()
   for line in stdout.split('\n'):
-    if has_logging and line.startswith(_READING_MAKEFILE_PREFIX):
-      print line
+    if line.startswith(_MAKEFILE_PREFIX):
+      lines, makefiles = [], []
+      sections[line[len(_MAKEFILE_PREFIX):]] = (lines, makefiles)
+    elif line.startswith(_READING_MAKEFILE_PREFIX):
+      if has_logging:
+        print line
+      makefile = _resolve_makefile_path(_READING_MAKEFILE_RE.match(line))
+      if makefile:
+        makefiles.append(makefile)
+    elif line.startswith(_UPDATING_MAKEFILES_PREFIX):
+      # All the variables are printed while reading makefiles. The remaining
+      # lines are debug messages for updating the goal targets.
+      break
     elif line:
-      result.append(line)
+      lines.append(line)
 
-  return result
+  # The makefiles read before the first Android.mk, such as config.mk, are
+  # read for all of them.
+  return dict((file_name, (lines, common_makefiles + makefiles))
+              for file_name, (lines, makefiles) in sections.iteritems())
 
 
-def _run_make(in_file, extra_env_vars):
+def _resolve_makefile_path(match):
+  """Returns the path of the makefile read by make, relative to ARC root.
+
+  Returns None for the main makefile given from stdin.
+  """
+  if not match:
+    return None
+  name = match.group(1)
+  # Make looks up relative paths from its working directory, then from the
+  # include directory.
+  for path in (os.path.join(_MAKE_TO_NINJA_DIR, name),
+               os.path.join(_MAKE_BUILD_DIR, name)):
+    if os.path.isfile(path):
+      return os.path.relpath(path, _ARC_ROOT)
+  return None
+
+
+def _compute_make_cache_key(main_makefile, env, make_cmd):
+  # The main makefile contains the path to the Android.mk, the extra
+  # environment variables, and the target specific variables. |env| contains
+  # the toolchain.
+  return hashlib.sha1(repr((_MAKE_CACHE_VERSION, main_makefile,
+                            sorted(env.iteritems()), make_cmd))).hexdigest()
+
+
+def _compute_make_tree_digest(in_file):
+  # Android.mk often lists the sources using $(wildcard) or $(shell find), which
+  # make does not report. Assume they look only under the directory of the
+  # Android.mk.
+  return dependency_inspection.compute_listing_digest(
+      build_common.find_all_files(os.path.dirname(in_file), use_staging=False,
+                                  include_tests=True))
+
+
+def _load_make_output(key, in_files):
+  """Returns the cached {in_file: (output lines, makefiles)} of make, or None.
+
+  The entry for |key| holds the outputs of all |in_files| evaluated by one
+  make process.
+  """
+  manifest_path = os.path.join(_MAKE_CACHE_MANIFESTS_DIR, key)
+  try:
+    with open(manifest_path) as f:
+      manifest = json.load(f)
+  except (IOError, ValueError):
+    return None
+  for path, digest in manifest['makefiles'].iteritems():
+    if configure_cache.get_file_digest(path) != digest:
+      return None
+  outputs = {}
+  for in_file in in_files:
+    entry = manifest['files'].get(in_file)
+    if not entry or _compute_make_tree_digest(in_file) != entry['tree']:
+      return None
+    object_path = os.path.join(_MAKE_CACHE_OBJECTS_DIR, entry['output'])
+    try:
+      with open(object_path, 'rb') as f:
+        output = zlib.decompress(f.read())
+    except (IOError, zlib.error):
+      return None
+    # Mark the object as recently used, see
+    # _remove_least_recently_used_make_cache.
+    os.utime(object_path, None)
+    outputs[in_file] = (output.split('\n') if output else [],
+                        [str(path) for path in entry['makefiles']])
+  os.utime(manifest_path, None)
+  return outputs
+
+
+def _store_make_output(key, outputs):
+  """Stores |outputs|, {in_file: (output lines, makefiles)}, for |key|."""
+  build_common.makedirs_safely(_MAKE_CACHE_OBJECTS_DIR)
+  build_common.makedirs_safely(_MAKE_CACHE_MANIFESTS_DIR)
+  all_makefiles = set()
+  files = {}
+  for in_file, (result, makefiles) in outputs.iteritems():
+    output = '\n'.join(result)
+    # The output is stored by its digest so that identical outputs, e.g. for
+    # the same Android.mk on different branches, share the storage.
+    output_digest = hashlib.sha1(output).hexdigest()
+    object_path = os.path.join(_MAKE_CACHE_OBJECTS_DIR, output_digest)
+    if os.path.exists(object_path):
+      os.utime(object_path, None)
+    else:
+      build_common.write_atomically(object_path, zlib.compress(output))
+    files[in_file] = {
+        'makefiles': sorted(makefiles),
+        'output': output_digest,
+        'tree': _compute_make_tree_digest(in_file),
+    }
+    all_makefiles.update(makefiles)
+  manifest = {
+      'files': files,
+      'makefiles': dict((path, configure_cache.get_file_digest(path))
+                        for path in all_makefiles),
+  }
+  build_common.write_atomically(
+      os.path.join(_MAKE_CACHE_MANIFESTS_DIR, key),
+      json.dumps(manifest, sort_keys=True))
+
+
+def _remove_least_recently_used_make_cache():
+  """Removes old cache entries until the total size is under the limit."""
+  entries = []
+  total_size = 0
+  for dirname in (_MAKE_CACHE_MANIFESTS_DIR, _MAKE_CACHE_OBJECTS_DIR):
+    if not os.path.isdir(dirname):
+      continue
+    for name in os.listdir(dirname):
+      path = os.path.join(dirname, name)
+      stat_result = os.stat(path)
+      entries.append((stat_result.st_mtime, stat_result.st_size, path))
+      total_size += stat_result.st_size
+  if total_size <= _MAKE_CACHE_MAX_SIZE:
+    return
+  # A manifest whose output is removed is just a cache miss.
+  for _, size, path in sorted(entries):
+    build_common.remove_file_force(path)
+    total_size -= size
+    if total_size <= _MAKE_CACHE_MAX_SIZE:
+      break
+
+
+def _get_make_env():
   target = OPTIONS.target()
-  main_makefile = _create_main_makefile(in_file, extra_env_vars)
-  env = {
+  return {
       'CXX': toolchain.get_tool(target, 'cxx'),
       'CC': toolchain.get_tool(target, 'cc'),
       'LD': toolchain.get_tool(target, 'ld'),
@@ -691,13 +864,35 @@ def _run_make(in_file, extra_env_vars):
       'PATH': ':'.join([_MAKE_TO_NINJA_BIN_DIR, os.environ['PATH']])
   }
 
-  make_cmd = [
+
+def _get_make_cmd():
+  return [
       'make', '-f', '-', '-I', _MAKE_BUILD_DIR, '--always-make',
       '--silent', '--no-print-directory', '--warn-undefined-variables',
-      '--no-builtin-rules']
+      '--no-builtin-rules',
+      # Indicates when Make reads makefiles. The makefiles are recorded as
+      # the inputs of configure.
+      '--debug=v']
+
+
+def get_make_process_count():
+  """Returns the number of make processes run so far in this process."""
+  return _make_process_count
+
+
+def _run_make_process(in_files, extra_env_vars):
+  """Runs make for all |in_files| at once.
+
+  Returns a dict from each of |in_files| to a tuple of the output lines and
+  the makefiles make read for it.
+  """
+  global _make_process_count
+  _make_process_count += 1
+  main_makefile = _create_main_makefile(in_files, extra_env_vars)
+  env = _get_make_env()
+  make_cmd = _get_make_cmd()
 
   if OPTIONS.is_make_to_ninja_logging():
-    make_cmd.append('--debug=v')  # Indicates when Make reads makefiles.
     print 'Running make like this:'
     print ('$ cd %s; cat <<"EOF" > /tmp/makefile\n%s\nEOF\ncat /tmp/makefile | '
            'env %s %s' %
@@ -712,6 +907,54 @@ def _run_make(in_file, extra_env_vars):
   return _filter_make_output(*p.communicate(main_makefile))
 
 
+def _run_make_batch(in_files, extra_env_vars):
+  """Returns a dict from each of |in_files| to the output lines of make.
+
+  The files are evaluated by a single make process, so that the large common
+  makefiles are read only once for all of them.  As an Android.mk may see the
+  variables set by the ones included before it, the output for a file in a
+  batch may differ from the one for the file alone.  So the output of a batch
+  is cached by the batch, i.e. the list of the files evaluated together, and
+  only the output of a single file is looked up for each file.
+  """
+  env = _get_make_env()
+  make_cmd = _get_make_cmd()
+  outputs = {}
+  missing_files = []
+  for in_file in in_files:
+    cached = _load_make_output(_compute_make_cache_key(
+        _create_main_makefile([in_file], extra_env_vars), env, make_cmd),
+        [in_file])
+    if cached:
+      outputs.update(cached)
+      if OPTIONS.is_make_to_ninja_logging():
+        print 'Using the cached output of make for ' + in_file
+    else:
+      missing_files.append(in_file)
+
+  if missing_files:
+    missing_files.sort()
+    cache_key = _compute_make_cache_key(
+        _create_main_makefile(missing_files, extra_env_vars), env, make_cmd)
+    results = _load_make_output(cache_key, missing_files)
+    if results:
+      if OPTIONS.is_make_to_ninja_logging():
+        print 'Using the cached output of make for ' + ' '.join(missing_files)
+    else:
+      results = _run_make_process(missing_files, extra_env_vars)
+      _store_make_output(cache_key, results)
+    outputs.update(results)
+
+  for in_file, (_, makefiles) in outputs.iteritems():
+    dependency_inspection.add_files(in_file, *makefiles)
+  return dict((in_file, result)
+              for in_file, (result, _) in outputs.iteritems())
+
+
+def _run_make(in_file, extra_env_vars):
+  return _run_make_batch([in_file], extra_env_vars)[in_file]
+
+
 def _filter_var_name(name):
   # If variable name starts with one of our prefixes, ignore. Too many
   # variants of these prefixed inheritance variables.
@@ -1411,6 +1654,16 @@ class MakeVars:
     self._check_c_library_or_executable()
     self._force_optimization = True
 
+  def enable_jumbo(self, exclude=None):
+    """Compiles the sources in jumbo source files with --enable-jumbo-build.
+
+    The sources matching the fnmatch patterns in |exclude| are compiled
+    separately.
+    """
+    self._check_c_library_or_executable()
+    self.get_generator_args()['enable_jumbo'] = True
+    self.get_generator_args()['jumbo_exclude'] = exclude
+
   def get_aapt_flags(self):
     self._check_package()
     return self._aapt_flags
@@ -2066,6 +2319,10 @@ class MakefileNinjaTranslator:
   # List of all make-to-ninja translators ever created.
   _all_translators = []
 
+  # While batching, translators whose generate() is called are kept here, and
+  # they run make together in finish_batch(). See start_batch().
+  _pending_translators = None
+
   def __init__(self, in_file, extra_env_vars=None, build_as_target_libs=None):
     """Initializes MakefileNinjaTranslator.
 
@@ -2111,11 +2368,59 @@ class MakefileNinjaTranslator:
     if filter is not None:
       self.transform(filter)
     self._done_setting_up = True
-    self._generate()
+    if MakefileNinjaTranslator._pending_translators is not None:
+      # Errors found in finish_batch() are reported with this call site.
+      self._generate_stack = traceback.extract_stack(limit=8)[:-1]
+      MakefileNinjaTranslator._pending_translators.append(self)
+    else:
+      self._generate()
     return self
 
+  @staticmethod
+  def start_batch():
+    """Starts batching the translations.
+
+    Until finish_batch() is called, generate() only records the translator.
+    finish_batch() runs a single make process for all the recorded
+    translators, and generates their ninja files. ninja_generator_runner
+    batches the translations in each generate_ninjas task.
+    """
+    # Drop the translators left by a failed task.
+    MakefileNinjaTranslator._pending_translators = []
+
+  @staticmethod
+  def finish_batch():
+    """Generates the translators recorded since start_batch()."""
+    translators = MakefileNinjaTranslator._pending_translators
+    MakefileNinjaTranslator._pending_translators = None
+    MakefileNinjaTranslator._read_modules_in_batch(translators)
+    for translator in translators:
+      try:
+        translator._generate()
+      except Exception:
+        translator._reraise_with_call_site()
+
+  def _reraise_with_call_site(self):
+    """Re-raises the current exception with where generate() was called.
+
+    The translators recorded while batching are generated after the function
+    calling generate() returns, so the traceback alone does not tell which
+    translation failed.
+    """
+    _, error, tb = sys.exc_info()
+    raise Exception(
+        '%s\nwhile translating %s for generate() called at:\n%s' % (
+            error, self._in_file,
+            ''.join(traceback.format_list(self._generate_stack)))), None, tb
+
   def _build_vars_list(self):
     if self._vars_list is None:
+      pending = MakefileNinjaTranslator._pending_translators
+      if pending and self in pending:
+        # The result is needed before finish_batch(). Read the modules of all
+        # the pending translators now.
+        MakefileNinjaTranslator._read_modules_in_batch(pending)
+        return
       if OPTIONS.verbose():
         print 'Converting ' + self._in_file
       self._vars_list = MakefileNinjaTranslator._read_modules(
@@ -2195,8 +2500,43 @@ class MakefileNinjaTranslator:
 
   @staticmethod
   def _read_modules(file_name, extra_env_vars, build_as_target_libs):
-    make_output_lines = _run_make(file_name, extra_env_vars)
+    return MakefileNinjaTranslator._parse_modules(
+        _run_make(file_name, extra_env_vars), build_as_target_libs)
+
+  @staticmethod
+  def _read_modules_in_batch(translators):
+    """Reads the modules for |translators| running as few make as possible."""
+    # Extra environment variables apply to the whole make process, so
+    # only the translators sharing them can be read together.
+    groups = collections.defaultdict(list)
+    for translator in translators:
+      if translator._vars_list is None:
+        env_vars = sorted((translator._extra_env_vars or {}).iteritems())
+        groups[repr(env_vars)].append(translator)
+    for group in groups.itervalues():
+      if OPTIONS.verbose():
+        print 'Converting ' + ' '.join(t._in_file for t in group)
+      in_files = sorted(set(t._in_file for t in group))
+      try:
+        outputs = _run_make_batch(in_files, group[0]._extra_env_vars)
+      except AssertionError:
+        if len(in_files) == 1:
+          group[0]._reraise_with_call_site()
+        # Make warned about one of the files. Run them one by one so that the
+        # error is reported with the translation causing it.
+        outputs = {}
+        for translator in group:
+          try:
+            outputs.update(_run_make_batch([translator._in_file],
+                                           translator._extra_env_vars))
+          except AssertionError:
+            translator._reraise_with_call_site()
+      for translator in group:
+        translator._vars_list = MakefileNinjaTranslator._parse_modules(
+            outputs[translator._in_file], translator._build_as_target_libs)
 
+  @staticmethod
+  def _parse_modules(make_output_lines, build_as_target_libs):
     vars_list = []
     build_type = ''
     build_file = ''
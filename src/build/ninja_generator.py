@@ -5,19 +5,22 @@
 # TODO(crbug.com/312571): The class name suffix XxxNinjaGenerator looks
 # redundant. Rename NinjaGenerator family into simpler one.
 
+import array
 import collections
 import copy
 import fnmatch
 import hashlib
 import json
 import logging
+import multiprocessing
 import re
 import os
 import StringIO
 import sys
 
-import analyze_diffs
 import build_common
+import dependency_inspection
+import notice_index
 import open_source
 import pipes
 import staging
@@ -28,6 +31,7 @@ from build_common import find_all_files
 from build_options import OPTIONS
 from ninja_generator_runner import request_run_in_parallel
 from notices import Notices
+from util import concurrent
 
 # Pull in ninja_syntax from our tools/ninja directory.
 sys.path.insert(0, 'third_party/tools/ninja/misc')
@@ -36,6 +40,126 @@ import ninja_syntax
 # Extensions of primary source files.
 _PRIMARY_EXTENSIONS = ['.c', '.cpp', '.cc', '.java', '.S', '.s']
 
+# Flags added to ninjas which are at least this long are defined in
+# build.ninja and shared if two or more ninjas use them. See
+# NinjaGenerator._intern_flags().
+_MIN_SHARED_FLAGS_LENGTH = 256
+
+# The maximum total size in bytes of the sources included in a jumbo source
+# file. See CNinjaGenerator._build_jumbo().
+_JUMBO_MAX_GROUP_SIZE = 256 * 1024
+
+# The approximate memory in MB a step in each ninja pool uses. The default
+# depths of the pools are computed from them. See _get_ninja_pool_depths().
+_NINJA_POOL_MEMORY_MB = {
+    'aapt': 512,
+    'dexopt': 512,
+    # dx runs in this pool too, with a heap of up to 1.5GB.
+    'javac': 1536,
+    'link': 1024,
+}
+
+# The languages of the compiler rules which can use a precompiled header.
+_PRECOMPILED_HEADER_LANGUAGES = {
+    'cc': 'c', 'clang': 'c', 'cxx': 'c++', 'clangxx': 'c++'}
+
+
+def _memoize_flags(func):
+  """Memoizes the flags computed by |func| while OPTIONS is unchanged."""
+  cache = {}
+
+  def wrapper(*args):
+    options = OPTIONS.get_all_values()
+    entry = cache.get(args)
+    if entry is None or entry[0] != options:
+      entry = (options, func(*args))
+      cache[args] = entry
+    return entry[1]
+  return wrapper
+
+
+# Matches a reference to a ninja variable, or an escape sequence such as '$$'.
+_NINJA_VARIABLE_PATTERN = re.compile(
+    r'\$(?:\{([a-zA-Z0-9_.-]+)\}|([a-zA-Z0-9_-]+)|(.))', re.DOTALL)
+
+
+def _expand_ninja_variables(value, lookup, final=False):
+  """Expands the references to ninja variables in |value|.
+
+  |lookup| returns the value of a variable, or None if it is not defined.
+  Unless |final| is set, the references to undefined variables and the escape
+  sequences are kept, so that they can be expanded later in the enclosing
+  scope.  Otherwise they are expanded as ninja does.
+  """
+  def replace(match):
+    name = match.group(1) or match.group(2)
+    if name is None:
+      return match.group(3) if final else match.group(0)
+    result = lookup(name)
+    if result is None:
+      return '' if final else match.group(0)
+    return result
+  return _NINJA_VARIABLE_PATTERN.sub(replace, value)
+
+
+# Rules whose outputs are restored from the artifact cache when the command
+# line and the inputs are unchanged. See artifact_cache.py.
+_ARTIFACT_CACHED_RULES = ['aapt_package', 'dex_preopt', 'dx', 'javac',
+                          'llvm_rs_cc']
+
+
+def _get_artifact_cached_rule(command, outputs='$out', inputs='$in'):
+  """Returns the keyword arguments of rule() to run |command|.
+
+  |command| is wrapped with artifact_cache.py if --artifact-cache-dir is set.
+  |outputs| and |inputs| are the files and directories |command| writes and
+  reads.  $cache_inputs, which NinjaGenerator.build() sets to the implicit
+  dependencies, is added to |inputs|.  The command is passed to
+  artifact_cache.py in the response file $cache_command_file, so that the
+  values of the variables ninja expands in it are not quoted again for the
+  shell.
+  """
+  if not OPTIONS.artifact_cache_dir():
+    return dict(command=command)
+  return dict(
+      command=('src/build/artifact_cache.py run --cache-dir %s --max-size %d '
+               '--outputs %s --inputs %s $cache_inputs '
+               '--command-file $cache_command_file' % (
+                   pipes.quote(os.path.abspath(OPTIONS.artifact_cache_dir())),
+                   OPTIONS.artifact_cache_size(), outputs, inputs)),
+      rspfile='$cache_command_file',
+      rspfile_content=command)
+
+
+def _get_cache_inputs(implicit, cache_inputs):
+  """Returns the sorted inputs of an artifact cached build edge.
+
+  The files in the directories in |cache_inputs|, such as the resource files
+  of aapt, are hashed with the directories, so they are not listed again.
+  This keeps the command line short.
+  """
+  directories = tuple(path.rstrip(os.sep) + os.sep for path in cache_inputs)
+  return sorted(set(cache_inputs) | set(
+      path for path in implicit if not path.startswith(directories)))
+
+
+def _get_ninja_pool_depths():
+  """Returns a dict from the ninja pools to their depths.
+
+  Memory-heavy steps such as links run in the pools, so that running many of
+  them at once does not make the machine swap, while compiles run with full
+  parallelism.  Each pool may use up to half of the RAM, and may not run more
+  steps than the CPUs.  --ninja-pools overrides the depths.
+  """
+  cpu_count = multiprocessing.cpu_count()
+  memory_mb = (os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') /
+               (1024 * 1024))
+  depths = {}
+  for pool, job_memory_mb in _NINJA_POOL_MEMORY_MB.iteritems():
+    depths[pool] = max(1, min(cpu_count, memory_mb / 2 / job_memory_mb))
+  depths.update(OPTIONS.get_ninja_pool_depths())
+  return depths
+
 
 def get_libgcc_for_bare_metal():
   return os.path.join(build_common.get_build_dir(),
@@ -88,14 +212,87 @@ def get_libgcc_for_bionic():
   return map(staging.third_party_to_staging, _get_libgcc_for_bionic_realpath())
 
 
+class _PathTable(object):
+  """Interns paths as integer IDs.
+
+  The build rule bookkeeping refers to the paths by the IDs so that each
+  path string is kept only once.  The IDs are local to the process.
+  """
+
+  def __init__(self):
+    self._path_to_id = {}
+    self._paths = []
+
+  def get_ids(self, paths):
+    """Returns an array of the IDs of |paths|, assigning new IDs if needed."""
+    result = array.array('i')
+    for path in paths:
+      path_id = self._path_to_id.get(path)
+      if path_id is None:
+        path_id = len(self._paths)
+        self._path_to_id[path] = path_id
+        self._paths.append(path)
+      result.append(path_id)
+    return result
+
+  def get_paths(self, path_ids):
+    return [self._paths[path_id] for path_id in path_ids]
+
+
+_path_table = _PathTable()
+
+
+class _PathIdSet(object):
+  """A set of path IDs, backed by a bitset."""
+
+  def __init__(self):
+    self._bits = bytearray()
+
+  def add_ids(self, path_ids):
+    if not path_ids:
+      return
+    bits = self._bits
+    size = (max(path_ids) >> 3) + 1
+    if len(bits) < size:
+      bits.extend(bytearray(size - len(bits)))
+    for path_id in path_ids:
+      bits[path_id >> 3] |= 1 << (path_id & 7)
+
+  def get_ids(self):
+    """Returns the list of IDs in this set."""
+    return self.get_ids_not_in(_PathIdSet())
+
+  def get_ids_not_in(self, other):
+    """Returns the list of IDs in this set but not in |other|."""
+    result = []
+    other_bits = other._bits
+    other_size = len(other_bits)
+    for index, byte in enumerate(self._bits):
+      if index < other_size:
+        byte &= ~other_bits[index]
+      if not byte:
+        continue
+      for bit in xrange(8):
+        if byte & (1 << bit):
+          result.append((index << 3) | bit)
+    return result
+
+
 class _TargetGroupInfo(object):
   def __init__(self):
-    self.outputs = set()
-    self.inputs = set()
+    self.outputs = _PathIdSet()
+    self.inputs = _PathIdSet()
+    # All the outputs, recorded only for --logging=target-groups.
+    self.all_outputs = _PathIdSet()
     self.required_target_groups = set()
 
   def get_root_set(self):
-    return self.outputs - self.inputs
+    return set(_path_table.get_paths(self.outputs.get_ids_not_in(self.inputs)))
+
+  def get_all_output_root_set(self):
+    """Returns the roots computed from all the outputs of the build rules."""
+    return set(_path_table.get_paths(
+        self.all_outputs.get_ids_not_in(self.inputs)))
 
 
 class _TargetGroups(object):
@@ -116,17 +313,45 @@ class _TargetGroups(object):
     self._allowed.add(target_group)
     self._map[target_group].required_target_groups = as_list(required)
 
-  def record_build_rule(self, target_groups, outputs, inputs):
-    """Remembers the build rule for later writing target group rule."""
+  def record_target_group_roots(self, target_group_roots):
+    """Remembers the roots of a ninja for later writing target group rule.
+
+    |target_group_roots| is what NinjaGenerator.get_target_group_roots()
+    returns.
+    """
     if self._started_emitting:
       return
+    target_groups = set(target_group_roots)
     if not target_groups <= self._allowed:
       raise Exception('Unexpected target groups: %s' %
                       (target_groups - self._allowed))
-    for target_group in target_groups:
+    for target_group, (outputs, inputs) in target_group_roots.iteritems():
       my_info = self._map[target_group]
-      my_info.outputs |= outputs
-      my_info.inputs |= inputs
+      my_info.outputs.add_ids(_path_table.get_ids(outputs))
+      my_info.inputs.add_ids(_path_table.get_ids(inputs))
+
+  def record_target_group_outputs(self, target_group_outputs):
+    """Remembers all the outputs of a ninja to verify the roots.
+
+    |target_group_outputs| is what NinjaGenerator.get_target_group_outputs()
+    returns.
+    """
+    if self._started_emitting:
+      return
+    for target_group, outputs in target_group_outputs.iteritems():
+      self._map[target_group].all_outputs.add_ids(_path_table.get_ids(outputs))
+
+  def verify_roots(self):
+    """Checks the roots against the ones computed from all the outputs."""
+    for tg, tgi in self._map.iteritems():
+      roots = tgi.get_root_set()
+      expected_roots = tgi.get_all_output_root_set()
+      if roots != expected_roots:
+        raise Exception(
+            'The roots of target group %s differ from the ones computed from '
+            'all the build rules.\nMissing: %s\nUnexpected: %s' %
+            (tg, sorted(expected_roots - roots),
+             sorted(roots - expected_roots)))
 
   def emit_rules(self, n):
     self._started_emitting = True
@@ -259,12 +484,23 @@ class NinjaGenerator(ninja_syntax.Writer):
       ninja_path = ninja_name
     super(NinjaGenerator, self).__init__(StringIO.StringIO())
     NinjaGenerator._ninja_list.append(self)
+    # The variables defined at the top level of this file, and the commands
+    # of the rules defined in it. These are used to expand the compile
+    # commands. See CNinjaGenerator.get_compile_commands().
+    self._variables = {}
+    self._rule_commands = {}
     self._ninja_path = ninja_path
     self._base_path = base_path
     self._notices_only = notices_only
     self._implicit = as_list(implicit) + NinjaGenerator._default_implicit
     self._target_groups = NinjaGenerator._canonicalize_set(target_groups)
     self._build_rule_list = []
+    # Maps the names of the shared flag variables used in this ninja to their
+    # values. See _intern_flags().
+    self._shared_flags = {}
+    # The shared flags used only by this ninja, which are inlined when it is
+    # emitted. See TopLevelNinjaGenerator.emit_subninja_rules().
+    self._inline_shared_flags = {}
     self._root_dir_install_targets = []
     self._build_dir_install_targets = []
     self._notices = Notices()
@@ -277,17 +513,19 @@ class NinjaGenerator(ninja_syntax.Writer):
 
   @staticmethod
   def emit_common_rules(n):
+    symbol_tool = build_common.get_build_helper_command(
+        'src/build/symbol_tool.py')
     n.rule('copy_symbols_file',
-           'src/build/symbol_tool.py --clean $in > $out',
+           symbol_tool + ' --clean $in > $out',
            description='copy_symbols_file $in $out')
     n.rule('cp',
            'cp $in $out',
            description='cp $in $out')
     n.rule('dump_defined_symbols',
-           'src/build/symbol_tool.py --dump-defined $in > $out',
+           symbol_tool + ' --dump-defined $in > $out',
            description='dump_defined_symbols $in')
     n.rule('dump_undefined_symbols',
-           'src/build/symbol_tool.py --dump-undefined $in > $out',
+           symbol_tool + ' --dump-undefined $in > $out',
            description='dump_undefined_symbols $in')
     n.rule('install',
            'rm -f $out; cp $in $out',
@@ -302,8 +540,7 @@ class NinjaGenerator(ninja_syntax.Writer):
     n.rule('touch',
            'touch $out')
     n.rule('verify_disallowed_symbols',
-           ('src/build/symbol_tool.py --verify $in $disallowed_symbols && '
-            'touch $out'),
+           (symbol_tool + ' --verify $in $disallowed_symbols && touch $out'),
            description='verify_disallowed_symbols $out')
     # $command must create $out on success.
     n.rule('run_shell_command',
@@ -314,7 +551,8 @@ class NinjaGenerator(ninja_syntax.Writer):
     # Setting restat to True so that ninja can stop building its dependents
     # when the content is not modified.
     n.rule('mktoc',
-           'src/build/make_table_of_contents.py %s $in $out' % OPTIONS.target(),
+           '%s $in $out' % build_common.get_build_helper_command(
+               'src/build/make_table_of_contents.py'),
            description='make_table_of_contents $in',
            restat=True)
 
@@ -335,16 +573,119 @@ class NinjaGenerator(ninja_syntax.Writer):
       canon.add(_TargetGroups.DEFAULT)
     return canon
 
-  def emit(self):
-    """Emits the contents of ninja script to the file."""
-    with open(self._ninja_path, 'w') as f:
-      f.write(self.output.getvalue())
+  def emit(self, previous_state=None):
+    """Emits the contents of ninja script to the file.
+
+    |previous_state| is what emit() returned for the same file in the
+    previous configure. If the content is unchanged since then and the file is
+    not touched, the file is not rewritten so that ninja does not see a new
+    mtime. Returns the state of the file, a list of the content fingerprint,
+    mtime and size.
+    """
+    content = _inline_shared_flags(self.output.getvalue(),
+                                   self._inline_shared_flags)
+    fingerprint = hashlib.sha256(content).hexdigest()
+    if previous_state and previous_state[0] == fingerprint:
+      try:
+        stat_result = os.stat(self._ninja_path)
+        if [stat_result.st_mtime, stat_result.st_size] == previous_state[1:]:
+          return previous_state
+      except OSError:
+        pass
+    build_common.write_atomically(self._ninja_path, content)
+    stat_result = os.stat(self._ninja_path)
+    return [fingerprint, stat_result.st_mtime, stat_result.st_size]
+
+  def get_summary(self):
+    """Returns the NinjaSummary of this generator."""
+    return NinjaSummary(self)
+
+  def is_kind_of(self, generator_class):
+    return isinstance(self, generator_class)
+
+  def get_target_group_roots(self):
+    """Returns what this ninja contributes to the roots of target groups.
+
+    The roots of a target group are the outputs of its build rules which are
+    not inputs of its build rules in any ninja.  Returns a dict from each
+    target group to a tuple of the outputs which are not inputs of the build
+    rules in this ninja, and all the inputs of the build rules in this ninja.
+    Any output consumed by another ninja is one of the inputs of that ninja,
+    so subtracting the inputs of all the ninjas from the union of the former
+    gives the same roots as subtracting them from all the outputs.
+    """
+    outputs = collections.defaultdict(_PathIdSet)
+    inputs = collections.defaultdict(_PathIdSet)
+    for target_groups, rule_outputs, rule_inputs in self._build_rule_list:
+      for target_group in target_groups:
+        outputs[target_group].add_ids(rule_outputs)
+        inputs[target_group].add_ids(rule_inputs)
+    result = {}
+    for target_group in outputs:
+      roots = _path_table.get_paths(
+          outputs[target_group].get_ids_not_in(inputs[target_group]))
+      all_inputs = _path_table.get_paths(
+          inputs[target_group].get_ids())
+      result[target_group] = (set(roots), set(all_inputs))
+    return result
+
+  def get_target_group_outputs(self):
+    """Returns a dict from each target group to all its outputs in this ninja.
+
+    This is used only to verify the roots with --logging=target-groups.
+    """
+    result = collections.defaultdict(set)
+    for target_groups, rule_outputs, _ in self._build_rule_list:
+      for target_group in target_groups:
+        result[target_group].update(_path_table.get_paths(rule_outputs))
+    return dict(result)
+
+  def variable(self, key, value, indent=0):
+    # Indented variables are the bindings of rules and build edges.
+    if indent == 0 and value is not None:
+      if isinstance(value, list):
+        value = ' '.join(filter(None, value))
+      # Ninja expands the value when it reads the definition.
+      self._variables[key] = _expand_ninja_variables(value,
+                                                     self._variables.get)
+    return super(NinjaGenerator, self).variable(key, value, indent)
+
+  def rule(self, name, command, **kwargs):
+    self._rule_commands[name] = command
+    return super(NinjaGenerator, self).rule(name, command, **kwargs)
 
   def add_flags(self, key, *values):
     values = [pipes.quote(x) for x in values]
-    self.variable(key, '$%s %s' % (key, ' '.join(values)))
+    self.variable(key, '$%s %s' % (key, self._intern_flags(' '.join(values))))
     return self
 
+  def _intern_flags(self, flags):
+    """Returns a reference to a shared variable for long |flags|.
+
+    The same long flags, such as the include paths added by
+    emit_framework_common_flags(), are added by many ninjas.  The variable
+    name is derived from the flags so that the ninjas emitted in different
+    processes agree on it.  TopLevelNinjaGenerator defines the flags used by
+    two or more ninjas once in build.ninja, and the references to the others
+    are replaced with the flags, see set_inline_shared_flags().
+    """
+    # Variables in the flags must be expanded in the scope of this ninja.
+    if len(flags) < _MIN_SHARED_FLAGS_LENGTH or '$' in flags:
+      return flags
+    name = 'shared_flags_' + hashlib.sha1(flags).hexdigest()[:12]
+    self._shared_flags[name] = flags
+    return '$' + name
+
+  def get_shared_flags(self):
+    return self._shared_flags
+
+  def set_inline_shared_flags(self, shared_flags):
+    """Sets the shared flags to inline, as no other ninja uses them."""
+    self._inline_shared_flags = shared_flags
+
+  def get_compile_commands(self):
+    return []
+
   def is_host(self):
     return self._is_host
 
@@ -495,19 +836,26 @@ class NinjaGenerator(ninja_syntax.Writer):
       if (s.startswith(build_common.OUT_DIR) and
           not s.startswith(build_common.get_staging_root())):
         continue
-      if not os.path.exists(s):
-        continue
-      with open_dependency(s, 'r', ignore_dependency=True) as f:
-        tracking_file = analyze_diffs.compute_tracking_path(None, s, f)
-        if tracking_file:
-          sources_including_tracking.append(tracking_file)
+      # The tracking file is looked up in notice_index, so that the file is
+      # not read again when it is unchanged.
+      tracking_file = notice_index.get_tracking_path(s)
+      if tracking_file:
+        sources_including_tracking.append(tracking_file)
+      dependency_inspection.add_scanned_files(s)
     if OPTIONS.is_notices_logging():
       print 'Adding notice sources to %s: %s' % (self.get_module_name(),
                                                  sources_including_tracking)
     self._notices.add_sources(sources_including_tracking)
 
   def build(self, outputs, rule, inputs=None, variables=None,
-            implicit=None, order_only=None, use_staging=True, **kwargs):
+            implicit=None, order_only=None, use_staging=True,
+            cache_inputs=None, **kwargs):
+    """Emits a build edge.
+
+    |cache_inputs| lists the files and directories the outputs depend on
+    besides |inputs| and |implicit|, such as directories passed in flags.
+    It is used only for the rules in _ARTIFACT_CACHED_RULES.
+    """
     outputs = as_list(outputs)
     all_inputs = as_list(inputs)
     in_real_path = []
@@ -528,9 +876,15 @@ class NinjaGenerator(ninja_syntax.Writer):
     # if there are more than 5 inputs they'll be truncated when displayed
     # so truncate them now to save space in ninja files.
     variables['in_real_path'] = ' '.join(in_real_path[:5])
+    if rule in _ARTIFACT_CACHED_RULES and OPTIONS.artifact_cache_dir():
+      variables['cache_inputs'] = ' '.join(
+          _get_cache_inputs(implicit, as_list(cache_inputs)))
+      variables['cache_command_file'] = outputs[0] + '.command'
 
-    self._build_rule_list.append((self._target_groups, set(outputs),
-                                  set(as_list(implicit)) | set(all_inputs)))
+    # The paths are kept as IDs in _path_table to save memory.
+    self._build_rule_list.append((
+        self._target_groups, _path_table.get_ids(set(outputs)),
+        _path_table.get_ids(set(as_list(implicit)) | set(all_inputs))))
 
     self._check_implicit(rule, implicit)
     self._check_order_only(implicit, order_only)
@@ -580,6 +934,17 @@ class NinjaGenerator(ninja_syntax.Writer):
                 command=(driver_name + ' -MD -MF $out.d $' + flag_name +
                          ' ' + ' '.join(extra_flags) + ' -c $in -o $out'),
                 description=rule_name + ' $in_real_path')
+      language = _PRECOMPILED_HEADER_LANGUAGES.get(rule_prefix)
+      if language:
+        # Rule to precompile a header with the same flags as the sources.
+        # See CNinjaGenerator.set_precompiled_header().
+        self.rule(rule_prefix + '_pch.' + target,
+                  deps='gcc',
+                  depfile='$out.d',
+                  command=(driver_name + ' -MD -MF $out.d $' + flag_name +
+                           ' ' + ' '.join(extra_flags) + ' -x ' + language +
+                           '-header -c $in -o $out'),
+                  description=rule_name + '_pch $in_real_path')
     else:
       self.rule(rule_name,
                 command=(driver_name + ' $' + flag_name +
@@ -595,7 +960,8 @@ class NinjaGenerator(ninja_syntax.Writer):
     self.rule(rule_name,
               command=(driver_name + ' $' + flag_name + ' -o $out ' +
                        common_args),
-              description=rule_name + ' $out')
+              description=rule_name + ' $out',
+              pool='link_pool')
 
   def emit_ar_rule(self, rule_prefix, target):
     rule_name, driver_name = NinjaGenerator._get_name_and_driver(rule_prefix,
@@ -676,7 +1042,8 @@ class NinjaGenerator(ninja_syntax.Writer):
       undefined_symbol_file = os.path.join(
           self.get_symbols_path(), os.path.basename(object_file) + '.undefined')
       self.build([undefined_symbol_file], 'dump_undefined_symbols', object_file,
-                 implicit='src/build/symbol_tool.py')
+                 implicit=['src/build/symbol_tool.py',
+                           'src/build/util/elf_symbols.py'])
       for disallowed_symbol_file in disallowed_symbol_files:
         # Check the content of the |undefined_symbol_file|.
         disallowed_symbol_file_full = os.path.join(
@@ -694,7 +1061,7 @@ class NinjaGenerator(ninja_syntax.Writer):
     """Returns installed shared libs in the given ninja_list."""
     installed_shared_libs = []
     for ninja in ninja_list:
-      if not isinstance(ninja, SharedObjectNinjaGenerator):
+      if not ninja.is_kind_of(SharedObjectNinjaGenerator):
         continue
       for path in ninja.installed_shared_library_list:
         installed_shared_libs.append(build_common.get_build_dir() + path)
@@ -702,13 +1069,8 @@ class NinjaGenerator(ninja_syntax.Writer):
 
   def get_notices_install_path(self):
     """Pick a name for describing this generated artifact in NOTICE.html."""
-    if self._build_dir_install_targets:
-      result = self._build_dir_install_targets[0]
-    elif self._root_dir_install_targets:
-      result = self._root_dir_install_targets[0]
-    else:
-      return None
-    return result.lstrip(os.sep) + '.txt'
+    return _get_notices_install_path(self._build_dir_install_targets,
+                                     self._root_dir_install_targets)
 
   # TODO(crbug.com/366751): remove notice_archive hack when possible
   def set_notice_archive(self, notice_archive):
@@ -726,11 +1088,98 @@ class NinjaGenerator(ninja_syntax.Writer):
     return []
 
 
+def _get_notices_install_path(build_dir_install_targets,
+                              root_dir_install_targets):
+  if build_dir_install_targets:
+    result = build_dir_install_targets[0]
+  elif root_dir_install_targets:
+    result = root_dir_install_targets[0]
+  else:
+    return None
+  return result.lstrip(os.sep) + '.txt'
+
+
+class NinjaSummary(object):
+  """Keeps what configure needs to know about an emitted NinjaGenerator.
+
+  The ninja files generated in the worker processes are emitted there, and
+  only their summaries are sent back to the parent process.  This provides
+  the subset of the NinjaGenerator interface which the parent process uses.
+  """
+
+  def __init__(self, ninja):
+    self._generator_class = type(ninja)
+    self._module_name = ninja._module_name
+    self._ninja_name = ninja._ninja_name
+    self._ninja_path = ninja._ninja_path
+    self._is_host = ninja._is_host
+    self._root_dir_install_targets = ninja._root_dir_install_targets
+    self._build_dir_install_targets = ninja._build_dir_install_targets
+    self._notices = ninja._notices
+    self._notice_archive = ninja.get_notice_archive()
+    self._included_module_names = ninja.get_included_module_names()
+    self._target_group_roots = ninja.get_target_group_roots()
+    if OPTIONS.is_target_groups_logging():
+      self._target_group_outputs = ninja.get_target_group_outputs()
+    else:
+      self._target_group_outputs = None
+    self._shared_flags = ninja.get_shared_flags()
+    self._inline_shared_flags = {}
+    self._compile_commands = ninja.get_compile_commands()
+    # Set only for the generators which need them.
+    self._instances = getattr(ninja, '_instances', None)
+    self.installed_shared_library_list = getattr(
+        ninja, 'installed_shared_library_list', [])
+    # The state of the emitted file, see NinjaGenerator.emit().
+    self.emitted_state = None
+
+  def is_kind_of(self, generator_class):
+    return issubclass(self._generator_class, generator_class)
+
+  def get_module_name(self):
+    return self._module_name
+
+  def is_host(self):
+    return self._is_host
+
+  def is_installed(self):
+    return self._build_dir_install_targets or self._root_dir_install_targets
+
+  def get_notices_install_path(self):
+    return _get_notices_install_path(self._build_dir_install_targets,
+                                     self._root_dir_install_targets)
+
+  def get_notice_archive(self):
+    return self._notice_archive
+
+  def get_included_module_names(self):
+    return self._included_module_names
+
+  def get_shared_flags(self):
+    return self._shared_flags
+
+  def set_inline_shared_flags(self, shared_flags):
+    self._inline_shared_flags = shared_flags
+
+  def get_inline_shared_flags(self):
+    return self._inline_shared_flags
+
+  def get_compile_commands(self):
+    return self._compile_commands
+
+  def get_target_group_roots(self):
+    return self._target_group_roots
+
+  def get_target_group_outputs(self):
+    return self._target_group_outputs
+
+
 class CNinjaGenerator(NinjaGenerator):
   """Encapsulates ninja file generation for C and C++ files."""
 
   def __init__(self, module_name, ninja_name=None, enable_logtag_emission=True,
-               gl_flags=False, enable_clang=False, **kwargs):
+               gl_flags=False, enable_clang=False, enable_jumbo=False,
+               jumbo_exclude=None, **kwargs):
     super(CNinjaGenerator, self).__init__(module_name, ninja_name, **kwargs)
     # This is set here instead of TopLevelNinjaGenerator because the ldflags
     # depend on module name.
@@ -769,6 +1218,19 @@ class CNinjaGenerator(NinjaGenerator):
     self._shared_deps = []
     self._static_deps = []
     self._whole_archive_deps = []
+    # The list of (rule, source, output, bindings) of the compile edges.
+    self._compile_edges = []
+    # With --enable-jumbo-build, the C and C++ sources are compiled in jumbo
+    # source files, except the ones matching |jumbo_exclude|.
+    self._enable_jumbo = enable_jumbo
+    self._jumbo_exclude = as_list(jumbo_exclude)[:]
+    self._jumbo_count = 0
+    # The header set by set_precompiled_header(), the languages it is used
+    # for, and a dict from (rule, bindings) of compile edges to the paths of
+    # the header and the precompiled header for them.
+    self._precompiled_header = None
+    self._precompiled_header_languages = []
+    self._precompiled_headers = {}
 
   def __del__(self):
     if OPTIONS.verbose():
@@ -799,10 +1261,179 @@ class CNinjaGenerator(NinjaGenerator):
   def build_default(self, files, base_path='', **kwargs):
     if base_path == '':
       base_path = self._base_path
+    if self._is_jumbo_enabled():
+      files = self._build_jumbo(files, base_path, **kwargs)
     self.add_objects(build_default(
         self, base_path, files, **kwargs))
     return self
 
+  def add_jumbo_exclusions(self, *patterns):
+    """Excludes the sources matching the fnmatch |patterns| from jumbo builds.
+
+    The patterns are matched against the paths of the sources, e.g. files
+    which define the same static functions or macros as other files in the
+    same directory.
+    """
+    self._jumbo_exclude.extend(patterns)
+    return self
+
+  def _is_jumbo_enabled(self):
+    return (self._enable_jumbo and OPTIONS.enable_jumbo_build() and
+            not self._notices_only)
+
+  def _is_jumbo_excluded(self, path):
+    return any(fnmatch.fnmatch(path, pattern)
+               for pattern in self._jumbo_exclude)
+
+  def _build_jumbo(self, files, base_path, **kwargs):
+    """Compiles |files| in jumbo source files, and returns the rest of them.
+
+    The C and C++ sources in each directory are grouped in the order of the
+    paths, so that the total size of each group does not exceed
+    _JUMBO_MAX_GROUP_SIZE.  Each group of more than one source is compiled as
+    a generated source file including all of them, which saves parsing the
+    same headers for each source.  Generated sources, assembly sources, and
+    excluded sources are returned to be compiled separately.
+    """
+    rest = []
+    groups = collections.OrderedDict()
+    for one_file in files:
+      path = one_file
+      if base_path is not None:
+        path = os.path.join(base_path, one_file)
+      extension = os.path.splitext(path)[1]
+      if (extension not in ('.c', '.cc', '.cpp') or
+          not kwargs.get('use_staging', True) or
+          not staging.is_in_staging(path) or self._is_jumbo_excluded(path)):
+        rest.append(one_file)
+        continue
+      try:
+        size = os.path.getsize(staging.as_real_path(path))
+      except OSError:
+        rest.append(one_file)
+        continue
+      key = (os.path.dirname(path), '.c' if extension == '.c' else '.cc')
+      groups.setdefault(key, []).append((path, size, one_file))
+
+    for (_, extension), sources in groups.iteritems():
+      chunks = []
+      chunk_size = _JUMBO_MAX_GROUP_SIZE
+      for path, size, one_file in sorted(sources):
+        if chunk_size + size > _JUMBO_MAX_GROUP_SIZE:
+          chunks.append([])
+          chunk_size = 0
+        chunks[-1].append((path, one_file))
+        chunk_size += size
+      for chunk in chunks:
+        if len(chunk) == 1:
+          rest.append(chunk[0][1])
+          continue
+        self.add_objects(self._build_jumbo_source(
+            [path for path, _ in chunk], extension, **kwargs))
+    return rest
+
+  def _build_jumbo_source(self, paths, extension, **kwargs):
+    jumbo_source = self.get_build_path(
+        os.path.join('jumbo', '%d%s' % (self._jumbo_count, extension)))
+    self._jumbo_count += 1
+    sources = [staging.as_staging(path) for path in paths]
+    self._build_include_file(jumbo_source, sources)
+    if extension == '.c':
+      objects = self.cc(jumbo_source, **kwargs)
+    else:
+      objects = self.cxx(jumbo_source, **kwargs)
+    self.add_notice_sources(sources)
+    # Each source is listed in compile_commands.json with the flags of the
+    # jumbo source.
+    rule, _, output, bindings = self._compile_edges[-1]
+    self._compile_edges.extend(
+        (rule, source, output, bindings) for source in sources)
+    return objects
+
+  def _build_include_file(self, output, sources):
+    """Emits a build edge making |output| which only includes |sources|."""
+    output_dir = os.path.dirname(output)
+    return self.build(output, 'include_file', variables={
+        'sources': ' '.join(os.path.relpath(source, output_dir)
+                            for source in sources)})
+
+  def set_precompiled_header(self, header, languages=None):
+    """Precompiles |header| and includes it in each C and C++ source.
+
+    The header is precompiled for each set of the compiler rule and the
+    variables of the compile edges, as the flags must be the same as the
+    ones of the sources, and it is included before each source with the
+    first -include.  |languages| is a list of 'c' and 'c++', to which the
+    header applies.  It defaults to both.  gcc and clang use the header
+    directly when the precompiled header cannot be used, e.g. when the flags
+    of a source are changed after it was precompiled.
+    """
+    self._precompiled_header = header
+    self._precompiled_header_languages = as_list(languages) or ['c', 'c++']
+    self._precompiled_headers = {}
+    return self
+
+  def _get_flag_name(self, rule_prefix):
+    if _PRECOMPILED_HEADER_LANGUAGES[rule_prefix] == 'c':
+      return 'hostcflags' if self._is_host else 'cflags'
+    return 'hostcxxflags' if self._is_host else 'cxxflags'
+
+  def _build_precompiled_header(self, rule_prefix, variables, implicit,
+                                order_only):
+    """Emits the edges precompiling the header, and returns its paths.
+
+    Returns the path of the header to be included, and the path of the
+    precompiled header, which the compiler finds next to it.  The header to
+    be included is a generated header which includes the real header, so
+    that the compiler can place the precompiled header next to it.
+    """
+    header = self.get_build_path(os.path.join(
+        'pch', str(len(self._precompiled_headers)),
+        os.path.basename(self._precompiled_header)))
+    self._build_include_file(header,
+                             [staging.as_staging(self._precompiled_header)])
+    # clang looks for foo.h.pch and gcc looks for foo.h.gch for -include
+    # foo.h.
+    suffix = '.pch' if rule_prefix.startswith('clang') else '.gch'
+    precompiled_header = header + suffix
+    self.build(precompiled_header, self._get_rule_name(rule_prefix + '_pch'),
+               header, variables=variables, implicit=implicit,
+               order_only=order_only)
+    return header, precompiled_header
+
+  def _add_precompiled_header(self, rule_prefix, rule, kwargs):
+    """Returns |kwargs| of a compile edge updated to use the precompiled
+    header, if it is set for the language of the edge."""
+    language = _PRECOMPILED_HEADER_LANGUAGES.get(rule_prefix)
+    if (not self._precompiled_header or rule == 'phony' or
+        language not in self._precompiled_header_languages):
+      return kwargs
+    # build() adds in_real_path to the variables passed to it, which does not
+    # change the flags.
+    variables = dict((name, value) for name, value
+                     in as_dict(kwargs.get('variables')).iteritems()
+                     if name != 'in_real_path')
+    key = (rule, tuple(sorted((name, str(value))
+                              for name, value in variables.iteritems())))
+    if key not in self._precompiled_headers:
+      self._precompiled_headers[key] = self._build_precompiled_header(
+          rule_prefix, dict(variables), kwargs.get('implicit'),
+          kwargs.get('order_only'))
+    header, precompiled_header = self._precompiled_headers[key]
+
+    kwargs = dict(kwargs)
+    # The header is the first -include, as clang uses the precompiled header
+    # only for it.  The other -include headers, which are precompiled in it,
+    # are then skipped by their include guards.
+    flag_name = self._get_flag_name(rule_prefix)
+    variables[flag_name] = '-include %s %s' % (
+        header, variables.get(flag_name, '$' + flag_name))
+    kwargs['variables'] = variables
+    # Sources do not list the headers in the precompiled header in their
+    # depfiles, so they depend on it explicitly.
+    kwargs['implicit'] = as_list(kwargs.get('implicit')) + [precompiled_header]
+    return kwargs
+
   def find_all_sources(self, **kwargs):
     return self.find_all_contained_files(_PRIMARY_EXTENSIONS, **kwargs)
 
@@ -1036,6 +1667,7 @@ class CNinjaGenerator(NinjaGenerator):
     return archcflags
 
   @staticmethod
+  @_memoize_flags
   def get_commonflags():
     archcommonflags = []
     if OPTIONS.is_arm():
@@ -1075,6 +1707,7 @@ class CNinjaGenerator(NinjaGenerator):
     return ' '.join(archcommonflags)
 
   @staticmethod
+  @_memoize_flags
   def get_asmflags():
     return ('$commonflags ' +
             CNinjaGenerator.get_archasmflags() +
@@ -1090,6 +1723,7 @@ class CNinjaGenerator(NinjaGenerator):
             '-DHAVE_ARC ')
 
   @staticmethod
+  @_memoize_flags
   def get_cflags():
     cflags = ('$asmflags' +
               # These flags also come from TARGET_linux-x86.mk.
@@ -1139,6 +1773,7 @@ class CNinjaGenerator(NinjaGenerator):
     return cflags
 
   @staticmethod
+  @_memoize_flags
   def get_cxxflags():
     # We specify '-nostdinc' as an archasmflags, but it does not remove C++
     # standard include paths for clang. '-nostdinc++' works to remove the paths
@@ -1166,6 +1801,7 @@ class CNinjaGenerator(NinjaGenerator):
     return cxx_flags + ' $cflags -fno-rtti'
 
   @staticmethod
+  @_memoize_flags
   def get_hostcflags():
     # The host C flags are kept minimal as relevant flags, such as -Wall, are
     # provided from MakefileNinjaTranslator, and most of the host binaries
@@ -1178,6 +1814,7 @@ class CNinjaGenerator(NinjaGenerator):
     return hostcflags
 
   @staticmethod
+  @_memoize_flags
   def get_hostcxxflags():
     hostcxx_flags = ''
     # See the comment in get_cxxflags() about RTTI.
@@ -1301,6 +1938,7 @@ class CNinjaGenerator(NinjaGenerator):
              '%s -o $out %s' % (toolchain.get_tool(target, 'ld'),
                                 common_linkso_args),
              description='linkso.%s $out' % target,
+             pool='link_pool',
              rspfile='$out.files',
              rspfile_content='$in_newline')
 
@@ -1330,6 +1968,7 @@ class CNinjaGenerator(NinjaGenerator):
            '%s -o $out %s' % (toolchain.get_tool('host', 'ld'),
                               linkso_args),
            description='linkso.host $out',
+           pool='link_pool',
            rspfile='$out.files',
            rspfile_content='$in_newline')
 
@@ -1362,6 +2001,14 @@ class CNinjaGenerator(NinjaGenerator):
     CNinjaGenerator.emit_target_rules_(n)
     CNinjaGenerator.emit_host_rules_(n)
 
+    # Rule to make a file which only includes $sources, such as a jumbo
+    # source file. The file is rewritten only when the sources change.
+    n.rule('include_file',
+           ('printf \'#include "%s"\\n\' $sources > $out.tmp && '
+            '(cmp -s $out.tmp $out && rm $out.tmp || mv $out.tmp $out)'),
+           description='include_file $out',
+           restat=True)
+
     if OPTIONS.is_nacl_build():
       # Native Client validation test
       n.rule('run_ncval_test',
@@ -1382,27 +2029,51 @@ class CNinjaGenerator(NinjaGenerator):
     basename_toc = os.path.basename(so_file) + '.TOC'
     return os.path.join(build_common.get_load_library_path(), basename_toc)
 
+  def _compile(self, rule_prefix, name, **kwargs):
+    output = self.get_build_path(self.get_object_path(name))
+    rule = self._get_rule_name(rule_prefix)
+    if rule != 'phony':
+      source = name
+      if kwargs.get('use_staging', True) and staging.is_in_staging(name):
+        source = staging.as_staging(name)
+      # Ninja expands the bindings of an edge when it reads them.
+      bindings = dict(
+          (key, _expand_ninja_variables(value, self._variables.get))
+          for key, value in as_dict(kwargs.get('variables')).iteritems())
+      self._compile_edges.append((rule, source, output, bindings))
+    kwargs = self._add_precompiled_header(rule_prefix, rule, kwargs)
+    return self.build(output, rule, name, **kwargs)
+
   def cxx(self, name, **kwargs):
     rule = 'clangxx' if self._enable_clang else 'cxx'
-    return self.build(
-        self.get_build_path(self.get_object_path(name)),
-        self._get_rule_name(rule), name, **kwargs)
+    return self._compile(rule, name, **kwargs)
 
   def cc(self, name, **kwargs):
     rule = 'clang' if self._enable_clang else 'cc'
-    return self.build(
-        self.get_build_path(self.get_object_path(name)),
-        self._get_rule_name(rule), name, **kwargs)
+    return self._compile(rule, name, **kwargs)
 
   def asm(self, name, **kwargs):
-    return self.build(
-        self.get_build_path(self.get_object_path(name)),
-        self._get_rule_name('asm'), name, **kwargs)
+    return self._compile('asm', name, **kwargs)
 
   def asm_with_preprocessing(self, name, **kwargs):
-    return self.build(
-        self.get_build_path(self.get_object_path(name)),
-        self._get_rule_name('asm_with_preprocessing'), name, **kwargs)
+    return self._compile('asm_with_preprocessing', name, **kwargs)
+
+  def get_compile_commands(self):
+    """Returns the list of (rule, source, variables) of the compile edges.
+
+    |variables| are the variables ninja looks up in this file when it runs
+    the command of the edge: $in, $out, the bindings of the edge, and the
+    last values of the variables of this file.  The variables of build.ninja
+    are expanded by TopLevelNinjaGenerator.get_compile_command().
+    """
+    result = []
+    for rule, source, output, bindings in self._compile_edges:
+      variables = dict(self._variables)
+      variables.update(bindings)
+      variables['in'] = source
+      variables['out'] = output
+      result.append((rule, source, variables))
+    return result
 
   def get_ncval_test_output(self, binfile):
     return binfile + '.ncval'
@@ -1479,7 +2150,7 @@ class CNinjaGenerator(NinjaGenerator):
   def emit_ld_wrap_flags(self):
     ld_wrap_flags = ' '.join(['-Wl,--wrap=' + x for x
                               in wrapped_functions.get_wrapped_functions()])
-    self.variable('ldflags', '$ldflags ' + ld_wrap_flags)
+    self.variable('ldflags', '$ldflags ' + self._intern_flags(ld_wrap_flags))
 
   def emit_gl_common_flags(self, hidden_visibility=True):
     self.add_defines('GL_GLEXT_PROTOTYPES', 'EGL_EGLEXT_PROTOTYPES')
@@ -1502,86 +2173,115 @@ class CNinjaGenerator(NinjaGenerator):
 
 
 class RegenDependencyComputer(object):
-  """This class knows which files, when changed, require rerunning configure."""
+  """This class knows which files, when changed, require rerunning configure.
+
+  The input dependencies are recorded by dependency_inspection while configure
+  runs: the files read with open_dependency, the config.py files loaded by
+  config_loader, and the makefiles read by make in make_to_ninja.  The Python
+  modules of configure are the ones imported from src/build.  Only the files
+  configure reads by other means, and the modules which are imported only in
+  the worker processes, are listed here.
+  """
+
+  _STATIC_INPUT_DEPENDENCIES = [
+      'src/build/DEPS.android-sdk',
+      'src/build/DEPS.chrome',
+      'src/build/DEPS.naclsdk',
+      'src/build/DEPS.ndk',
+      'src/build/build_common.py',
+      'src/build/build_options.py',
+      'src/build/config.py',
+      'src/build/config_loader.py',
+      'src/build/configure_cache.py',
+      'src/build/dependency_inspection.py',
+      'src/build/download_sdk_and_ndk.py',
+      'src/build/make_to_ninja.py',
+      'src/build/ninja_generator.py',
+      'src/build/ninja_generator_runner.py',
+      'src/build/notice_index.py',
+      'src/build/staging.py',
+      'src/build/sync_nacl_sdk.py',
+      'src/build/toolchain.py',
+      'src/build/util/filesystem_snapshot.py',
+      'src/build/wrapped_functions.py',
+      'third_party/android/build/target/product/core_base.mk']
 
   def __init__(self):
-    self._computed = False
-    self._input = None
     self._output = None
 
-  def _compute(self):
-    # Any change to one of these files requires rerunning
-    # configure.
-    self._input = find_all_files(['src', 'mods'],
-                                 filenames='config.py',
-                                 use_staging=False,
-                                 include_tests=True)
-
-    self._input += [
-        'src/build/DEPS.android-sdk',
-        'src/build/DEPS.chrome',
-        'src/build/DEPS.naclsdk',
-        'src/build/DEPS.ndk',
-        'src/build/build_common.py',
-        'src/build/build_options.py',
-        'src/build/config.py',
-        'src/build/config_loader.py',
-        'src/build/download_sdk_and_ndk.py',
-        'src/build/make_to_ninja.py',
-        'src/build/ninja_generator.py',
-        'src/build/sync_nacl_sdk.py',
-        'src/build/toolchain.py',
-        'src/build/wrapped_functions.py',
-        'third_party/android/build/target/product/core_base.mk']
-
-    if not open_source.is_open_source_repo():
-      self._input += [
-          'src/packaging/runtime/active_window_back.png',
-          'src/packaging/runtime/active_window_close.png',
-          'src/packaging/runtime/active_window_extdir.png',
-          'src/packaging/runtime/active_window_maximize.png',
-          'src/packaging/runtime/active_window_minimize.png',
-          'src/packaging/runtime/style.css']
-
-    self._output = [OPTIONS.get_configure_options_file()]
+  def _compute_output(self):
+    self._output = set()
 
     # We do not support running the downloaded or built Chrome with an ARM
     # target on a dev machine.  We do not download/build Chrome in the
     # open source repository.
     if not open_source.is_open_source_repo() and not OPTIONS.is_arm():
-      self._output += [build_common.get_chrome_prebuilt_stamp_file()]
+      self._output.add(build_common.get_chrome_prebuilt_stamp_file())
 
-    # Remove the options_file from the list of output dependencies. The option
+    # The options file is not listed as an output dependency. The option
     # file is only written if it changes to avoid triggering subsequent builds,
     # but if we list it here and it is not actually written out it will trigger
     # the regeneration step every time as ninja will think it is out of date.
-    self._output.remove(OPTIONS.get_configure_options_file())
+
+  @staticmethod
+  def _to_source_path(path):
+    """Returns |path| relative to the ARC root, or None if it is not a source.
+
+    Generated files and files outside of the ARC root are not sources.
+    """
+    path = os.path.relpath(os.path.realpath(path), build_common.get_arc_root())
+    if (path.startswith(os.pardir + os.sep) or
+        path.startswith(build_common.OUT_DIR + os.sep)):
+      return None
+    return path
+
+  @staticmethod
+  def _get_imported_build_modules():
+    """Returns the sources of the modules imported from src/build."""
+    build_dir = os.path.join(build_common.get_arc_root(), 'src', 'build')
+    paths = []
+    for module in sys.modules.values():
+      path = getattr(module, '__file__', None)
+      if not path:
+        continue
+      if path.endswith('.pyc'):
+        path = path[:-1]
+      path = os.path.realpath(path)
+      if path.startswith(build_dir + os.sep) and os.path.exists(path):
+        paths.append(os.path.relpath(path, build_common.get_arc_root()))
+    return paths
 
   def get_output_dependencies(self):
-    if not self._computed:
-      self._compute()
-    return self._output
+    if self._output is None:
+      self._compute_output()
+    return sorted(self._output)
 
   def get_input_dependencies(self):
-    if not self._computed:
-      self._compute()
-    return self._input
+    """Returns the sorted list of the input dependencies recorded so far."""
+    paths = set(RegenDependencyComputer._STATIC_INPUT_DEPENDENCIES)
+    if not open_source.is_open_source_repo():
+      paths.update([
+          'src/packaging/runtime/active_window_back.png',
+          'src/packaging/runtime/active_window_close.png',
+          'src/packaging/runtime/active_window_extdir.png',
+          'src/packaging/runtime/active_window_maximize.png',
+          'src/packaging/runtime/active_window_minimize.png',
+          'src/packaging/runtime/style.css'])
+    paths.update(RegenDependencyComputer._get_imported_build_modules())
+    for path in dependency_inspection.get_regen_files():
+      path = RegenDependencyComputer._to_source_path(path)
+      if path:
+        paths.add(path)
+    return sorted(paths)
 
   @staticmethod
   def verify_is_output_dependency(path):
-    dependencies = \
-        TopLevelNinjaGenerator._REGEN_DEPENDENCIES.get_output_dependencies()
+    computer = TopLevelNinjaGenerator._REGEN_DEPENDENCIES
+    if computer._output is None:
+      computer._compute_output()
     path = os.path.relpath(os.path.realpath(path), build_common.get_arc_root())
-    if path not in dependencies:
-      raise Exception('Please add %s to regen input dependencies' % path)
-
-  @staticmethod
-  def verify_is_input_dependency(path):
-    dependencies = \
-        TopLevelNinjaGenerator._REGEN_DEPENDENCIES.get_input_dependencies()
-    path = os.path.relpath(os.path.realpath(path), build_common.get_arc_root())
-    if path not in dependencies:
-      raise Exception('Please add %s to regen input dependencies' % path)
+    if path not in computer._output:
+      raise Exception('Please add %s to regen output dependencies' % path)
 
 
 class TopLevelNinjaGenerator(NinjaGenerator):
@@ -1592,6 +2292,9 @@ class TopLevelNinjaGenerator(NinjaGenerator):
   def __init__(self, module_name, generate_path=False, **kwargs):
     super(TopLevelNinjaGenerator, self).__init__(
         module_name, generate_path=generate_path, **kwargs)
+    # Memoized results of get_compile_command(), see there.
+    self._expanded_variables = {}
+    self._expanded_values = {}
     # Emit regeneration rules as high as possible in the top level ninja
     # so that if configure.py fails and writes a partial ninja file and
     # we fix configure.py, the regeneration rule will most likely be
@@ -1599,7 +2302,6 @@ class TopLevelNinjaGenerator(NinjaGenerator):
     self._emit_ninja_regeneration_rules()
     self._emit_common_rules()
 
-  # TODO(crbug.com/177699): Improve ninja regeneration rule generation.
   def _emit_ninja_regeneration_rules(self):
     # Add rule/target to regenerate all ninja files we built this time
     # if configure.py changes.  We purposefully avoid specifying
@@ -1625,8 +2327,14 @@ class TopLevelNinjaGenerator(NinjaGenerator):
   def _set_commonflags(self):
     self.variable('commonflags', CNinjaGenerator.get_commonflags())
 
+  def _emit_pools(self):
+    for pool, depth in sorted(_get_ninja_pool_depths().iteritems()):
+      self.pool(pool + '_pool', depth)
+
   def _emit_common_rules(self):
     self._set_commonflags()
+    # The pools must be defined before the rules which use them.
+    self._emit_pools()
 
     ApkFromSdkNinjaGenerator.emit_common_rules(self)
     ApkNinjaGenerator.emit_common_rules(self)
@@ -1640,11 +2348,79 @@ class TopLevelNinjaGenerator(NinjaGenerator):
     TblgenNinjaGenerator.emit_common_rules(self)
     TestNinjaGenerator.emit_common_rules(self)
 
+  def emit(self, previous_state=None):
+    # build.ninja is the output of the regen_ninja rule. It must be updated
+    # whenever configure runs, or ninja would keep running configure.
+    return super(TopLevelNinjaGenerator, self).emit()
+
+  def _intern_flags(self, flags):
+    # The shared flags are defined after the variables in build.ninja.
+    return flags
+
   def emit_subninja_rules(self, ninja_list):
+    # Only the flags used by two or more ninjas are shared, so that the flags
+    # of a single module do not grow build.ninja, nor change it when they
+    # change.  The others are inlined when the ninjas are emitted.
+    shared_flags = {}
+    use_counts = collections.defaultdict(int)
+    for ninja in ninja_list:
+      shared_flags.update(ninja.get_shared_flags())
+      for name in ninja.get_shared_flags():
+        use_counts[name] += 1
+    for ninja in ninja_list:
+      ninja.set_inline_shared_flags(dict(
+          (name, flags) for name, flags in ninja.get_shared_flags().iteritems()
+          if use_counts[name] < 2))
+    # The shared flags must be defined before the subninjas which use them,
+    # as ninja expands variables when it reads them.
+    for name, flags in sorted(shared_flags.iteritems()):
+      if use_counts[name] >= 2:
+        self.variable(name, flags)
+      else:
+        # Not emitted, but kept to expand the commands for
+        # get_compile_command().
+        self._variables[name] = flags
     for ninja in ninja_list:
       if ninja._ninja_path != self.get_module_name():
         self.subninja(ninja._ninja_path)
 
+  def _get_expanded_variable(self, name):
+    if name not in self._expanded_variables:
+      value = self._variables.get(name)
+      if value is not None:
+        # The variables of build.ninja are expanded when they are defined,
+        # so only the escape sequences are left.
+        value = _expand_ninja_variables(value, lambda _: None, final=True)
+      self._expanded_variables[name] = value
+    return self._expanded_variables[name]
+
+  def _expand_value(self, value):
+    result = self._expanded_values.get(value)
+    if result is None:
+      result = _expand_ninja_variables(value, self._get_expanded_variable,
+                                       final=True)
+      self._expanded_values[value] = result
+    return result
+
+  def get_compile_command(self, rule, variables):
+    """Returns the command line of a compile edge in a subninja, or None.
+
+    |rule| and |variables| are from CNinjaGenerator.get_compile_commands().
+    This must be called after build.ninja is generated, as the expanded
+    variables are memoized.
+    """
+    command = self._rule_commands.get(rule)
+    if command is None:
+      return None
+
+    def lookup(name):
+      if name in ('in', 'out'):
+        return variables[name]
+      if name in variables:
+        return self._expand_value(variables[name])
+      return self._get_expanded_variable(name)
+    return _expand_ninja_variables(command, lookup, final=True)
+
   def emit_target_groups_rules(self, ninja_list):
     all_target_groups = _TargetGroups()
 
@@ -1654,8 +2430,14 @@ class TopLevelNinjaGenerator(NinjaGenerator):
     all_target_groups.define_target_group('lint')
 
     for ninja in ninja_list:
-      for build_rule in ninja._build_rule_list:
-        all_target_groups.record_build_rule(*build_rule)
+      all_target_groups.record_target_group_roots(
+          ninja.get_target_group_roots())
+      if OPTIONS.is_target_groups_logging():
+        all_target_groups.record_target_group_outputs(
+            ninja.get_target_group_outputs())
+    if OPTIONS.is_target_groups_logging():
+      all_target_groups.verify_roots()
+      print 'Verified the roots of the target groups.'
     all_target_groups.emit_rules(self)
 
 
@@ -1814,13 +2596,15 @@ class SharedObjectNinjaGenerator(CNinjaGenerator):
       # Create TOC file next to the installed shared library.
       self.build(self._get_toc_file_for_so(install_so),
                  'mktoc', self._rebase_to_build_dir(install_so),
-                 implicit='src/build/make_table_of_contents.py')
+                 implicit=['src/build/make_table_of_contents.py',
+                           'src/build/util/elf_symbols.py'])
     else:
       # Create TOC file next to the intermediate shared library if the shared
       # library is not to be installed. E.g. host binaries are not installed.
       self.build(self.get_build_path(basename_so + '.TOC'),
                  'mktoc', intermediate_so,
-                 implicit='src/build/make_table_of_contents.py')
+                 implicit=['src/build/make_table_of_contents.py',
+                           'src/build/util/elf_symbols.py'])
 
     # Make sure |intermediate_so| contain neither 'disallowed_symbols.defined'
     # symbols nor libchromium_base.a symbols, but the check is unnecessary for
@@ -2312,25 +3096,45 @@ class JavaNinjaGenerator(NinjaGenerator):
   def emit_common_rules(n):
     n.variable('aapt', toolchain.get_tool('java', 'aapt'))
     n.variable('aidl', toolchain.get_tool('java', 'aidl'))
-    n.variable('dexopt', ('src/build/filter_dexopt_warnings.py ' +
-                          toolchain.get_tool('java', 'dexopt')))
+    n.variable('dexopt', (build_common.get_build_helper_command(
+        'src/build/filter_dexopt_warnings.py') + ' ' +
+        toolchain.get_tool('java', 'dexopt')))
     n.variable('java-event-log-tags',
                toolchain.get_tool('java', 'java-event-log-tags'))
-    n.variable('javac', ('src/build/filter_java_warnings.py ' +
-                         toolchain.get_tool('java', 'javac')))
+    n.variable('javac', (build_common.get_build_helper_command(
+        'src/build/filter_java_warnings.py') + ' ' +
+        toolchain.get_tool('java', 'javac')))
     n.variable('jflags', ('-J-Xmx512M -target 1.5 -Xmaxerrs 9999999 '
                           '-encoding UTF-8 -g'))
     n.variable('aidlflags', '-b')
     n.variable('aaptflags', '-x -m')
 
-    n.rule('javac',
-           ('rm -rf $out_class_path && '
-            'mkdir -p $out_class_path && '
-            '$javac $jflags @$response_file -d $out_class_path && '
-            'touch $out'),
-           description='javac $module_name ($count files)',
-           rspfile='$response_file',
-           rspfile_content='$in_newline')
+    javac_command = ('rm -rf $out_class_path && '
+                     'mkdir -p $out_class_path && '
+                     '$javac $jflags @$response_file -d $out_class_path && '
+                     'touch $out')
+    if OPTIONS.artifact_cache_dir():
+      # The response file of the rule passes the command to
+      # artifact_cache.py, so the list of the sources is written by a
+      # separate javac_source_list edge.  See _build_javac().
+      n.rule('javac',
+             description='javac $module_name ($count files)',
+             pool='javac_pool',
+             **_get_artifact_cached_rule(javac_command,
+                                         outputs='$out $out_class_path',
+                                         inputs='@$response_file'))
+      n.rule('javac_source_list',
+             'cp $out.rsp $out',
+             description='javac source list $out',
+             rspfile='$out.rsp',
+             rspfile_content='$in_newline')
+    else:
+      n.rule('javac',
+             javac_command,
+             description='javac $module_name ($count files)',
+             pool='javac_pool',
+             rspfile='$response_file',
+             rspfile_content='$in_newline')
     n.rule('aidl',
            '$aidl -d$out.d $aidlflags $in $out',
            depfile='$out.d',
@@ -2342,17 +3146,20 @@ class JavaNinjaGenerator(NinjaGenerator):
     # Makefile-style dependency file, that file will have multiple
     # targets and ninja does not support depfiles with multiple targets.
     n.rule('aapt_package',
-           (toolchain.get_tool('java', 'aapt') +
-            ' package $aaptflags -M $manifest ' +
-            '$input_path > $tmpfile 2>&1 || ' +
-            '(cat $tmpfile; exit 1)'),
-           description='aapt package $out')
+           description='aapt package $out',
+           pool='aapt_pool',
+           **_get_artifact_cached_rule(
+               toolchain.get_tool('java', 'aapt') +
+               ' package $aaptflags -M $manifest ' +
+               '$input_path > $tmpfile 2>&1 || ' +
+               '(cat $tmpfile; exit 1)'))
     n.rule('llvm_rs_cc',
-           ('LD_LIBRARY_PATH=$toolchaindir '
-            '$toolchaindir/llvm-rs-cc -o $resout -p $srcout $args '
-            '-I $clangheader -I $scriptheader $in > $log 2>&1 || '
-            '(cat $log; rm $log; exit 1)'),
-           description='llvm-rs-cc $resout $srcout')
+           description='llvm-rs-cc $resout $srcout',
+           **_get_artifact_cached_rule(
+               'LD_LIBRARY_PATH=$toolchaindir '
+               '$toolchaindir/llvm-rs-cc -o $resout -p $srcout $args '
+               '-I $clangheader -I $scriptheader $in > $log 2>&1 || '
+               '(cat $log; rm $log; exit 1)'))
     n.rule('aapt_remove_file',
            ('cp $in $out && $aapt remove $out $targets'),
            description='aapt remove $targets from $out')
@@ -2360,10 +3167,12 @@ class JavaNinjaGenerator(NinjaGenerator):
            '$java-event-log-tags -o $out $in /dev/null',
            description='eventlogtag $out')
     n.rule('dex_preopt',
-           ('rm -f $out; '
-            'BOOTCLASSPATH=$bootclasspath '
-            '$dexopt --preopt $in $out "$dexflags" $warning_grep'),
-           description='dex_preopt $out')
+           description='dex_preopt $out',
+           pool='dexopt_pool',
+           **_get_artifact_cached_rule(
+               'rm -f $out; '
+               'BOOTCLASSPATH=$bootclasspath '
+               '$dexopt --preopt $in $out "$dexflags" $warning_grep'))
     n.rule('create_multidex_zip',
            'DIR=$$(mktemp -d --tmpdir=out); ' +
            '(cd $$DIR && ' +
@@ -2455,7 +3264,7 @@ class JavaNinjaGenerator(NinjaGenerator):
     # package name.
     re_pattern = 'option java_package ([^;\n]+)'
     java_path = JavaNinjaGenerator._extract_pattern_as_java_file_path(
-        input_file, re_pattern, ignore_dependency=True)
+        input_file, re_pattern)
     output_file = os.path.join(output_path, java_path)
     return self.build([output_file], 'eventlogtags', inputs=[input_file])
 
@@ -2464,7 +3273,7 @@ class JavaNinjaGenerator(NinjaGenerator):
     # package name.
     re_pattern = 'package (.+);'
     java_path = JavaNinjaGenerator._extract_pattern_as_java_file_path(
-        input_file, re_pattern, ignore_dependency=True)
+        input_file, re_pattern)
     output_file = os.path.join(output_path, java_path)
     return self.build([output_file], 'aidl', inputs=[input_file])
 
@@ -2494,12 +3303,19 @@ class JavaNinjaGenerator(NinjaGenerator):
 
     self._javac_stamp_files.append(
         self._get_stamp_file_path_for_compiled_classes())
+    if OPTIONS.artifact_cache_dir():
+      # The list of the sources is an input of the cached javac rule, rather
+      # than its response file.
+      self.build(self._java_source_response_file, 'javac_source_list',
+                 inputs=java_source_files)
+      implicit = implicit + [self._java_source_response_file]
     return self.build(self._javac_stamp_files, 'javac',
                       inputs=java_source_files,
                       implicit=(self._get_minimal_bootclasspath() +
                                 self._javac_classpath_files +
                                 implicit),
-                      variables=variables)
+                      variables=variables,
+                      cache_inputs=self._javac_classpath_dirs)
 
   def _build_aapt(self, outputs=None, output_apk=None, inputs=None,
                   implicit=None, input_path=None, out_base_path=None):
@@ -2537,8 +3353,12 @@ class JavaNinjaGenerator(NinjaGenerator):
         manifest=self._manifest_path,
         tmpfile=self._get_build_path(subpath='aapt_errors'))
 
+    # The resource directories are read as a whole, but only some of their
+    # files are in |implicit|.
+    cache_inputs = resource_paths + ([input_path] if input_path else [])
     return self.build(outputs=outputs, rule='aapt_package', inputs=inputs,
-                      implicit=implicit, variables=variables)
+                      implicit=implicit, variables=variables,
+                      cache_inputs=cache_inputs)
 
   def _build_llvm_rs_cc(self):
     """Generates renderscript source code and llvm bit code if exists.
@@ -2585,7 +3405,9 @@ class JavaNinjaGenerator(NinjaGenerator):
     self.add_flags('aaptflags', '--auto-add-overlay')
 
     return self.build(rsout_res_files + rsout_src_files, 'llvm_rs_cc',
-                      input_files, variables=variables)
+                      input_files, variables=variables,
+                      cache_inputs=[variables['clangheader'],
+                                    variables['scriptheader']])
 
   def _build_and_add_all_generated_sources(self, implicit=None):
     # |implicit| is unused here but it is used in the inherited class.
@@ -2616,7 +3438,7 @@ class JavaNinjaGenerator(NinjaGenerator):
     java_files = []
     for c in self._resource_class_names:
       java_path = JavaNinjaGenerator._extract_pattern_as_java_file_path(
-          self._manifest_path, re_pattern, class_name=c, ignore_dependency=True)
+          self._manifest_path, re_pattern, class_name=c)
       java_files.append(os.path.join(out_resource_path, java_path))
 
     self._build_aapt(outputs=java_files, implicit=resource_files + implicit,
@@ -2654,7 +3476,7 @@ class JavaNinjaGenerator(NinjaGenerator):
     for aidl_file in all_aidl_files:
       if aidl_file not in self._exclude_aidl_files:
         aidl_file = staging.as_staging(aidl_file)
-        with open_dependency(aidl_file, 'r', ignore_dependency=True) as f:
+        with open_dependency(aidl_file, 'r') as f:
           if not re.search('parcelable', f.read()):
             aidl_files.append(aidl_file)
 
@@ -2976,8 +3798,10 @@ class JarNinjaGenerator(JavaNinjaGenerator):
             '(rm $out; set +f; exit 1)'),
            description='removing files not matching $in_dir/$match')
     n.rule('dx',
-           '$dx $dxflags --output=$out $in_path',
-           description='dx $out')
+           description='dx $out',
+           pool='javac_pool',
+           **_get_artifact_cached_rule(
+               '$dx $dxflags --output=$out $in_path', inputs='$in_path'))
 
   def _get_build_path(self, subpath=None, is_target=False):
     return build_common.get_build_path_for_jar(self._module_name,
@@ -3536,23 +4360,169 @@ def get_optimization_cflags():
           '-funswitch-loops']
 
 
-# TODO(crbug.com/177699): Remove ignore_dependency option (we never
-# should ignore dependencies) as part of dynamically generating
-# the regen rules.
+def _get_emitted_ninja_manifest_path():
+  return os.path.join(build_common.get_generated_ninja_dir(),
+                      'emitted_ninja_manifest.json')
+
+
+# The manifest written by emit_ninja_files() in the previous configure.
+# Loaded lazily in each process.
+_previous_emitted_ninja_manifest = None
+
+
+def _get_previous_emitted_state(ninja_path):
+  global _previous_emitted_ninja_manifest
+  if _previous_emitted_ninja_manifest is None:
+    try:
+      with open(_get_emitted_ninja_manifest_path()) as f:
+        _previous_emitted_ninja_manifest = json.load(f)
+    except (IOError, ValueError):
+      _previous_emitted_ninja_manifest = {}
+  return _previous_emitted_ninja_manifest.get(ninja_path)
+
+
+def _inline_shared_flags(content, shared_flags):
+  """Replaces the references to |shared_flags| in |content| with the flags."""
+  for name, flags in shared_flags.iteritems():
+    content = content.replace('$' + name, flags)
+  return content
+
+
+def _inline_shared_flags_in_file(path, shared_flags, emitted_state):
+  """Inlines |shared_flags| in a ninja file emitted in a worker process.
+
+  Returns the state of the file, see NinjaGenerator.emit().  The fingerprint
+  stays the one of the content the worker emitted, so that the worker does
+  not rewrite the file in the next configure if the content is unchanged.
+  """
+  with open(path) as f:
+    content = f.read()
+  inlined_content = _inline_shared_flags(content, shared_flags)
+  if inlined_content == content:
+    return emitted_state
+  build_common.write_atomically(path, inlined_content)
+  stat_result = os.stat(path)
+  return [emitted_state[0], stat_result.st_mtime, stat_result.st_size]
+
+
+def emit_and_summarize_ninja_files(ninja_list):
+  """Emits the ninja scripts in |ninja_list| and returns their NinjaSummary.
+
+  This is called in the worker processes, so that the content of the ninja
+  scripts is not sent to the parent process.
+  """
+  summary_list = []
+  for ninja in ninja_list:
+    summary = ninja.get_summary()
+    summary.emitted_state = ninja.emit(
+        _get_previous_emitted_state(ninja._ninja_path))
+    summary_list.append(summary)
+  return summary_list
+
+
+def emit_ninja_files(ninja_list, max_workers=None):
+  """Emits the ninja scripts in |ninja_list| in parallel.
+
+  |ninja_list| may contain NinjaSummary of the ninja scripts emitted by
+  emit_and_summarize_ninja_files(). Those are not emitted again, but the
+  shared flags used only by them are inlined in the files.
+  The state of each emitted file is kept in a manifest, so that files whose
+  content is unchanged are not rewritten in the next configure, and files no
+  longer generated, e.g. for removed modules, are deleted.
+  |max_workers| is the number of threads, which defaults to the number of
+  CPUs.
+  """
+  if max_workers is None:
+    max_workers = multiprocessing.cpu_count()
+  # --configure-jobs=0 runs configure synchronously.
+  max_workers = max(1, max_workers)
+
+  manifest = {}
+  with concurrent.ThreadPoolExecutor(max_workers=max_workers,
+                                     daemon=True) as executor:
+    future_list = []
+    for ninja in ninja_list:
+      if isinstance(ninja, NinjaSummary):
+        if ninja.get_inline_shared_flags():
+          future_list.append(
+              (ninja._ninja_path,
+               executor.submit(_inline_shared_flags_in_file,
+                               ninja._ninja_path,
+                               ninja.get_inline_shared_flags(),
+                               ninja.emitted_state)))
+        else:
+          manifest[ninja._ninja_path] = ninja.emitted_state
+        continue
+      future_list.append(
+          (ninja._ninja_path,
+           executor.submit(ninja.emit,
+                           _get_previous_emitted_state(ninja._ninja_path))))
+  manifest.update((path, future.result()) for path, future in future_list)
+
+  # Make sure the previous manifest is loaded.
+  _get_previous_emitted_state(None)
+  for path in _previous_emitted_ninja_manifest:
+    if path not in manifest:
+      build_common.remove_file_force(path)
+  build_common.write_atomically(_get_emitted_ninja_manifest_path(),
+                                json.dumps(manifest, sort_keys=True))
+
+
+def get_compile_commands_path():
+  return os.path.join(build_common.get_arc_root(), 'compile_commands.json')
+
+
+def write_compile_commands(ninja_list, top_level_ninja):
+  """Writes the compilation database of the C/C++ sources in |ninja_list|.
+
+  The database is used by clang tools and editor integration such as
+  arc.ycm_extra_conf.py.  The sources are listed with their real paths in
+  mods/ or third_party/, which editors open, and the commands are the ones
+  ninja runs in the ARC root.  The file is not rewritten when it is
+  unchanged, so that the tools watching it do not reload it.
+  """
+  arc_root = build_common.get_arc_root()
+  entries = []
+  for ninja in ninja_list:
+    for rule, source, variables in ninja.get_compile_commands():
+      command = top_level_ninja.get_compile_command(rule, variables)
+      if command is None:
+        continue
+      entries.append({
+          'directory': arc_root,
+          'command': command,
+          'file': os.path.join(arc_root, staging.as_real_path(source))})
+  # Sort for stable output. A source built for both the target and the host
+  # keeps the order of |ninja_list|.
+  entries.sort(key=lambda entry: entry['file'])
+  content = json.dumps(entries, indent=2, sort_keys=True)
+
+  path = get_compile_commands_path()
+  try:
+    with open(path) as f:
+      if f.read() == content:
+        return
+  except IOError:
+    pass
+  build_common.write_atomically(path, content)
+
+
 def open_dependency(path, access, ignore_dependency=False):
   """Open a file that configure depends on to generate build rules.
 
-  Any file that we depend on to generate rules needs to be listed as
-  a dependency for rerunning configure.  Set ignore_dependency to
-  true if there are a bunch of files that are being added as
-  dependencies which we do not yet reflect in
-  TopLevelNinjaGenerator._regen_{input,output}_dependencies.
+  A file opened for reading is recorded as a dependency for rerunning
+  configure.  A file opened for writing must be listed in the regen output
+  dependencies.  Set ignore_dependency to true for files which are only
+  scanned for information that rarely changes, such as tracking tags, where
+  rerunning configure on every edit of the file would be too costly.
   """
-  if not ignore_dependency:
-    if 'w' in access:
+  if 'w' in access:
+    if not ignore_dependency:
       RegenDependencyComputer.verify_is_output_dependency(path)
-    else:
-      RegenDependencyComputer.verify_is_input_dependency(path)
+  elif ignore_dependency:
+    dependency_inspection.add_scanned_files(path)
+  else:
+    dependency_inspection.add_files(path)
   return open(path, access)
 
 
@@ -3560,13 +4530,6 @@ def _compute_hash_fingerprint(input):
   return hashlib.sha256(input).hexdigest()[0:8]
 
 
-# TODO(kmixter): This function is used far too much with
-# ignore_dependency=True.  Every path passed here should technically be
-# listed as a regen dependency of configure.py. Currently we are using
-# this function to parse every single eventlogtag, aidl, and
-# AndroidManifest.xml file for package paths to determine file names.
-# In many cases these package names are just used for generated file
-# paths which do not really need to match package paths.  Fix this.
 def _extract_pattern_from_file(path, pattern, ignore_dependency=False):
   """Given a path to a file, and a pattern, extract the string matched by the
   pattern from the file. Useful to grab a little bit of data from a file
@@ -4,13 +4,23 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import hashlib
+import heapq
+import json
 import logging
 import multiprocessing
+import os
 import time
 import traceback
 
+import build_common
+import configure_cache
+import configure_profile
+import dependency_inspection
 import ninja_generator
+import notice_index
 
+from build_options import OPTIONS
 from util import concurrent
 
 
@@ -40,11 +50,21 @@ def _run_task(task):
 
   At the beginning of the task, NinjaGenerator._ninja_list and
   __request_task_list must be empty. In NinjaGenerator's ctor, the instance
-  will be stored in the NinjaGenerator._ninja_list, and this function returns
-  it (to parent process) as a result.
+  will be stored in the NinjaGenerator._ninja_list, and this function emits
+  it and returns its NinjaSummary (to parent process) as a result.
   Instead of creating NinjaGenerator, generate_ninja() and
   generate_test_ninja() can call request_run_in_parallel(). Then, this function
   returns tasks to the parent process, and they'll be run in parallel.
+
+  The files read by the task which require rerunning configure when changed
+  are returned too, so that the parent process can emit the regen rule, and
+  so are the statistics of the task (see _get_task_stats), which are used to
+  schedule the task in the next configure and for --profile-configure.
+  The entries added to notice_index by the task are returned as well, so that
+  the parent process can persist them.
+
+  With --incremental-configure, the result is stored in configure_cache, and
+  reused while the inputs of the task are unchanged.
   """
   try:
     # Make sure both lists are empty.
@@ -53,30 +73,67 @@ def _run_task(task):
     assert not __request_task_list
     __request_task_list = []
 
-    start_time = time.time()
+    # Imported here, as make_to_ninja depends on this module through
+    # ninja_generator.
+    import make_to_ninja
+    usage = configure_profile.ResourceUsage()
+    make_process_count = make_to_ninja.get_make_process_count()
     if isinstance(task, tuple):
       function = task[0]
       args = task[1:]
     else:
       function = task
       args = []
+
+    cache_key = None
+    if OPTIONS.incremental_configure():
+      cache_key = configure_cache.get_task_key(function, args)
+      if cache_key:
+        result = configure_cache.load(cache_key)
+        if result is not None:
+          __request_task_list = None
+          ninja_list, task_list, regen_files = result
+          stats = _get_task_stats(usage, 0, ninja_list, True)
+          return (ninja_generator.emit_and_summarize_ninja_files(ninja_list),
+                  task_list, regen_files, stats,
+                  notice_index.consume_new_entries())
+
+    dependency_inspection.start_inspection()
+    # Android.mk files translated in the task are evaluated by one make
+    # process at the end of the task.
+    make_to_ninja.MakefileNinjaTranslator.start_batch()
     function(*args)
-    elapsed_time = time.time() - start_time
-    if elapsed_time > 1:
-      logging.info('Slow task: %s.%s %0.3fs',
-                   function.__module__, function.__name__, elapsed_time)
+    make_to_ninja.MakefileNinjaTranslator.finish_batch()
+    files, regen_files, listings, probes = (
+        dependency_inspection.stop_inspection())
 
     # Extract the result from global variables.
     ninja_list = ninja_generator.NinjaGenerator.consume_ninjas()
     task_list = __request_task_list
     __request_task_list = None
 
+    stats = _get_task_stats(
+        usage, make_to_ninja.get_make_process_count() - make_process_count,
+        ninja_list, False)
+    if stats['wall_time'] > 1:
+      logging.info('Slow task: %s.%s %0.3fs',
+                   function.__module__, function.__name__, stats['wall_time'])
+
     # At the moment, it is prohibited 1) to return NinjaGenerator and
     # 2) to request to run ninja generators back to the parent process, at the
     # same time.
     assert (not ninja_list or not task_list)
-    return (ninja_list, task_list)
+    if cache_key:
+      configure_cache.store(cache_key, files, listings, probes,
+                            (ninja_list, task_list, regen_files))
+    # Emit the ninja files here, so that only their summaries are sent to
+    # the parent process.
+    return (ninja_generator.emit_and_summarize_ninja_files(ninja_list),
+            task_list, regen_files, stats, notice_index.consume_new_entries())
   except BaseException:
+    if dependency_inspection.is_inspecting():
+      # Restore the functions replaced to record the probes.
+      dependency_inspection.stop_inspection()
     if multiprocessing.current_process().name == 'MainProcess':
       # Just raise the exception up the single process, single thread
       # stack in the simple -j1 case.
@@ -94,23 +151,256 @@ def _run_task(task):
     raise Exception('subprocess failure, see console output above')
 
 
-def run_in_parallel(task_list, maximum_jobs):
+def _get_task_stats(usage, make_process_count, ninja_list, cached):
+  """Returns the statistics of a task.
+
+  In addition to configure_profile.ResourceUsage.get_stats(), the dict has
+  'make_count', the number of make processes run, 'build_count', the number
+  of build edges generated, and 'cached', whether the result is taken from
+  configure_cache.
+  """
+  stats = usage.get_stats()
+  stats['make_count'] = make_process_count
+  stats['build_count'] = sum(
+      len(ninja._build_rule_list) for ninja in ninja_list)
+  stats['cached'] = cached
+  return stats
+
+
+def _get_task_name(task):
+  """Returns the name of |task| to look up its duration in the history."""
+  if isinstance(task, tuple):
+    function, args = task[0], task[1:]
+  else:
+    function, args = task, ()
+  name = '%s.%s' % (function.__module__, function.__name__)
+  if args:
+    # The arguments may be long, e.g. the list of all shared libraries.
+    name += '#' + hashlib.sha1(repr(args)).hexdigest()[:8]
+  return name
+
+
+def _get_task_history_path():
+  return os.path.join(build_common.get_build_dir(),
+                      'configure_task_history.json')
+
+
+def _load_task_histories():
+  """Returns the dict from the phase names to their task histories."""
+  try:
+    with open(_get_task_history_path()) as f:
+      histories = json.load(f)
+  except (IOError, ValueError):
+    return {}
+  # Drop the entries of the old format, which was not split by phases.
+  return dict((phase, history) for phase, history in histories.iteritems()
+              if isinstance(history, dict) and 'duration' not in history)
+
+
+class _TaskHistory(object):
+  """Keeps how long each task and its sub tasks took in the last configure.
+
+  The history of a phase is a dict from the task name to a dict with
+  'duration', the time the task itself took in seconds when it ran, and
+  'subtasks', the names of the tasks it requested by
+  request_run_in_parallel().  The histories are kept for each phase, as a
+  phase only knows its own tasks.
+  """
+
+  def __init__(self, phase):
+    self._phase = phase
+    self._history = _load_task_histories().get(phase, {})
+    self._updated_history = {}
+    self._expected_duration_cache = {}
+
+  def _get_expected_total_duration(self, name, visiting):
+    if name in self._expected_duration_cache:
+      return self._expected_duration_cache[name]
+    entry = self._history.get(name)
+    if entry is None or name in visiting:
+      return None
+    visiting.add(name)
+    total = entry['duration']
+    for subtask_name in entry['subtasks']:
+      total += self._get_expected_total_duration(subtask_name, visiting) or 0
+    visiting.remove(name)
+    self._expected_duration_cache[name] = total
+    return total
+
+  def get_expected_total_duration(self, name):
+    """Returns the expected duration of the task and all its sub tasks.
+
+    Returns None if the task did not run in the last configure.
+    """
+    return self._get_expected_total_duration(name, set())
+
+  def get_expected_duration(self, name):
+    entry = self._history.get(name)
+    return entry['duration'] if entry else None
+
+  def get_expected_subtasks(self, name):
+    entry = self._history.get(name)
+    return entry['subtasks'] if entry else []
+
+  def update(self, name, duration, subtasks):
+    """Records the task which ran in this configure.
+
+    |duration| is None if the result of the task is taken from
+    configure_cache.  The duration of the last run is kept then, as it is
+    what the task costs when its inputs change.
+    """
+    if duration is None:
+      entry = self._history.get(name)
+      if entry is None:
+        # How long the task takes is unknown.
+        return
+      duration = entry['duration']
+    self._updated_history[name] = {'duration': duration,
+                                   'subtasks': subtasks}
+
+  def save(self):
+    """Saves the history of the tasks updated in this configure.
+
+    The tasks which did not run, e.g. because their config.py is removed,
+    are dropped.
+    """
+    histories = _load_task_histories()
+    histories[self._phase] = self._updated_history
+    path = _get_task_history_path()
+    build_common.makedirs_safely(os.path.dirname(path))
+    build_common.write_atomically(
+        path, json.dumps(histories, sort_keys=True, indent=2))
+
+
+class _TaskScheduler(object):
+  """Prioritizes the tasks so that the longest expected ones start first.
+
+  This is the LPT (longest processing time first) rule. The expected
+  duration of a task includes its sub tasks. Sub tasks inherit the priority
+  of the top level task which requested them, and are ordered by their own
+  expected durations among the tasks sharing the inherited priority.
+  Tasks which did not run in the last configure are expected to take as long
+  as the longest known task.
+  """
+
+  def __init__(self, history):
+    self._history = history
+
+  def _get_expected_total_duration(self, name, default):
+    duration = self._history.get_expected_total_duration(name)
+    return default if duration is None else duration
+
+  def get_priorities(self, names):
+    """Returns the priorities of the top level tasks named |names|."""
+    known = [duration for duration in
+             (self._history.get_expected_total_duration(name)
+              for name in names)
+             if duration is not None]
+    default = max(known) if known else 0
+    priorities = []
+    for name in names:
+      duration = self._get_expected_total_duration(name, default)
+      priorities.append((duration, duration))
+    return priorities
+
+  def get_subtask_priority(self, parent_priority, name):
+    return (parent_priority[0],
+            self._get_expected_total_duration(name, parent_priority[1]))
+
+  def predict_makespan(self, names, max_workers):
+    """Simulates running the tasks named |names| on |max_workers| workers.
+
+    Returns the expected wall time of the phase, or None if some task did
+    not run in the last configure.
+    """
+    if any(self._history.get_expected_duration(name) is None
+           for name in names):
+      return None
+    ready = []
+    for name, priority in zip(names, self.get_priorities(names)):
+      heapq.heappush(ready, ((-priority[0], -priority[1]), name))
+    running = []
+    now = 0
+    while ready or running:
+      while ready and len(running) < max_workers:
+        key, name = heapq.heappop(ready)
+        heapq.heappush(running, (
+            now + (self._history.get_expected_duration(name) or 0), key,
+            name))
+      now, key, name = heapq.heappop(running)
+      for subtask_name in self._history.get_expected_subtasks(name):
+        priority = self.get_subtask_priority((-key[0], -key[1]), subtask_name)
+        heapq.heappush(ready, ((-priority[0], -priority[1]), subtask_name))
+    return now
+
+
+class _TaskRecord(object):
+  """Keeps what is known about a running task."""
+
+  def __init__(self, name, priority):
+    self.name = name
+    self.priority = priority
+    self.duration = None
+    self.subtasks = []
+
+
+def _report_makespan(phase, predicted_makespan, actual_makespan):
+  if predicted_makespan is None:
+    message = '%s: actual makespan %0.3fs (no prediction)' % (
+        phase, actual_makespan)
+  else:
+    message = '%s: predicted makespan %0.3fs, actual makespan %0.3fs' % (
+        phase, predicted_makespan, actual_makespan)
+  logging.info(message)
+  if OPTIONS.verbose():
+    print message
+
+
+def run_in_parallel(task_list, maximum_jobs, phase=None):
   """Runs task_list in parallel on multiprocess.
 
-  Returns a list of NinjaGenerator created in subprocesses.
+  Returns a list of NinjaSummary of the NinjaGenerator created and emitted in
+  subprocesses.
   If |maximum_jobs| is set to 0, this function runs the ninja generation
   synchronously in process.
+  The tasks are scheduled by how long they took in the last configure, see
+  _TaskScheduler. The predicted and the actual wall time of the run are
+  reported with |phase| as its name.
   """
+  if OPTIONS.incremental_configure():
+    # Compute the common part of the cache keys before forking the workers.
+    configure_cache.prepare()
+
   if maximum_jobs == 0:
     executor = concurrent.SynchronousExecutor()
   else:
     executor = concurrent.ProcessPoolExecutor(max_workers=maximum_jobs)
 
+  phase = phase or 'Configure phase'
+  history = _TaskHistory(phase)
+  scheduler = _TaskScheduler(history)
+  names = [_get_task_name(task) for task in task_list]
+  if maximum_jobs is None:
+    maximum_jobs = multiprocessing.cpu_count()
+  predicted_makespan = scheduler.predict_makespan(names, max(1, maximum_jobs))
+  start_time = time.time()
+
   result_list = []
+  task_records = []
   with executor:
     try:
-      # Submit initial tasks.
-      not_done = {executor.submit(_run_task, task) for task in task_list}
+      # Submit initial tasks. The longest ones are submitted first, so that
+      # they start first even before the executor sees all the tasks.
+      initial_tasks = sorted(
+          zip(scheduler.get_priorities(names), names, task_list),
+          key=lambda entry: entry[0], reverse=True)
+      future_to_record = {}
+      for priority, name, task in initial_tasks:
+        record = _TaskRecord(name, priority)
+        task_records.append(record)
+        future = executor.submit_with_priority(priority, _run_task, task)
+        future_to_record[future] = record
+      not_done = set(future_to_record)
       while not_done:
         # Wait any task is completed.
         done, not_done = concurrent.wait(
@@ -126,12 +416,31 @@ def run_in_parallel(task_list, maximum_jobs):
             raise completed_future.exception()
 
           # The task is completed successfully. Process the result.
-          ninja_list, request_task_list = completed_future.result()
+          (ninja_list, request_task_list, regen_files, stats,
+           notice_index_entries) = completed_future.result()
+          dependency_inspection.add_regen_files(regen_files)
+          notice_index.add_entries(notice_index_entries)
+          record = future_to_record.pop(completed_future)
+          if not stats['cached']:
+            record.duration = stats['wall_time']
+          configure_profile.add_task(
+              record.name, stats, make_count=stats['make_count'],
+              build_count=stats['build_count'], cached=stats['cached'],
+              wall_time=stats['wall_time'])
           if request_task_list:
-            # If sub tasks are requested, submit them.
+            # If sub tasks are requested, submit them. They inherit the
+            # priority of the task.
             assert not ninja_list
-            not_done.update(
-                executor.submit(_run_task, task) for task in request_task_list)
+            for task in request_task_list:
+              name = _get_task_name(task)
+              record.subtasks.append(name)
+              subtask_record = _TaskRecord(
+                  name, scheduler.get_subtask_priority(record.priority, name))
+              task_records.append(subtask_record)
+              future = executor.submit_with_priority(
+                  subtask_record.priority, _run_task, task)
+              future_to_record[future] = subtask_record
+              not_done.add(future)
             continue
 
           result_list.extend(ninja_list)
@@ -141,6 +450,11 @@ def run_in_parallel(task_list, maximum_jobs):
         executor.terminate()
       raise
 
+  _report_makespan(phase, predicted_makespan, time.time() - start_time)
+  for record in task_records:
+    history.update(record.name, record.duration, record.subtasks)
+  history.save()
+
   # Sort the result by name for stabilization.
   result_list.sort(key=lambda ninja: ninja.get_module_name())
   return result_list
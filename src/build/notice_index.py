@@ -0,0 +1,158 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Index of the tracking paths and notice files used by notice collection.
+
+NinjaGenerator.add_notice_sources() needs the upstream tracking file of each
+input, which requires reading the head of the file, and Notices needs the
+directories which have NOTICE or MODULE_LICENSE_* files. The same files and
+directories are looked up many times by many ninja generators, so the results
+are memoized in each process, and persisted in out/ keyed by the mtime so that
+the next configure does not read the files again.
+
+The index is updated in worker processes. The new entries are returned to the
+parent process with the result of each task (see consume_new_entries), and
+written by save() at the end of configure.
+"""
+
+import cPickle
+import os
+import re
+
+import build_common
+import staging
+from build_common import get_arc_root
+
+# Bump this when the format of the index changes.
+_INDEX_VERSION = 1
+
+# Maps a source path to (mtime, size, tracking path candidate), and a
+# directory path to (mtime, has NOTICE, has MODULE_LICENSE_*).
+_index = None
+# The entries computed in this process, which are not in the index file yet.
+_new_entries = {}
+# Results already looked up in this process.
+_tracking_paths = {}
+_directories = {}
+
+
+def _get_index_file():
+  return os.path.join(get_arc_root(), build_common.OUT_DIR,
+                      'notice_index.pickle')
+
+
+def _ensure_loaded():
+  global _index
+  if _index is not None:
+    return
+  try:
+    with open(_get_index_file(), 'rb') as f:
+      version, index = cPickle.load(f)
+  except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+    version, index = None, {}
+  _index = index if version == _INDEX_VERSION else {}
+
+
+def _lookup(path, stat_result, compute):
+  """Returns the entry of |path|, calling |compute| when it is not valid."""
+  _ensure_loaded()
+  entry = _index.get(path)
+  if not entry or entry[:2] != (stat_result.st_mtime, stat_result.st_size):
+    entry = (stat_result.st_mtime, stat_result.st_size) + compute(path)
+    _index[path] = entry
+    _new_entries[path] = entry
+  return entry[2:]
+
+
+def _compute_tracking_path_candidate(path):
+  """Returns the path analyze_diffs.compute_tracking_path checks."""
+  # Imported here, as analyze_diffs depends on this module through notices.
+  import analyze_diffs
+  matcher = re.compile(
+      re.escape(analyze_diffs.FILE_TRACK_TAG) + r' "([^\"]+)"')
+  tracking_path = staging.get_default_tracking_path(path)
+  with open(path) as f:
+    for lineno, line in enumerate(f, 1):
+      if lineno > analyze_diffs.MAX_ARC_TRACK_SEARCH_LINES:
+        break
+      match = matcher.search(line)
+      if match:
+        tracking_path = match.group(1)
+        break
+  return (tracking_path,)
+
+
+def get_tracking_path(path):
+  """Returns the tracking file of |path|, or None.
+
+  This returns the same result as analyze_diffs.compute_tracking_path.
+  None is returned also when |path| does not exist.
+  """
+  if path in _tracking_paths:
+    return _tracking_paths[path]
+  try:
+    stat_result = os.stat(path)
+  except OSError:
+    tracking_path = None
+  else:
+    tracking_path = _lookup(path, stat_result,
+                            _compute_tracking_path_candidate)[0]
+    if tracking_path and not os.path.exists(tracking_path):
+      tracking_path = None
+  _tracking_paths[path] = tracking_path
+  return tracking_path
+
+
+def _compute_directory_entry(path):
+  names = os.listdir(path)
+  return ('NOTICE' in names,
+          any(name.startswith('MODULE_LICENSE_') for name in names))
+
+
+def has_notice_files(path):
+  """Returns a tuple of whether |path| has NOTICE and MODULE_LICENSE_* files.
+
+  Adding or removing a file updates the mtime of the directory, so the
+  persisted entry is invalidated then.
+  """
+  if path in _directories:
+    return _directories[path]
+  try:
+    stat_result = os.stat(path)
+    result = _lookup(path, stat_result, _compute_directory_entry)
+  except OSError:
+    result = (False, False)
+  _directories[path] = result
+  return result
+
+
+def consume_new_entries():
+  """Returns the entries computed in this process since the last call."""
+  global _new_entries
+  new_entries = _new_entries
+  _new_entries = {}
+  return new_entries
+
+
+def add_entries(entries):
+  """Adds the entries computed in a worker process."""
+  _ensure_loaded()
+  _index.update(entries)
+  _new_entries.update(entries)
+
+
+def save():
+  """Writes the index if it is updated in this configure."""
+  if not _new_entries:
+    return
+  index_file = _get_index_file()
+  try:
+    build_common.makedirs_safely(os.path.dirname(index_file))
+    build_common.write_atomically(
+        index_file,
+        cPickle.dumps((_INDEX_VERSION, _index), cPickle.HIGHEST_PROTOCOL))
+  except (IOError, OSError):
+    # The index is only a cache. It is built again next time.
+    pass
+  consume_new_entries()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tests for notice_index."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import analyze_diffs
+import notice_index
+
+
+class NoticeIndexTest(unittest.TestCase):
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._original_get_index_file = notice_index._get_index_file
+    notice_index._get_index_file = (
+        lambda: os.path.join(self._temp_dir, 'index.pickle'))
+    self._reset()
+
+  def tearDown(self):
+    notice_index._get_index_file = self._original_get_index_file
+    self._reset()
+    shutil.rmtree(self._temp_dir)
+
+  def _reset(self):
+    notice_index._index = None
+    notice_index._new_entries = {}
+    notice_index._tracking_paths = {}
+    notice_index._directories = {}
+
+  def _write(self, name, content, mtime=None):
+    path = os.path.join(self._temp_dir, name)
+    with open(path, 'w') as f:
+      f.write(content)
+    if mtime is not None:
+      os.utime(path, (mtime, mtime))
+    return path
+
+  def test_tracking_path(self):
+    tracked = self._write('tracked.c', '')
+    path = self._write('mod.c', '// %s "%s"\n' % (
+        analyze_diffs.FILE_TRACK_TAG, tracked), mtime=1000)
+    self.assertEquals(tracked, notice_index.get_tracking_path(path))
+    self.assertEquals(None, notice_index.get_tracking_path(
+        os.path.join(self._temp_dir, 'missing.c')))
+    notice_index.save()
+
+    # The persisted entry is used while the file is unchanged.
+    self._reset()
+    self.assertEquals(tracked, notice_index.get_tracking_path(path))
+    self.assertFalse(notice_index.consume_new_entries())
+
+    # The entry is computed again when the file is changed.
+    self._reset()
+    self._write('mod.c', '// No tracking tag.\n', mtime=2000)
+    self.assertEquals(None, notice_index.get_tracking_path(path))
+    self.assertEquals([path], notice_index.consume_new_entries().keys())
+
+  def test_has_notice_files(self):
+    self.assertEquals((False, False),
+                      notice_index.has_notice_files(self._temp_dir))
+    self._reset()
+    self._write('NOTICE', '')
+    self._write('MODULE_LICENSE_BSD', '')
+    self.assertEquals((True, True),
+                      notice_index.has_notice_files(self._temp_dir))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -4,6 +4,7 @@
 
 import build_common
 import glob
+import notice_index
 import os
 import staging
 
@@ -74,8 +75,16 @@ class Notices(object):
       return None
     if (start_path, filespec) in self._parent_cache:
       return self._parent_cache[start_path, filespec]
-    if (('*' in filespec and glob.glob(os.path.join(start_path, filespec))) or
-        os.path.exists(os.path.join(start_path, filespec))):
+    has_notice, has_license = notice_index.has_notice_files(start_path)
+    if filespec == 'NOTICE':
+      found = has_notice
+    elif filespec == 'MODULE_LICENSE_*':
+      found = has_license
+    else:
+      found = (
+          ('*' in filespec and glob.glob(os.path.join(start_path, filespec))) or
+          os.path.exists(os.path.join(start_path, filespec)))
+    if found:
       self._parent_cache[start_path, filespec] = start_path
       return start_path
     parent_result = self._find_parent_file(os.path.dirname(start_path),
@@ -13,6 +13,7 @@
 # Code to create out/staging of properly overlaid files.  All
 # files are created as symlinks.
 
+import argparse
 import os
 import shutil
 import subprocess
@@ -20,6 +21,7 @@ import sys
 
 import build_common
 import build_options
+import dependency_inspection
 
 _GIT_DIR = '.git'
 _SRC_DIR = 'src'
@@ -32,6 +34,71 @@ TESTS_BASE_PATH = 'src/build/tests/analyze_diffs'
 TESTS_MODS_PATH = os.path.join(TESTS_BASE_PATH, 'mods')
 TESTS_THIRD_PARTY_PATH = os.path.join(TESTS_BASE_PATH, 'third_party')
 
+# The _OverlayResolver of the staging directory created in this process, or
+# None. Worker processes forked by configure inherit it.
+_resolver = None
+
+
+class _OverlayResolver(object):
+  """Resolves paths in the staging directory without reading the symlinks.
+
+  The resolver knows the layout of the staging directory from the overlay
+  computed by create_staging(), so that as_real_path() only needs to check
+  whether the resolved file itself is a symlink. The real paths of the
+  directories in mods/ and third_party/ are memoized, as configure does not
+  change them after staging is created.
+  """
+
+  def __init__(self, staging_root, overlay):
+    self._staging_root = staging_root
+    self._overlay = overlay
+    self._in_staging_top_levels = {}
+    self._real_dirs = {}
+
+  def is_in_staging(self, top_level):
+    result = self._in_staging_top_levels.get(top_level)
+    if result is None:
+      result = os.path.exists(os.path.join('third_party', top_level))
+      self._in_staging_top_levels[top_level] = result
+    return result
+
+  def _get_overlaid_path(self, staging_path):
+    """Returns the path which the staging path points to, or None."""
+    if (os.path.normpath(staging_path) != staging_path or
+        not staging_path.startswith(self._staging_root + os.sep)):
+      return None
+    path = staging_path
+    rest = []
+    while path != self._staging_root:
+      target = self._overlay.get(path, '')
+      if target is _DIRECTORY:
+        # Real directories and files in them are not created by staging.
+        return None
+      if target:
+        overlaid_path = os.path.normpath(
+            os.path.join(os.path.dirname(path), target, *reversed(rest)))
+        if overlaid_path.startswith(os.pardir):
+          return None
+        return overlaid_path
+      rest.append(os.path.basename(path))
+      path = os.path.dirname(path)
+    return None
+
+  def get_real_path(self, staging_path):
+    """Returns os.path.realpath(staging_path), or None if not resolvable."""
+    path = self._get_overlaid_path(staging_path)
+    if path is None:
+      return None
+    dirname, basename = os.path.split(path)
+    real_dir = self._real_dirs.get(dirname)
+    if real_dir is None:
+      real_dir = os.path.realpath(dirname)
+      self._real_dirs[dirname] = real_dir
+    path = os.path.join(real_dir, basename)
+    if os.path.islink(path):
+      return os.path.realpath(path)
+    return path
+
 
 def is_in_staging(input_path):
   """Does this input path look like one that should come from staging.
@@ -39,8 +106,11 @@ def is_in_staging(input_path):
   Examples are src/*, android/*, libyuv/*, chromium-ppapi/*.
   """
   top_level = input_path.split(os.path.sep)[0]
-  return (top_level in ['android', 'src', 'android_libcommon'] or
-          os.path.exists(os.path.join('third_party', top_level)))
+  if top_level in ['android', 'src', 'android_libcommon']:
+    return True
+  if _resolver:
+    return _resolver.is_in_staging(top_level)
+  return os.path.exists(os.path.join('third_party', top_level))
 
 
 def get_default_tracking_path(our_path):
@@ -91,8 +161,20 @@ def as_real_path(input_path):
   example input:   android/frameworks/base/...
   example real path: mods/android/frameworks/base/...
   """
-  path = os.path.realpath(as_staging(input_path))
-  return os.path.relpath(path, build_common.get_arc_root())
+  staging_path = as_staging(input_path)
+  path = _resolver.get_real_path(staging_path) if _resolver else None
+  if path is None:
+    path = os.path.realpath(staging_path)
+  result = os.path.relpath(path, build_common.get_arc_root())
+  # The resolver memoizes the real paths of directories, so the result is
+  # recorded here rather than by the probes of os.path.
+  dependency_inspection.add_probe('staging.as_real_path', (input_path,),
+                                  result)
+  return result
+
+
+dependency_inspection.register_probe_function('staging.as_real_path',
+                                              as_real_path)
 
 
 def third_party_to_staging(path):
@@ -114,16 +196,24 @@ def third_party_to_staging(path):
   return path
 
 
-def _create_symlink(src_path, dest_dir):
-  """Creates a symlink pointing to src_path in dest_dir with the same name."""
-  os.symlink(os.path.relpath(src_path, dest_dir),
-             os.path.join(dest_dir, os.path.basename(src_path)))
+# The staging tree is computed as a dict from a path in it to the target of the
+# symlink at the path, or to _DIRECTORY if the path is a real directory.
+_DIRECTORY = None
+
 
+def _add_symlink(src_path, dest_dir, overlay):
+  """Adds a symlink pointing to src_path in dest_dir with the same name."""
+  link_path = os.path.join(dest_dir, os.path.basename(src_path))
+  if link_path in overlay:
+    raise Exception('Conflicting entries in the staging directory: ' +
+                    link_path)
+  overlay[link_path] = os.path.relpath(src_path, dest_dir)
 
-def _create_overlay_base(base_dir, overlays, dest_dir):
-  """Creates symlinks to files and directories in base_dir.
 
-  This is a helper of _create_symlink_tree(). it creates symlinks to files and
+def _add_overlay_base(base_dir, overlays, dest_dir, overlay):
+  """Adds symlinks to files and directories in base_dir.
+
+  This is a helper of _add_symlink_tree(). it adds symlinks to files and
   directories in base_dir, except ones in overlays, into dest_dir.
   "overlays" is a list of file and directory basenames in the overlay directory
   corresponding to the given base_dir.
@@ -149,7 +239,7 @@ def _create_overlay_base(base_dir, overlays, dest_dir):
 
   # If there is no directory at base_dir, it means a new directory is
   # introduced under the corresponding path in mods_root of
-  # _create_symlink_tree(). Skip it.
+  # _add_symlink_tree(). Skip it.
   if not os.path.lexists(base_dir):
     return
 
@@ -158,29 +248,25 @@ def _create_overlay_base(base_dir, overlays, dest_dir):
       continue
     if name == _GIT_DIR or name in overlays:
       continue
-    _create_symlink(os.path.join(base_dir, name), dest_dir)
+    _add_symlink(os.path.join(base_dir, name), dest_dir, overlay)
 
 
-def _create_symlink_tree(mods_root, third_party_root, staging_root):
-  """Creates a symlink tree of mods_root overlaid on third_party_root.
+def _add_symlink_tree(mods_root, third_party_root, staging_root, overlay):
+  """Adds a symlink tree of mods_root overlaid on third_party_root.
 
-  This method creates the symlink tree of mods_root directory (working as
+  This method adds the symlink tree of mods_root directory (working as
   same as recursive copy, but all files are symlinked instead of actual file
-  copy).
+  copy) to overlay.
 
-  If third_party_root is given, each created directory is overlaid on the
+  If third_party_root is given, each directory is overlaid on the
   corresponding directory in third_party_root (if exists).
   For example:
   Suppose mods_root is "mods/", third_party_root is "third_party/" and
   staging_root is "out/staging/", then the symlink tree of mods/android/...
-  will be created at out/staging/android/..., with overlaying
-  third_party/android/...
+  will be at out/staging/android/..., with overlaying third_party/android/...
   """
-  staging_root_parent = os.path.dirname(staging_root)
-  build_common.makedirs_safely(staging_root_parent)
-
   if os.path.exists('mods/chromium-ppapi/base'):
-    # See comments in _create_overlay_base.
+    # See comments in _add_overlay_base.
     raise Exception('Putting headers in mods/chromium-ppapi/base will '
                     'cause code in chromium_org libbase implementation to '
                     'include headers from chromium-ppapi libbase and will '
@@ -193,41 +279,24 @@ def _create_symlink_tree(mods_root, third_party_root, staging_root):
 
     relpath = os.path.relpath(dirpath, mods_root)
     dest_dir = os.path.normpath(os.path.join(staging_root, relpath))
-    if not os.path.exists(dest_dir):
-      os.mkdir(dest_dir)
+    if overlay.setdefault(dest_dir, _DIRECTORY) is not _DIRECTORY:
+      raise Exception('Conflicting entries in the staging directory: ' +
+                      dest_dir)
 
-    # Create symlinks for files.
+    # Add symlinks for files.
     for name in fnames:
-      _create_symlink(os.path.join(dirpath, name), dest_dir)
+      _add_symlink(os.path.join(dirpath, name), dest_dir, overlay)
 
     if third_party_root:
-      _create_overlay_base(
-          os.path.join(third_party_root, relpath), dirs + fnames, dest_dir)
+      _add_overlay_base(
+          os.path.join(third_party_root, relpath), dirs + fnames, dest_dir,
+          overlay)
 
 
-def _get_link_targets(root):
-  link_target_map = {}
-  for dirpath, dirs, fnames in os.walk(root):
-    for name in fnames:
-      link_path = os.path.join(dirpath, name)
-      if os.path.islink(link_path):
-        link_target_map[link_path] = os.readlink(link_path)
-  return link_target_map
-
-
-def create_staging():
-  timer = build_common.SimpleTimer()
-  timer.start('Staging source files', True)
-
-  staging_root = build_common.get_staging_root()
-
-  # Store where all the old staging links pointed so we can compare after.
-  old_staging_links = _get_link_targets(staging_root)
-
-  if os.path.lexists(staging_root):
-    shutil.rmtree(staging_root)
-
-  _create_symlink_tree(_MODS_DIR, _THIRD_PARTY_DIR, staging_root)
+def _compute_overlay(staging_root):
+  """Returns the dict representing the staging tree to be created."""
+  overlay = {}
+  _add_symlink_tree(_MODS_DIR, _THIRD_PARTY_DIR, staging_root, overlay)
 
   # internal/ is an optional checkout
   if build_options.OPTIONS.internal_apks_source() == 'internal':
@@ -236,24 +305,154 @@ def create_staging():
       if os.path.exists(os.path.join(_THIRD_PARTY_DIR, name)):
         raise Exception('Name conflict between internal/third_party and '
                         'third_party: ' + name)
-    _create_symlink_tree(_INTERNAL_MODS_PATH, _INTERNAL_THIRD_PARTY_PATH,
-                         staging_root)
-    subprocess.check_call('internal/build/fix_staging.py')
+    _add_symlink_tree(_INTERNAL_MODS_PATH, _INTERNAL_THIRD_PARTY_PATH,
+                      staging_root, overlay)
 
   # src/ is not overlaid on any directory.
-  _create_symlink_tree(_SRC_DIR, None, os.path.join(staging_root, 'src'))
+  _add_symlink_tree(_SRC_DIR, None, os.path.join(staging_root, 'src'), overlay)
+  return overlay
+
+
+def _scan_staging(staging_root):
+  """Returns the dict representing the existing staging tree.
+
+  Regular files, which are not created by staging, are mapped to ''.
+  """
+  existing = {}
+  if not os.path.lexists(staging_root):
+    return existing
+  if os.path.islink(staging_root) or not os.path.isdir(staging_root):
+    existing[staging_root] = ''
+    return existing
+  for dirpath, dirs, fnames in os.walk(staging_root):
+    existing[dirpath] = _DIRECTORY
+    for name in dirs + fnames:
+      path = os.path.join(dirpath, name)
+      if os.path.islink(path):
+        existing[path] = os.readlink(path)
+      elif name in fnames:
+        existing[path] = ''
+  return existing
+
+
+def _compute_changes(existing, overlay):
+  """Returns the list of (action, path) to update existing to overlay.
+
+  The action is one of 'remove', 'create' and 'retarget'. The removals come
+  first, and parent directories are created before their contents.
+  """
+  removed = []
+  created = []
+  # Sort by the components so that the contents of a directory follow it.
+  for path in sorted(set(existing) | set(overlay),
+                     key=lambda path: path.split(os.sep)):
+    if path not in overlay:
+      removed.append(('remove', path))
+    elif path not in existing:
+      created.append(('create', path))
+    elif existing[path] != overlay[path]:
+      if existing[path] and overlay[path]:
+        created.append(('retarget', path))
+      else:
+        # A directory is replaced by a symlink, or vice versa.
+        removed.append(('remove', path))
+        created.append(('create', path))
+
+  # Removing a directory removes its contents too.
+  changes = []
+  removed_dir = None
+  for action, path in removed:
+    if removed_dir and path.startswith(removed_dir + os.sep):
+      continue
+    if existing[path] is _DIRECTORY:
+      removed_dir = path
+    changes.append((action, path))
+  return changes + created
+
+
+def _apply_changes(changes, existing, overlay):
+  """Applies the changes computed by _compute_changes.
+
+  Returns the link targets before the changes of the modified symlinks to
+  files, which are the targets of os.utime after staging is done.
+  """
+  old_file_links = {}
+  for action, path in changes:
+    if existing.get(path) and os.path.islink(path) and not os.path.isdir(path):
+      old_file_links[path] = existing[path]
+    if action == 'remove' or action == 'retarget':
+      if existing[path] is _DIRECTORY:
+        shutil.rmtree(path)
+      else:
+        os.unlink(path)
+    if action == 'create' or action == 'retarget':
+      if overlay[path] is _DIRECTORY:
+        os.mkdir(path)
+      else:
+        os.symlink(overlay[path], path)
+  return old_file_links
+
+
+def compute_staging_changes():
+  """Returns the list of (action, path) which create_staging() would do."""
+  staging_root = build_common.get_staging_root()
+  return _compute_changes(_scan_staging(staging_root),
+                          _compute_overlay(staging_root))
+
+
+def create_staging(dry_run=False):
+  """Updates the staging directory.
+
+  Only the entries which differ from the existing staging directory are
+  created, removed or retargeted. If dry_run is True, the changes are printed
+  instead.
+  """
+  timer = build_common.SimpleTimer()
+  timer.start('Staging source files', True)
+
+  staging_root = build_common.get_staging_root()
+  build_common.makedirs_safely(os.path.dirname(staging_root))
+  existing = _scan_staging(staging_root)
+  overlay = _compute_overlay(staging_root)
+  changes = _compute_changes(existing, overlay)
+
+  if dry_run:
+    timer.done()
+    for action, path in changes:
+      print '%s %s' % (action, path)
+    print '%d changes in %s' % (len(changes), staging_root)
+    return True
+
+  old_file_links = _apply_changes(changes, existing, overlay)
+
+  global _resolver
+  _resolver = None
+  if build_options.OPTIONS.internal_apks_source() == 'internal':
+    # fix_staging.py changes the tree, so the overlay cannot be used to
+    # resolve the paths.
+    subprocess.check_call('internal/build/fix_staging.py')
+  elif os.path.realpath(staging_root) == os.path.abspath(staging_root):
+    _resolver = _OverlayResolver(staging_root, overlay)
 
   # Update modification time for files that do not point to the same location
   # that they pointed to in the previous tree to make sure they are built.
-  new_staging_links = _get_link_targets(staging_root)
-  for key in new_staging_links:
-    if key in old_staging_links:
-      if old_staging_links[key] != new_staging_links[key]:
-        os.utime(key, None)
+  for path, old_target in old_file_links.iteritems():
+    if (os.path.islink(path) and not os.path.isdir(path) and
+        os.readlink(path) != old_target):
+      os.utime(path, None)
 
   timer.done()
   return True
 
 
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--dry-run', action='store_true',
+                      help='Print the changes to the staging directory '
+                      'instead of applying them.')
+  args = parser.parse_args()
+  return create_staging(dry_run=args.dry_run)
+
+
 if __name__ == '__main__':
-  sys.exit(not create_staging())
+  sys.exit(not main())
@@ -5,6 +5,9 @@
 
 """Tests for staging."""
 
+import os
+import shutil
+import tempfile
 import unittest
 
 import staging
@@ -67,6 +70,67 @@ class StagingTest(unittest.TestCase):
     self.assertEquals('third_party/foo/bar', third)
     self.assertEquals('mods/foo/bar', mods)
 
+  def test_compute_changes(self):
+    existing = {
+        'out/staging': None,
+        'out/staging/a': None,
+        'out/staging/a/b': '../../../mods/a/b',
+        'out/staging/a/c': '../../../third_party/a/c',
+        'out/staging/a/d': None,
+        'out/staging/a/d/e': '../../../../mods/a/d/e',
+        'out/staging/a-x': '',
+        'out/staging/f': '../../third_party/f'}
+    overlay = {
+        'out/staging': None,
+        'out/staging/a': None,
+        'out/staging/a/b': '../../../mods/a/b',
+        'out/staging/a/c': '../../../mods/a/c',
+        'out/staging/a/d': '../../../third_party/a/d',
+        'out/staging/f': None,
+        'out/staging/f/g': '../../../mods/f/g'}
+    self.assertEquals([('remove', 'out/staging/a/d'),
+                       ('remove', 'out/staging/a-x'),
+                       ('remove', 'out/staging/f'),
+                       ('retarget', 'out/staging/a/c'),
+                       ('create', 'out/staging/a/d'),
+                       ('create', 'out/staging/f'),
+                       ('create', 'out/staging/f/g')],
+                      staging._compute_changes(existing, overlay))
+    self.assertEquals([], staging._compute_changes(overlay, overlay))
+
+  def test_overlay_resolver(self):
+    temp_dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+      os.chdir(temp_dir)
+      for path in ['mods/a/b', 'third_party/a/c/d', 'third_party/e']:
+        os.makedirs(path)
+      os.symlink('d', 'third_party/a/c/link')
+      overlay = {
+          'out/staging': None,
+          'out/staging/a': None,
+          'out/staging/a/b': '../../../mods/a/b',
+          'out/staging/a/c': '../../../third_party/a/c',
+          'out/staging/e': '../../third_party/e'}
+      resolver = staging._OverlayResolver('out/staging', overlay)
+      expectations = [
+          ('out/staging/a/b', 'mods/a/b'),
+          ('out/staging/a/b/f', 'mods/a/b/f'),
+          ('out/staging/a/c/d/g', 'third_party/a/c/d/g'),
+          ('out/staging/a/c/link/h', 'third_party/a/c/d/h'),
+          ('out/staging/e', 'third_party/e')]
+      for path, expected in expectations:
+        self.assertEquals(os.path.join(os.path.realpath(temp_dir), expected),
+                          resolver.get_real_path(path))
+      # Paths which are not created by staging are not resolved.
+      self.assertEquals(None, resolver.get_real_path('out/staging/a'))
+      self.assertEquals(None, resolver.get_real_path('out/staging/a/x'))
+      self.assertEquals(None, resolver.get_real_path('out/staging/a/../e'))
+      self.assertEquals(None, resolver.get_real_path('canned/foo'))
+    finally:
+      os.chdir(cwd)
+      shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
   unittest.main()
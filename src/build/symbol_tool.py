@@ -19,13 +19,50 @@
 # $ ./src/build/symbol_tool --verify input.list disallowed.list
 #    (Reports errors if input.list contains symbols listed in disallowed.list)
 #
+# 5) Dump symbols of many files in one process
+# $ ./src/build/symbol_tool --dump-undefined --batch foo.o foo.list \
+#     bar.o bar.list
+#    (Each list is written only when its content changes)
+#
 
 import argparse
 import subprocess
 import sys
-import toolchain
 
-from build_options import OPTIONS
+import build_common
+from util import elf_symbols
+
+
+def _get_defined_symbols(path):
+  return sorted(set(
+      symbol.name for symbol in elf_symbols.get_symbols(path)
+      if symbol.is_defined and elf_symbols.is_external(symbol)))
+
+
+def _get_undefined_symbols(path):
+  # Weak undefined symbols are not listed.
+  return sorted(set(symbol.name for symbol in elf_symbols.get_symbols(path)
+                    if symbol.nm_type == 'U'))
+
+
+def _dump_symbols(get_symbols, args, batch):
+  if not batch:
+    for name in get_symbols(args[0]):
+      print name
+    return 0
+  if len(args) % 2:
+    print '--batch takes pairs of an input and an output.'
+    return 1
+  for input_path, output_path in zip(args[::2], args[1::2]):
+    content = ''.join(name + '\n' for name in get_symbols(input_path))
+    try:
+      with open(output_path) as f:
+        if f.read() == content:
+          continue
+    except IOError:
+      pass
+    build_common.write_atomically(output_path, content)
+  return 0
 
 
 def main():
@@ -36,31 +73,25 @@ def main():
       help='Dump defined symbols from the given shared object.')
   parser.add_argument(
       '--dump-undefined', action='store_true',
-      help='Dump defined symbols from the given shared object.')
+      help='Dump undefined symbols from the given object.')
   parser.add_argument(
       '--clean', action='store_true',
       help='Copy symbols file with comments stripped.')
   parser.add_argument(
       '--verify', action='store_true',
       help='Verify that file 1 does not contain symbols listed in file 2.')
+  parser.add_argument(
+      '--batch', action='store_true',
+      help='Dump symbols of pairs of an input and an output file.')
   parser.add_argument('args', nargs=argparse.REMAINDER)
 
   args = parser.parse_args()
 
-  OPTIONS.parse_configure_file()
-  nm = toolchain.get_tool(OPTIONS.target(), 'nm')
-
   if args.dump_defined:
-    command = (nm + ' --defined-only --extern-only --format=posix %s | '
-               'sed -n \'s/^\(.*\) [A-Za-z].*$/\\1/p\' | '
-               'LC_ALL=C sort -u' % args.args[0])
-    return subprocess.check_call(command, shell=True)
+    return _dump_symbols(_get_defined_symbols, args.args, args.batch)
 
   elif args.dump_undefined:
-    command = (nm + ' --undefined-only --format=posix %s | '
-               'sed -n \'s/^\(.*\) U.*$/\\1/p\' | '
-               'LC_ALL=C sort -u' % args.args[0])
-    return subprocess.check_call(command, shell=True)
+    return _dump_symbols(_get_undefined_symbols, args.args, args.batch)
 
   elif args.clean:
     command = ('egrep -ve "^#" %s | LC_ALL=C sort' % args.args[0])
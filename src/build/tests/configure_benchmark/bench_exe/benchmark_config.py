@@ -0,0 +1,27 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Executables of the configure benchmark, which depend on other ninjas."""
+
+import os
+
+import build_common
+import ninja_generator
+
+
+def generate_shared_lib_depending_ninjas(installed_shared_libs):
+  n = ninja_generator.ExecNinjaGenerator(
+      'bench_exe', base_path='src/build/tests/configure_benchmark/bench_exe')
+  sources = n.find_all_sources(include_tests=True)
+  n.build_default(sources, base_path=None)
+  n.add_library_deps(*[os.path.basename(path) for path in installed_shared_libs
+                       if os.path.basename(path).startswith('libbench_')])
+  n.link()
+
+
+def generate_binaries_depending_ninjas(root_dir_install_all_targets):
+  n = ninja_generator.NinjaGenerator('bench_binaries_stamp')
+  n.rule('bench_stamp', 'touch $out')
+  n.build(os.path.join(build_common.get_build_dir(), 'bench_binaries.stamp'),
+          'bench_stamp', implicit=sorted(root_dir_install_all_targets))
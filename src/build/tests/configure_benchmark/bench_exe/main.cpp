@@ -0,0 +1,9 @@
+// Copyright 2014 The Chromium Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+extern "C" int bench_shared_quadruple(int value);
+
+int main() {
+  return bench_shared_quadruple(0);
+}
@@ -0,0 +1,9 @@
+// Copyright 2014 The Chromium Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#include "bench/base.h"
+
+int bench_base_add(int a, int b) {
+  return a + b;
+}
@@ -0,0 +1,28 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Archives of the configure benchmark."""
+
+import ninja_generator
+from ninja_generator_runner import request_run_in_parallel
+
+# The number of copies of the archive, each of which is generated by a task.
+_COPIES = 32
+
+
+def _generate_libbench_base_ninja(index):
+  n = ninja_generator.ArchiveNinjaGenerator(
+      'libbench_base_%d' % index,
+      base_path='src/build/tests/configure_benchmark/libbench_base')
+  n.add_include_paths('src/build/tests/configure_benchmark/libbench_base/'
+                      'include')
+  n.emit_framework_common_flags()
+  n.add_defines('BENCH_INDEX=%d' % index)
+  sources = n.find_all_sources(include_tests=True)
+  n.build_default(sources, base_path=None).archive()
+
+
+def generate_ninjas():
+  request_run_in_parallel(*[(_generate_libbench_base_ninja, index)
+                            for index in xrange(_COPIES)])
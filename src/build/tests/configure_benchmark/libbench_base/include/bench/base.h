@@ -0,0 +1,22 @@
+// Copyright 2014 The Chromium Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#ifndef BENCH_BASE_H_
+#define BENCH_BASE_H_
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+int bench_base_add(int a, int b);
+
+#ifdef __cplusplus
+}  // extern "C"
+
+namespace bench {
+int Twice(int value);
+}  // namespace bench
+#endif
+
+#endif  // BENCH_BASE_H_
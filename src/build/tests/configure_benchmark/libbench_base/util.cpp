@@ -0,0 +1,13 @@
+// Copyright 2014 The Chromium Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#include "bench/base.h"
+
+namespace bench {
+
+int Twice(int value) {
+  return bench_base_add(value, value);
+}
+
+}  // namespace bench
@@ -0,0 +1,11 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+LOCAL_PATH := $(call my-dir)
+
+include $(CLEAR_VARS)
+LOCAL_MODULE := libbench_mk
+LOCAL_SRC_FILES := mk.c
+LOCAL_CFLAGS := -DBENCH_MK=1
+include $(BUILD_STATIC_LIBRARY)
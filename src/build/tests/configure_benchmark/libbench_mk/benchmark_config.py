@@ -0,0 +1,12 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""A module of the configure benchmark translated from Android.mk."""
+
+import make_to_ninja
+
+
+def generate_ninjas():
+  make_to_ninja.MakefileNinjaTranslator(
+      'src/build/tests/configure_benchmark/libbench_mk').generate()
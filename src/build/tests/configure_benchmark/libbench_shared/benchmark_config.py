@@ -0,0 +1,28 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Shared objects of the configure benchmark."""
+
+import ninja_generator
+from ninja_generator_runner import request_run_in_parallel
+
+# Keep this in sync with libbench_base/benchmark_config.py.
+_COPIES = 32
+
+
+def _generate_libbench_shared_ninja(index):
+  n = ninja_generator.SharedObjectNinjaGenerator(
+      'libbench_shared_%d' % index,
+      base_path='src/build/tests/configure_benchmark/libbench_shared')
+  n.add_include_paths('src/build/tests/configure_benchmark/libbench_base/'
+                      'include')
+  sources = n.find_all_sources(include_tests=True)
+  n.build_default(sources, base_path=None)
+  n.add_library_deps('libbench_base_%d.a' % index)
+  n.link()
+
+
+def generate_ninjas():
+  request_run_in_parallel(*[(_generate_libbench_shared_ninja, index)
+                            for index in xrange(_COPIES)])
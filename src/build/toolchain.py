@@ -4,6 +4,8 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import distutils.spawn
+import json
 import os
 import subprocess
 import sys
@@ -32,6 +34,15 @@ _CLANG_INCLUDE_DIR = os.path.join(_CLANG_DIR, 'lib', 'clang', '3.5', 'include')
 # Used in get_gcc_raw_version().
 _GCC_RAW_VERSION_CACHE = {}
 
+# The results of running compilers, shared by the processes of configure. See
+# _get_probe_result().
+_PROBE_CACHE_FILE = 'toolchain_probe_cache.json'
+
+# The result of _compute_tool_map(), and the OPTIONS and the environment
+# variables it is computed for.
+_tool_map = None
+_tool_map_key = None
+
 # The pinned version of the Android SDK's build tools is used for ARC build.
 _ANDROID_SDK_BUILD_TOOLS_PINNED_VERSION = '19.1.0'
 
@@ -195,7 +206,7 @@ def _get_valgrind_runner(target):
       valgrind_env, valgrind_path, ' '.join(valgrind_options), runner)
 
 
-def _get_tool_map():
+def _compute_tool_map():
   android_build_tools_dir = _get_android_build_tools_dir()
   android_sdk_build_tools_dir = get_android_sdk_build_tools_dir()
 
@@ -331,6 +342,25 @@ def _get_tool_map():
   }
 
 
+def _get_tool_map():
+  """Returns the dict from targets to their tool maps.
+
+  The result is memoized, and computed again only when OPTIONS or the
+  environment variables are changed. The caller must not modify it.
+  """
+  global _tool_map, _tool_map_key
+  key = (OPTIONS.get_all_values(), dict(os.environ))
+  if _tool_map is None or key != _tool_map_key:
+    _tool_map = _compute_tool_map()
+    _tool_map_key = key
+  return _tool_map
+
+
+def get_tool_map(target):
+  """Returns a dict from tool names to the commands for |target|."""
+  return dict(_get_tool_map()[target])
+
+
 def get_tool(target, tool, with_cc_wrapper=True):
   if tool == 'asm' or tool == 'asm_with_preprocessing':
     tool = 'cc'
@@ -343,6 +373,55 @@ def get_tool(target, tool, with_cc_wrapper=True):
   return command
 
 
+def _get_probe_key(command):
+  """Returns the paths and the mtimes of the executables in |command|.
+
+  None is returned if an executable is not found.
+  """
+  key = []
+  for word in command:
+    if word.startswith('-'):
+      continue
+    path = word if os.sep in word else distutils.spawn.find_executable(word)
+    if not path or not os.path.exists(path):
+      return None
+    path = os.path.realpath(path)
+    key.append([path, os.path.getmtime(path)])
+  return key
+
+
+def _get_probe_result(command):
+  """Returns the stripped output of |command|, which runs a compiler.
+
+  The output is cached in out/, keyed by the paths and the mtimes of the
+  executables, so that the worker processes of configure and the following
+  runs of configure do not need to run the compiler again.
+  """
+  cache_file = os.path.join(build_common.get_arc_root(), build_common.OUT_DIR,
+                            _PROBE_CACHE_FILE)
+  key = _get_probe_key(command)
+  name = ' '.join(command)
+  try:
+    with open(cache_file) as f:
+      cache = json.load(f)
+  except (IOError, ValueError):
+    cache = {}
+  entry = cache.get(name)
+  if key is not None and entry and entry['key'] == key:
+    return str(entry['output'])
+
+  output = subprocess.check_output(command).strip()
+  if key is not None:
+    cache[name] = {'key': key, 'output': output}
+    try:
+      build_common.makedirs_safely(os.path.dirname(cache_file))
+      build_common.write_atomically(cache_file, json.dumps(cache, indent=2))
+    except (IOError, OSError):
+      # The cache is optional.
+      pass
+  return output
+
+
 def get_gcc_raw_version(target):
   """Returns the gcc version of as a string like "4.8.2"."""
 
@@ -351,7 +430,7 @@ def get_gcc_raw_version(target):
     return raw_version
   cc = get_tool(target, 'cc')
   # Should call split() as cc might be prefixed with a wrapper like goma.
-  raw_version = subprocess.check_output(cc.split() + ['-dumpversion']).strip()
+  raw_version = _get_probe_result(cc.split() + ['-dumpversion'])
 
   _GCC_RAW_VERSION_CACHE[target] = raw_version
   return raw_version
@@ -6,6 +6,7 @@
 
 import Queue
 import collections
+import itertools
 import logging
 import multiprocessing
 import multiprocessing.queues
@@ -92,6 +93,14 @@ class Executor(object):
   def submit(self, fn, *args, **kwargs):
     raise NotImplemented()
 
+  def submit_with_priority(self, priority, fn, *args, **kwargs):
+    """Same as submit(), but tasks with higher |priority| are started first.
+
+    This is an extension to the Python 3 interface. Executors which do not
+    support priorities ignore |priority|.
+    """
+    return self.submit(fn, *args, **kwargs)
+
   def shutdown(self, wait=True):
     raise NotImplemented()
 
@@ -216,7 +225,7 @@ def _broker_thread_run(
       while True:
         # Try to take a task from task_queue. If the task is already cancelled
         # just skip it, and retry.
-        task = task_queue.get_nowait()
+        task = task_queue.get_nowait().task
         # task[3] is its Future instance.
         if task is None or task[3].set_running_or_notify_cancel():
           # Found a sentinel, or a non-cancelled task.
@@ -241,8 +250,30 @@ def _broker_thread_run(
     num_available_workers -= 1
 
 
+class _PrioritizedTask(object):
+  """An entry of the task queue of ProcessPoolExecutor.
+
+  Tasks with higher priority come first, and tasks with the same priority
+  come in the submitted order. The sentinel, whose |task| is None, comes
+  last.
+  """
+  def __init__(self, priority, sequence, task):
+    self.priority = priority
+    self.sequence = sequence
+    self.task = task
+
+  def __cmp__(self, other):
+    return (cmp(self.task is None, other.task is None) or
+            cmp(other.priority, self.priority) or
+            cmp(self.sequence, other.sequence))
+
+
 class ProcessPoolExecutor(Executor):
-  """Process base implementation of Executor."""
+  """Process base implementation of Executor.
+
+  Tasks submitted by submit_with_priority() are started in the order of their
+  priority. Tasks submitted by submit() have priority 0.
+  """
   def __init__(self, max_workers=None):
     super(ProcessPoolExecutor, self).__init__()
     if max_workers is None:
@@ -252,8 +283,9 @@ class ProcessPoolExecutor(Executor):
     self._shutdown = False
 
     # |task_queue| is a queue to send a task from the main thread to the broker
-    # thread.
-    self._task_queue = Queue.Queue()
+    # thread. See _PrioritizedTask for the order of the tasks.
+    self._task_queue = Queue.PriorityQueue()
+    self._task_sequence = itertools.count()
 
     # |in_queue| is a queue to send a task from the broker thread to a worker
     # process.
@@ -283,11 +315,15 @@ class ProcessPoolExecutor(Executor):
     self._broker_thread.start()
 
   def submit(self, fn, *args, **kwargs):
+    return self.submit_with_priority(0, fn, *args, **kwargs)
+
+  def submit_with_priority(self, priority, fn, *args, **kwargs):
     if self._shutdown:
       raise RuntimeError('The executor is already shutdown.')
 
     future = Future()
-    self._task_queue.put((fn, args, kwargs, future))
+    self._task_queue.put(_PrioritizedTask(
+        priority, next(self._task_sequence), (fn, args, kwargs, future)))
     # Notify the broker thread.
     self._out_queue.put(None)
     return future
@@ -296,7 +332,8 @@ class ProcessPoolExecutor(Executor):
     if not self._shutdown:
       self._shutdown = True
       # Send a sentinel to the broker thread.
-      self._task_queue.put(None)
+      self._task_queue.put(
+          _PrioritizedTask(None, next(self._task_sequence), None))
       self._out_queue.put(None)
     if wait:
       self._join_worker()
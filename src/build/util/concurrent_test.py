@@ -167,6 +167,12 @@ def _process_task_run(set_event, wait_event):
     wait_event.wait()
 
 
+def _process_append_run(path, line):
+  # This function needs to be global.
+  with open(path, 'a') as f:
+    f.write(line + '\n')
+
+
 class ProcessPoolExecutorTest(unittest.TestCase):
   """Simple tests for ThreadPoolExecutor."""
   def test_simple_scenario(self):
@@ -253,6 +259,34 @@ class ProcessPoolExecutorTest(unittest.TestCase):
       waiting_event.set()
       cancel_event.set()
 
+  def test_priority(self):
+    started_event = TempFileEvent()
+    waiting_event = TempFileEvent()
+    order_file = tempfile.NamedTemporaryFile(delete=False)
+    order_file.close()
+
+    try:
+      with concurrent.ProcessPoolExecutor(max_workers=1) as executor:
+        executor.submit(_process_task_run, started_event, waiting_event)
+        started_event.wait()
+        # While the only worker is busy, the following tasks are queued.
+        executor.submit(_process_append_run, order_file.name, 'default')
+        executor.submit_with_priority(
+            -1, _process_append_run, order_file.name, 'low')
+        executor.submit_with_priority(
+            10, _process_append_run, order_file.name, 'high')
+        executor.submit_with_priority(
+            10, _process_append_run, order_file.name, 'high2')
+        waiting_event.set()
+
+      with open(order_file.name) as f:
+        self.assertEquals(['high', 'high2', 'default', 'low'],
+                          f.read().split())
+    finally:
+      started_event.set()
+      waiting_event.set()
+      os.remove(order_file.name)
+
 
 class SynchronousExecutorTest(unittest.TestCase):
   def test_simple_scenario(self):
@@ -0,0 +1,251 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Reads the symbol tables of ELF files and archives without running nm.
+
+Build rules and checks list the symbols of every object file and shared
+library.  Running the target nm and parsing its output costs a process, and
+often a shell pipeline, for each file.  This module reads .symtab or .dynsym
+of ELF32 and ELF64 files, in both byte orders, directly through mmap.  The
+symbols of an archive are the ones of its members, including the members of
+thin archives created by 'ar rcsT'.
+
+The symbols of each file are memoized by the path, the mtime, and the size,
+so that a process checking many files reads each of them only once.
+"""
+
+import collections
+import mmap
+import os
+import struct
+
+# ELF constants.
+_ELF_MAGIC = '\x7fELF'
+_ELFCLASS32 = 1
+_ELFCLASS64 = 2
+_ELFDATA2LSB = 1
+_ELFDATA2MSB = 2
+_SHT_SYMTAB = 2
+_SHT_NOBITS = 8
+_SHT_DYNSYM = 11
+_SHF_WRITE = 0x1
+_SHF_ALLOC = 0x2
+_SHF_EXECINSTR = 0x4
+_SHN_UNDEF = 0
+_SHN_LORESERVE = 0xff00
+_SHN_ABS = 0xfff1
+_SHN_COMMON = 0xfff2
+_SHN_XINDEX = 0xffff
+
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STB_WEAK = 2
+STB_GNU_UNIQUE = 10
+
+STT_OBJECT = 1
+STT_SECTION = 3
+STT_FILE = 4
+STT_GNU_IFUNC = 10
+
+# The formats of the ELF header after e_ident, of a section header, and of a
+# symbol, for each class.
+_ELF_FORMATS = {
+    _ELFCLASS32: ('HHIIIIIHHHHHH', 'IIIIIIIIII', 'IIIBBH'),
+    _ELFCLASS64: ('HHIQQQIHHHHHH', 'IIQQQQIIQQ', 'IBBHQQ'),
+}
+
+# Archive constants.
+_AR_MAGIC = '!<arch>\n'
+_AR_THIN_MAGIC = '!<thin>\n'
+_AR_HEADER_SIZE = 60
+
+# A symbol with its STT_* type, its STB_* binding, and the type letter nm
+# shows for it.
+Symbol = collections.namedtuple('Symbol', ['name', 'type', 'binding',
+                                           'is_defined', 'nm_type'])
+
+_SectionHeader = collections.namedtuple(
+    '_SectionHeader', ['name', 'type', 'flags', 'addr', 'offset', 'size',
+                       'link', 'info', 'addralign', 'entsize'])
+
+# A dict from (path, dynamic) to ((mtime, size), list of Symbol).
+_cache = {}
+
+
+def _read_string(data, offset):
+  return data[offset:data.find('\0', offset)]
+
+
+def _get_nm_type(section, shndx, symbol_type, binding, section_name):
+  """Returns the letter nm shows for the type of a symbol."""
+  if shndx == _SHN_COMMON:
+    return 'C'
+  if shndx == _SHN_UNDEF:
+    if binding == STB_WEAK:
+      return 'v' if symbol_type == STT_OBJECT else 'w'
+    return 'U'
+  if symbol_type == STT_GNU_IFUNC:
+    return 'i'
+  if binding == STB_WEAK:
+    return 'V' if symbol_type == STT_OBJECT else 'W'
+  if binding == STB_GNU_UNIQUE:
+    return 'u'
+  if shndx == _SHN_ABS:
+    letter = 'a'
+  elif section is None:
+    letter = '?'
+  elif section.flags & _SHF_EXECINSTR:
+    letter = 't'
+  elif section.type == _SHT_NOBITS:
+    letter = 'b'
+  elif section.flags & _SHF_ALLOC:
+    letter = 'd' if section.flags & _SHF_WRITE else 'r'
+  elif section_name.startswith('.debug'):
+    letter = 'N'
+  else:
+    letter = 'n'
+  return letter.upper() if binding == STB_GLOBAL else letter
+
+
+def _read_elf_symbols(data, base, dynamic):
+  """Returns the symbols of the ELF image at |base| in |data|.
+
+  .dynsym is read if |dynamic| is set, and .symtab otherwise.  An empty list
+  is returned if the table does not exist, e.g. in a stripped file.
+  """
+  elf_class = ord(data[base + 4])
+  byte_order = {_ELFDATA2LSB: '<', _ELFDATA2MSB: '>'}.get(
+      ord(data[base + 5]))
+  if elf_class not in _ELF_FORMATS or not byte_order:
+    raise ValueError('Unsupported ELF class or byte order')
+  header_format, section_format, symbol_format = [
+      struct.Struct(byte_order + fmt) for fmt in _ELF_FORMATS[elf_class]]
+
+  (_, _, _, _, _, shoff, _, _, _, _, shentsize, shnum,
+   shstrndx) = header_format.unpack_from(data, base + 16)
+  if not shoff:
+    return []
+  sections = [
+      _SectionHeader(*section_format.unpack_from(data,
+                                                 base + shoff + i * shentsize))
+      for i in xrange(shnum or 1)]
+  # Large section counts and indexes are kept in the first section header.
+  if not shnum:
+    shnum = sections[0].size
+    sections = [
+        _SectionHeader(*section_format.unpack_from(
+            data, base + shoff + i * shentsize))
+        for i in xrange(shnum)]
+  if shstrndx == _SHN_XINDEX:
+    shstrndx = sections[0].link
+  section_names = [
+      _read_string(data, base + sections[shstrndx].offset + section.name)
+      for section in sections]
+
+  table_type = _SHT_DYNSYM if dynamic else _SHT_SYMTAB
+  table = next((section for section in sections
+                if section.type == table_type), None)
+  if not table or not table.entsize:
+    return []
+  strtab_offset = base + sections[table.link].offset
+
+  symbols = []
+  # The first symbol is always the null symbol.
+  for i in xrange(1, table.size / table.entsize):
+    offset = base + table.offset + i * table.entsize
+    if elf_class == _ELFCLASS32:
+      name, _, _, info, _, shndx = symbol_format.unpack_from(data, offset)
+    else:
+      name, info, _, shndx, _, _ = symbol_format.unpack_from(data, offset)
+    symbol_type = info & 0xf
+    binding = info >> 4
+    # nm does not show these without --debug-syms.
+    if symbol_type in (STT_SECTION, STT_FILE):
+      continue
+    if 0 < shndx < _SHN_LORESERVE and shndx < len(sections):
+      section = sections[shndx]
+      section_name = section_names[shndx]
+    else:
+      section = None
+      section_name = ''
+    symbols.append(Symbol(
+        _read_string(data, strtab_offset + name), symbol_type, binding,
+        shndx != _SHN_UNDEF,
+        _get_nm_type(section, shndx, symbol_type, binding, section_name)))
+  return symbols
+
+
+def _get_archive_members(data):
+  """Yields (name, offset) of the members of the archive in |data|.
+
+  |offset| is where the content of the member starts.  The contents of the
+  members of a thin archive are not in the archive, but in the files at the
+  names relative to the archive.
+  """
+  is_thin = data[:len(_AR_THIN_MAGIC)] == _AR_THIN_MAGIC
+  long_names = ''
+  offset = len(_AR_MAGIC)
+  while offset + _AR_HEADER_SIZE <= len(data):
+    header = data[offset:offset + _AR_HEADER_SIZE]
+    name = header[:16].rstrip()
+    size = int(header[48:58])
+    offset += _AR_HEADER_SIZE
+    if name in ('/', '/SYM64/', '//'):
+      # The symbol index and the table of long names are always in the
+      # archive.
+      if name == '//':
+        long_names = data[offset:offset + size]
+      offset += size + (size & 1)
+      continue
+    if name.startswith('/'):
+      start = int(name[1:])
+      name = long_names[start:long_names.index('/\n', start)]
+    elif name.endswith('/'):
+      name = name[:-1]
+    yield name, offset
+    if not is_thin:
+      offset += size + (size & 1)
+
+
+def _read_symbols(path, dynamic):
+  with open(path, 'rb') as f:
+    if not os.fstat(f.fileno()).st_size:
+      raise ValueError('%s is empty' % path)
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    magic = data[:len(_AR_MAGIC)]
+    if data[:len(_ELF_MAGIC)] == _ELF_MAGIC:
+      return _read_elf_symbols(data, 0, dynamic)
+    if magic not in (_AR_MAGIC, _AR_THIN_MAGIC):
+      raise ValueError('%s is neither an ELF file nor an archive' % path)
+    symbols = []
+    for name, offset in _get_archive_members(data):
+      if magic == _AR_THIN_MAGIC:
+        symbols.extend(get_symbols(
+            os.path.join(os.path.dirname(path), name), dynamic))
+      elif data[offset:offset + len(_ELF_MAGIC)] == _ELF_MAGIC:
+        symbols.extend(_read_elf_symbols(data, offset, dynamic))
+    return symbols
+  finally:
+    data.close()
+
+
+def get_symbols(path, dynamic=False):
+  """Returns the list of Symbol in the ELF file or the archive at |path|.
+
+  The symbols are read from .dynsym if |dynamic| is set, and from .symtab
+  otherwise, as nm -D and nm do.  Section and file symbols are not included.
+  """
+  stat_result = os.stat(path)
+  key = (stat_result.st_mtime, stat_result.st_size)
+  entry = _cache.get((path, dynamic))
+  if entry is None or entry[0] != key:
+    entry = (key, _read_symbols(path, dynamic))
+    _cache[(path, dynamic)] = entry
+  return entry[1]
+
+
+def is_external(symbol):
+  """Returns True if |symbol| is visible from other files."""
+  return symbol.binding in (STB_GLOBAL, STB_WEAK, STB_GNU_UNIQUE)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from util import elf_symbols
+
+_SHT_PROGBITS = 1
+_SHT_SYMTAB = 2
+_SHT_STRTAB = 3
+_SHT_NOBITS = 8
+_SHT_DYNSYM = 11
+_SHF_WRITE = 0x1
+_SHF_ALLOC = 0x2
+_SHF_EXECINSTR = 0x4
+
+
+def _make_string_table(strings):
+  """Returns the table and the dict from each string to its offset."""
+  table = '\0'
+  offsets = {}
+  for string in strings:
+    offsets[string] = len(table)
+    table += string + '\0'
+  return table, offsets
+
+
+def _make_elf(symbols, is_64bit=True, byte_order='<', dynamic=False):
+  """Returns the content of an ELF object with |symbols|.
+
+  |symbols| is a list of (name, type, binding, section index).  The sections
+  are .text at index 1, .data at 2, .bss at 3, and .rodata at 4.
+  """
+  if is_64bit:
+    header_format, section_format, symbol_format = (
+        'HHIQQQIHHHHHH', 'IIQQQQIIQQ', 'IBBHQQ')
+  else:
+    header_format, section_format, symbol_format = (
+        'HHIIIIIHHHHHH', 'IIIIIIIIII', 'IIIBBH')
+  header_size = 16 + struct.calcsize(header_format)
+  section_size = struct.calcsize(section_format)
+  symbol_size = struct.calcsize(symbol_format)
+
+  strtab, name_offsets = _make_string_table(
+      [name for name, _, _, _ in symbols])
+  symtab = '\0' * symbol_size
+  for name, symbol_type, binding, shndx in symbols:
+    info = (binding << 4) | symbol_type
+    if is_64bit:
+      values = (name_offsets[name], info, 0, shndx, 0, 0)
+    else:
+      values = (name_offsets[name], 0, 0, info, 0, shndx)
+    symtab += struct.pack(byte_order + symbol_format, *values)
+  table_name = '.dynsym' if dynamic else '.symtab'
+  strtab_name = '.dynstr' if dynamic else '.strtab'
+  shstrtab, section_names = _make_string_table(
+      ['.text', '.data', '.bss', '.rodata', table_name, strtab_name,
+       '.shstrtab'])
+
+  # (name, type, flags, content, link, entsize)
+  sections = [
+      ('.text', _SHT_PROGBITS, _SHF_ALLOC | _SHF_EXECINSTR, '', 0, 0),
+      ('.data', _SHT_PROGBITS, _SHF_ALLOC | _SHF_WRITE, '', 0, 0),
+      ('.bss', _SHT_NOBITS, _SHF_ALLOC | _SHF_WRITE, '', 0, 0),
+      ('.rodata', _SHT_PROGBITS, _SHF_ALLOC, '', 0, 0),
+      (table_name, _SHT_DYNSYM if dynamic else _SHT_SYMTAB, 0, symtab, 6,
+       symbol_size),
+      (strtab_name, _SHT_STRTAB, 0, strtab, 0, 0),
+      ('.shstrtab', _SHT_STRTAB, 0, shstrtab, 0, 0)]
+  body = ''
+  headers = '\0' * section_size
+  for name, section_type, flags, content, link, entsize in sections:
+    headers += struct.pack(
+        byte_order + section_format, section_names[name], section_type,
+        flags, 0, header_size + len(body), len(content), link, 0, 1, entsize)
+    body += content
+  header = struct.pack(
+      byte_order + header_format, 1, 62, 1, 0, 0, header_size + len(body), 0,
+      header_size, 0, 0, section_size, len(sections) + 1, len(sections))
+  ident = '\x7fELF' + chr(2 if is_64bit else 1) + (
+      chr(1 if byte_order == '<' else 2)) + '\1' + '\0' * 9
+  return ident + header + body + headers
+
+
+def _make_archive_member_header(name, size):
+  return '%-16s%-12s%-6s%-6s%-8s%-10d`\n' % (name, 0, 0, 0, 644, size)
+
+
+def _make_archive(members):
+  """Returns the content of an archive of the list of (name, content)."""
+  long_names = ''
+  content = '!<arch>\n'
+  headers = []
+  for name, data in members:
+    if len(name) >= 16:
+      headers.append(('/%d' % len(long_names), data))
+      long_names += name + '/\n'
+    else:
+      headers.append((name + '/', data))
+  if long_names:
+    content += _make_archive_member_header('//', len(long_names)) + long_names
+    if len(long_names) % 2:
+      content += '\n'
+  for name, data in headers:
+    content += _make_archive_member_header(name, len(data)) + data
+    if len(data) % 2:
+      content += '\n'
+  return content
+
+
+_SYMBOLS = [
+    ('func', 2, elf_symbols.STB_GLOBAL, 1),
+    ('weak_func', 2, elf_symbols.STB_WEAK, 1),
+    ('local_func', 2, elf_symbols.STB_LOCAL, 1),
+    ('data', elf_symbols.STT_OBJECT, elf_symbols.STB_GLOBAL, 2),
+    ('bss', elf_symbols.STT_OBJECT, elf_symbols.STB_LOCAL, 3),
+    ('rodata', elf_symbols.STT_OBJECT, elf_symbols.STB_GLOBAL, 4),
+    ('undefined', 0, elf_symbols.STB_GLOBAL, 0),
+    ('weak_undefined', 0, elf_symbols.STB_WEAK, 0),
+    ('foo.c', elf_symbols.STT_FILE, elf_symbols.STB_LOCAL, 0xfff1),
+    ('', elf_symbols.STT_SECTION, elf_symbols.STB_LOCAL, 1)]
+
+_EXPECTED_NM_TYPES = [
+    ('func', 'T'), ('weak_func', 'W'), ('local_func', 't'), ('data', 'D'),
+    ('bss', 'b'), ('rodata', 'R'), ('undefined', 'U'),
+    ('weak_undefined', 'w')]
+
+
+class ElfSymbolsTest(unittest.TestCase):
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _write(self, name, content):
+    path = os.path.join(self._temp_dir, name)
+    with open(path, 'wb') as f:
+      f.write(content)
+    return path
+
+  def _get_nm_types(self, path, dynamic=False):
+    return [(symbol.name, symbol.nm_type)
+            for symbol in elf_symbols.get_symbols(path, dynamic)]
+
+  def test_elf(self):
+    for is_64bit in (True, False):
+      for byte_order in ('<', '>'):
+        path = self._write('a.o', _make_elf(_SYMBOLS, is_64bit, byte_order))
+        self.assertEquals(_EXPECTED_NM_TYPES, self._get_nm_types(path))
+        elf_symbols._cache.clear()
+
+  def test_symbol_attributes(self):
+    path = self._write('a.o', _make_elf(_SYMBOLS))
+    symbols = dict((symbol.name, symbol)
+                   for symbol in elf_symbols.get_symbols(path))
+    self.assertTrue(symbols['func'].is_defined)
+    self.assertTrue(elf_symbols.is_external(symbols['func']))
+    self.assertTrue(elf_symbols.is_external(symbols['weak_func']))
+    self.assertFalse(elf_symbols.is_external(symbols['local_func']))
+    self.assertFalse(symbols['undefined'].is_defined)
+
+  def test_dynamic(self):
+    path = self._write('liba.so', _make_elf(_SYMBOLS[:2], dynamic=True))
+    self.assertEquals([], self._get_nm_types(path))
+    self.assertEquals([('func', 'T'), ('weak_func', 'W')],
+                      self._get_nm_types(path, dynamic=True))
+
+  def test_archive(self):
+    path = self._write('liba.a', _make_archive([
+        ('a.o', _make_elf(_SYMBOLS[:1])),
+        ('a_very_long_member_name.o', _make_elf(_SYMBOLS[3:4])),
+        ('README', 'not an object')]))
+    self.assertEquals([('func', 'T'), ('data', 'D')],
+                      self._get_nm_types(path))
+
+  def test_thin_archive(self):
+    self._write('a.o', _make_elf(_SYMBOLS[:1]))
+    self._write('b.o', _make_elf(_SYMBOLS[3:4]))
+    path = self._write('libthin.a', '!<thin>\n' +
+                       _make_archive_member_header('a.o/', 100) +
+                       _make_archive_member_header('b.o/', 101))
+    self.assertEquals([('func', 'T'), ('data', 'D')],
+                      self._get_nm_types(path))
+
+  def test_cache(self):
+    path = self._write('a.o', _make_elf(_SYMBOLS[:1]))
+    self.assertEquals([('func', 'T')], self._get_nm_types(path))
+    path = self._write('a.o', _make_elf(_SYMBOLS[:2]))
+    os.utime(path, (0, 0))
+    self.assertEquals([('func', 'T'), ('weak_func', 'W')],
+                      self._get_nm_types(path))
+
+  def test_not_elf(self):
+    path = self._write('a.txt', 'text')
+    with self.assertRaises(ValueError):
+      elf_symbols.get_symbols(path)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,125 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Keeps a snapshot of the directory trees which configure scans.
+
+Generating ninja files walks the staging directory many times, often over
+overlapping subtrees, and in every worker process.  Instead, configure takes
+a snapshot of the directory entries once in the parent process, after the
+staging directory is created.  The worker processes inherit it when they are
+forked, and build_common.find_all_files walks the snapshot instead of the
+disk.
+
+The snapshot is saved to a file.  Next time, only the directories whose mtime
+has changed are listed again.  Changes made after the snapshot is taken are
+not visible through walk().
+"""
+
+import cPickle
+import os
+import tempfile
+import time
+
+# Bump this when the format of the file changes.
+_SNAPSHOT_VERSION = 1
+
+# A dict from a directory path to a tuple of (mtime, list of subdirectory
+# names, list of other names).  The paths are normalized, and are the ones
+# os.walk(followlinks=True) would visit.
+_snapshot = None
+
+
+def _list_directory(path):
+  """Lists the entries in |path| classified as os.walk() does."""
+  dirs = []
+  nondirs = []
+  for name in os.listdir(path):
+    if os.path.isdir(os.path.join(path, name)):
+      dirs.append(name)
+    else:
+      nondirs.append(name)
+  return dirs, nondirs
+
+
+def _load_previous_snapshot(snapshot_file):
+  try:
+    with open(snapshot_file, 'rb') as f:
+      version, snapshot_time, snapshot = cPickle.load(f)
+  except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+    return 0, {}
+  if version != _SNAPSHOT_VERSION:
+    return 0, {}
+  return snapshot_time, snapshot
+
+
+def _save_snapshot(snapshot_file, snapshot_time, snapshot):
+  dirname = os.path.dirname(snapshot_file)
+  if not os.path.isdir(dirname):
+    os.makedirs(dirname)
+  # Write to a temporary file first, so that an interrupted write does not
+  # leave a broken file.
+  with tempfile.NamedTemporaryFile(dir=dirname, delete=False) as f:
+    cPickle.dump((_SNAPSHOT_VERSION, snapshot_time, snapshot), f,
+                 cPickle.HIGHEST_PROTOCOL)
+  os.rename(f.name, snapshot_file)
+
+
+def take_snapshot(roots, snapshot_file):
+  """Takes the snapshot of the directory trees under |roots|.
+
+  The snapshot is saved to |snapshot_file|. The directories listed in the
+  previous snapshot are reused if their mtime is unchanged.
+  """
+  global _snapshot
+  previous_time, previous_snapshot = _load_previous_snapshot(snapshot_file)
+  snapshot_time = time.time()
+
+  snapshot = {}
+  stack = [os.path.normpath(root) for root in roots]
+  while stack:
+    path = stack.pop()
+    if path in snapshot:
+      continue
+    try:
+      mtime = os.stat(path).st_mtime
+    except OSError:
+      continue
+    entry = previous_snapshot.get(path)
+    # A directory modified in the same second as the previous snapshot may
+    # have been modified after it, as mtime may be truncated to seconds.
+    if entry is None or entry[0] != mtime or mtime >= previous_time - 1:
+      try:
+        dirs, nondirs = _list_directory(path)
+      except OSError:
+        continue
+      entry = (mtime, dirs, nondirs)
+    snapshot[path] = entry
+    stack.extend(os.path.join(path, name) for name in entry[1])
+
+  _snapshot = snapshot
+  _save_snapshot(snapshot_file, snapshot_time, snapshot)
+
+
+def clear_snapshot():
+  global _snapshot
+  _snapshot = None
+
+
+def walk(top):
+  """Works as os.walk(top, followlinks=True).
+
+  The directories in the snapshot are not read from the disk.
+  """
+  entry = _snapshot.get(os.path.normpath(top)) if _snapshot else None
+  if entry is None:
+    for result in os.walk(top, followlinks=True):
+      yield result
+    return
+
+  # Copy the lists, as the caller may modify them to prune the walk.
+  dirs = list(entry[1])
+  yield top, dirs, list(entry[2])
+  for name in dirs:
+    for result in walk(os.path.join(top, name)):
+      yield result
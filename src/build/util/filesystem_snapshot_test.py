@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tests for filesystem_snapshot."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from util import filesystem_snapshot
+
+
+def _sorted_walk(walk_result):
+  return sorted((root, sorted(dirs), sorted(files))
+                for root, dirs, files in walk_result)
+
+
+class FilesystemSnapshotTest(unittest.TestCase):
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._snapshot_file = os.path.join(self._temp_dir, 'snapshot.pickle')
+    self._root = os.path.join(self._temp_dir, 'root')
+    self._third_party = os.path.join(self._temp_dir, 'third_party')
+    for path in ['a/b', 'a/c']:
+      os.makedirs(os.path.join(self._third_party, path))
+    self._touch(os.path.join(self._third_party, 'a/b/foo.c'))
+    self._touch(os.path.join(self._third_party, 'a/bar.c'))
+    os.makedirs(self._root)
+    os.symlink(os.path.join(self._third_party, 'a'),
+               os.path.join(self._root, 'a'))
+    self._touch(os.path.join(self._root, 'baz.c'))
+    os.symlink('nonexistent', os.path.join(self._root, 'broken'))
+
+  def tearDown(self):
+    filesystem_snapshot.clear_snapshot()
+    shutil.rmtree(self._temp_dir)
+
+  def _touch(self, path):
+    with open(path, 'w'):
+      pass
+
+  def _take_snapshot(self):
+    filesystem_snapshot.take_snapshot([self._root], self._snapshot_file)
+
+  def test_walk(self):
+    expected = _sorted_walk(os.walk(self._root, followlinks=True))
+    self._take_snapshot()
+    self.assertEquals(expected,
+                      _sorted_walk(filesystem_snapshot.walk(self._root)))
+    subdir = os.path.join(self._root, 'a')
+    self.assertEquals(_sorted_walk(os.walk(subdir + '/', followlinks=True)),
+                      _sorted_walk(filesystem_snapshot.walk(subdir + '/')))
+
+  def test_snapshot_is_not_updated(self):
+    self._take_snapshot()
+    self._touch(os.path.join(self._third_party, 'a/b/new.c'))
+    files = [files for root, _, files in filesystem_snapshot.walk(self._root)
+             if root.endswith('b')]
+    self.assertEquals([['foo.c']], files)
+
+  def test_walk_outside_snapshot(self):
+    self._take_snapshot()
+    self.assertEquals(
+        _sorted_walk(os.walk(self._third_party, followlinks=True)),
+        _sorted_walk(filesystem_snapshot.walk(self._third_party)))
+
+  def test_prune(self):
+    self._take_snapshot()
+    result = []
+    for root, dirs, files in filesystem_snapshot.walk(self._root):
+      dirs[:] = []
+      result.append(root)
+    self.assertEquals([self._root], result)
+
+  def test_update(self):
+    self._take_snapshot()
+    os.utime(os.path.join(self._third_party, 'a/b'), (0, 0))
+    self._touch(os.path.join(self._third_party, 'a/b/new.c'))
+    self._take_snapshot()
+    self.assertEquals(
+        _sorted_walk(os.walk(self._root, followlinks=True)),
+        _sorted_walk(filesystem_snapshot.walk(self._root)))
+
+
+if __name__ == '__main__':
+  unittest.main()
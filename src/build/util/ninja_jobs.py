@@ -0,0 +1,365 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Chooses and adjusts the parallelism of ninja for this machine.
+
+Fixed -j and -l values are wrong for some machines: too many jobs make a
+laptop swap, and too few leave the CPUs of a bot idle while they wait for
+goma.  NinjaJobController runs ninja with -j and -l chosen from the history
+of the previous builds on this machine, and samples /proc in a thread while
+ninja runs:
+
+- the load average,
+- the available memory,
+- the jobs ninja runs, the memory they use, and how many of them are remote
+  (i.e. waiting for gomacc).
+
+When the machine runs out of memory, or when ninja keeps the CPUs idle while
+it runs as many jobs as -j allows, ninja is interrupted and restarted with
+fewer or more jobs.  Interrupted ninja removes the outputs of the steps it
+was running, so a restart only costs the work of these steps.  It is done
+only after the condition lasts for a while, and at most _MAX_RESTARTS times
+a build.
+
+After the build, the memory used by a job and the ratio of remote jobs are
+recorded for this host in ~/.arc/ninja_jobs.json for the next builds.
+"""
+
+import collections
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+from util import statistics
+
+_HISTORY_PATH = os.path.expanduser('~/.arc/ninja_jobs.json')
+
+# The interval in seconds between the samples.
+_SAMPLE_INTERVAL = 1.0
+
+# The estimates used until the history of this machine has them.
+_DEFAULT_JOB_MEMORY_MB = 512
+_DEFAULT_REMOTE_RATIO = {False: 0.0, True: 0.8}
+
+# More jobs than this do not help a lot even with goma.
+_MAX_JOBS = 200
+# The part of the RAM the jobs may use.
+_USABLE_MEMORY_RATIO = 0.75
+# ninja does not start new jobs while the load average is above this times
+# the number of CPUs.
+_MAX_LOAD_PER_CPU = 1.25
+
+# ninja is restarted with fewer jobs when the available memory stays below
+# this part of the RAM for _LOW_MEMORY_SAMPLES samples.
+_LOW_MEMORY_RATIO = 0.05
+_LOW_MEMORY_SAMPLES = 3
+# ninja is restarted with more jobs when it runs as many jobs as -j allows
+# while the load average stays below this times the number of CPUs and half
+# of the RAM is available, for _IDLE_SAMPLES samples.
+_IDLE_LOAD_PER_CPU = 0.5
+_IDLE_SAMPLES = 30
+_MAX_RESTARTS = 3
+
+# The history is updated only by builds which ran jobs in this many samples,
+# so that no-op builds do not affect it.
+_MIN_BUSY_SAMPLES = 10
+# The weight of the latest build in the history.
+_HISTORY_WEIGHT = 0.5
+
+Settings = collections.namedtuple('Settings', ['jobs', 'load'])
+
+# A sample of the state of the machine while ninja runs.
+Sample = collections.namedtuple('Sample', [
+    'load', 'available_memory_mb', 'running_jobs', 'remote_jobs',
+    'jobs_memory_mb'])
+
+# A process in /proc with its parent, its command name, and its RSS.
+_Process = collections.namedtuple('_Process', ['ppid', 'name', 'rss_mb'])
+
+
+def get_cpu_count():
+  return multiprocessing.cpu_count()
+
+
+def get_memory_mb():
+  return (os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') /
+          (1024 * 1024))
+
+
+def _get_history_key(use_goma):
+  return '%s/%s' % (socket.gethostname(), 'goma' if use_goma else 'local')
+
+
+def load_history(use_goma, path=_HISTORY_PATH):
+  """Returns the dict of the history of the builds on this machine."""
+  try:
+    with open(path) as f:
+      return json.load(f).get(_get_history_key(use_goma), {})
+  except (IOError, ValueError):
+    return {}
+
+
+def save_history(history, use_goma, path=_HISTORY_PATH):
+  try:
+    with open(path) as f:
+      all_history = json.load(f)
+  except (IOError, ValueError):
+    all_history = {}
+  all_history[_get_history_key(use_goma)] = history
+  try:
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    # Write and rename, so that concurrent builds never read a partial file.
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+      json.dump(all_history, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+  except (IOError, OSError) as e:
+    print 'ninja_jobs: Failed to save the history: %s' % e
+
+
+def compute_settings(history, use_goma, cpu_count, memory_mb):
+  """Returns the Settings for a build on the machine.
+
+  Without goma, ninja runs as many jobs as its default, which is a little
+  more than the CPUs.  With goma, the jobs which wait for remote compiles
+  do not use the CPUs, so more jobs are run by the ratio of remote jobs.
+  In both cases, the jobs may use up to _USABLE_MEMORY_RATIO of the RAM.
+  """
+  job_memory_mb = history.get('job_memory_mb', _DEFAULT_JOB_MEMORY_MB)
+  remote_ratio = history.get('remote_ratio', _DEFAULT_REMOTE_RATIO[use_goma])
+  local_jobs = cpu_count + 2
+  jobs = int(local_jobs / max(1.0 - remote_ratio,
+                              float(local_jobs) / _MAX_JOBS))
+  jobs_by_memory = int(memory_mb * _USABLE_MEMORY_RATIO /
+                       max(job_memory_mb, 1))
+  return Settings(jobs=max(1, min(jobs, jobs_by_memory, _MAX_JOBS)),
+                  load=max(1, int(cpu_count * _MAX_LOAD_PER_CPU)))
+
+
+def update_history(history, samples):
+  """Returns |history| updated with the |samples| of a build.
+
+  The memory used by a job is the 90th percentile over the samples, so that
+  the estimate covers the memory-heavy steps such as links.
+  """
+  busy_samples = [sample for sample in samples if sample.running_jobs]
+  if len(busy_samples) < _MIN_BUSY_SAMPLES:
+    return history
+  job_memory_mb = statistics.compute_percentiles(
+      [float(sample.jobs_memory_mb) / sample.running_jobs
+       for sample in busy_samples], (90,))[0]
+  remote_ratio = statistics.compute_average(
+      [float(sample.remote_jobs) / sample.running_jobs
+       for sample in busy_samples])
+  updated = dict(history)
+  for name, value in (('job_memory_mb', job_memory_mb),
+                      ('remote_ratio', remote_ratio)):
+    if name in history:
+      value = (1 - _HISTORY_WEIGHT) * history[name] + _HISTORY_WEIGHT * value
+    updated[name] = value
+  return updated
+
+
+def decide_settings(settings, samples, cpu_count, memory_mb):
+  """Returns the new Settings to restart ninja with, or None.
+
+  |samples| are the samples since ninja started with |settings|.
+  """
+  low_memory = samples[-_LOW_MEMORY_SAMPLES:]
+  if (len(low_memory) == _LOW_MEMORY_SAMPLES and settings.jobs > 1 and
+      all(sample.available_memory_mb < memory_mb * _LOW_MEMORY_RATIO and
+          sample.running_jobs > 1 for sample in low_memory)):
+    return settings._replace(
+        jobs=max(1, min(settings.jobs, low_memory[-1].running_jobs) / 2))
+  idle = samples[-_IDLE_SAMPLES:]
+  if (len(idle) == _IDLE_SAMPLES and settings.jobs < _MAX_JOBS and
+      all(sample.running_jobs >= settings.jobs and
+          sample.load < cpu_count * _IDLE_LOAD_PER_CPU and
+          sample.available_memory_mb > memory_mb / 2 for sample in idle)):
+    return settings._replace(jobs=min(settings.jobs * 2, _MAX_JOBS))
+  return None
+
+
+def _read_load():
+  with open('/proc/loadavg') as f:
+    return float(f.read().split()[0])
+
+
+def _read_available_memory_mb():
+  meminfo = {}
+  with open('/proc/meminfo') as f:
+    for line in f:
+      name, value = line.split(':', 1)
+      meminfo[name] = int(value.split()[0])
+  if 'MemAvailable' in meminfo:
+    available_kb = meminfo['MemAvailable']
+  else:
+    # Kernels older than 3.14 do not estimate the available memory.
+    available_kb = (meminfo['MemFree'] + meminfo.get('Buffers', 0) +
+                    meminfo.get('Cached', 0))
+  return available_kb / 1024
+
+
+def _read_processes():
+  """Returns a dict from the pids in /proc to _Process."""
+  page_mb = float(os.sysconf('SC_PAGE_SIZE')) / (1024 * 1024)
+  processes = {}
+  for name in os.listdir('/proc'):
+    if not name.isdigit():
+      continue
+    try:
+      with open('/proc/%s/stat' % name) as f:
+        stat = f.read()
+    except IOError:
+      # The process exited.
+      continue
+    # The command name is in parentheses, and may contain spaces.
+    fields = stat[stat.rindex(')') + 2:].split()
+    processes[int(name)] = _Process(
+        ppid=int(fields[1]), name=stat[stat.index('(') + 1:stat.rindex(')')],
+        rss_mb=int(fields[21]) * page_mb)
+  return processes
+
+
+def get_jobs_sample(processes, ninja_pid):
+  """Returns (running jobs, remote jobs, memory of jobs in MB) of ninja.
+
+  Each child of ninja is a job.  A job is remote if it runs gomacc.
+  """
+  children = collections.defaultdict(list)
+  for pid, process in processes.iteritems():
+    children[process.ppid].append(pid)
+  running_jobs = remote_jobs = 0
+  jobs_memory_mb = 0.0
+  for job_pid in children[ninja_pid]:
+    running_jobs += 1
+    is_remote = False
+    pending = [job_pid]
+    while pending:
+      pid = pending.pop()
+      jobs_memory_mb += processes[pid].rss_mb
+      is_remote = is_remote or processes[pid].name == 'gomacc'
+      pending.extend(children[pid])
+    if is_remote:
+      remote_jobs += 1
+  return running_jobs, remote_jobs, jobs_memory_mb
+
+
+def _take_sample(ninja_pid):
+  running_jobs, remote_jobs, jobs_memory_mb = get_jobs_sample(
+      _read_processes(), ninja_pid)
+  return Sample(load=_read_load(),
+                available_memory_mb=_read_available_memory_mb(),
+                running_jobs=running_jobs, remote_jobs=remote_jobs,
+                jobs_memory_mb=jobs_memory_mb)
+
+
+def _has_jobs_argument(args):
+  return any(arg.startswith(('-j', '-l')) for arg in args)
+
+
+def _is_build(args):
+  # ninja -t runs a tool, and ninja -n does not run the commands.
+  return not any(arg.startswith(('-t', '-n')) for arg in args)
+
+
+class NinjaJobController(object):
+  """Runs ninja with the parallelism adjusted to the machine."""
+
+  def __init__(self, use_goma):
+    self._use_goma = use_goma
+    self._cpu_count = get_cpu_count()
+    self._memory_mb = get_memory_mb()
+    self._history = load_history(use_goma)
+    self._settings = compute_settings(self._history, use_goma,
+                                      self._cpu_count, self._memory_mb)
+    self._lock = threading.Lock()
+    self._stopped = threading.Event()
+    # The following are guarded by |_lock|.
+    self._process = None
+    # The samples of the whole build, and of the current ninja process.
+    self._samples = []
+    self._process_samples = []
+    self._new_settings = None
+    self._restarts = 0
+
+  def _get_command(self, args):
+    return ['ninja', '-j%d' % self._settings.jobs,
+            '-l%d' % self._settings.load] + args
+
+  def _monitor(self):
+    while not self._stopped.wait(_SAMPLE_INTERVAL):
+      with self._lock:
+        process = self._process
+        if not process or self._new_settings:
+          continue
+      try:
+        sample = _take_sample(process.pid)
+      except (IOError, OSError, ValueError):
+        continue
+      with self._lock:
+        if process is not self._process:
+          # ninja exited while the sample was taken.
+          continue
+        self._samples.append(sample)
+        self._process_samples.append(sample)
+        if self._restarts >= _MAX_RESTARTS:
+          continue
+        self._new_settings = decide_settings(
+            self._settings, self._process_samples, self._cpu_count,
+            self._memory_mb)
+        if self._new_settings:
+          # ninja stops the running steps and removes their outputs.
+          process.send_signal(signal.SIGINT)
+
+  def _run_monitored(self, args, cwd):
+    while True:
+      cmd = self._get_command(args)
+      with self._lock:
+        self._process = subprocess.Popen(cmd, cwd=cwd)
+        self._process_samples = []
+      status = self._process.wait()
+      with self._lock:
+        self._process = None
+        new_settings = self._new_settings
+        self._new_settings = None
+        if not new_settings:
+          return status, cmd
+        self._restarts += 1
+        print ('ninja_jobs: Restarting ninja with -j%d -l%d (was -j%d).' %
+               (new_settings.jobs, new_settings.load, self._settings.jobs))
+        sys.stdout.flush()
+        self._settings = new_settings
+
+  def run(self, args, cwd=None):
+    """Runs ninja with |args|, and returns (the exit status, the command).
+
+    Explicit -j or -l in |args| are respected.  ninja is not monitored when
+    it does not build, or where /proc is not available.
+    """
+    if _has_jobs_argument(args):
+      cmd = ['ninja'] + args
+      return subprocess.call(cmd, cwd=cwd), cmd
+    if not _is_build(args) or not os.path.exists('/proc/loadavg'):
+      cmd = self._get_command(args)
+      return subprocess.call(cmd, cwd=cwd), cmd
+
+    monitor = threading.Thread(target=self._monitor)
+    monitor.daemon = True
+    monitor.start()
+    try:
+      status, cmd = self._run_monitored(args, cwd)
+    finally:
+      self._stopped.set()
+      monitor.join()
+    if status == 0:
+      save_history(update_history(self._history, self._samples),
+                   self._use_goma)
+    return status, cmd
@@ -0,0 +1,103 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from util import ninja_jobs
+
+
+def _make_sample(load=1.0, available_memory_mb=12288, running_jobs=4,
+                 remote_jobs=0, jobs_memory_mb=1024):
+  return ninja_jobs.Sample(
+      load=load, available_memory_mb=available_memory_mb,
+      running_jobs=running_jobs, remote_jobs=remote_jobs,
+      jobs_memory_mb=jobs_memory_mb)
+
+
+class NinjaJobsTest(unittest.TestCase):
+  def test_compute_settings(self):
+    # Without history, a laptop runs a little more jobs than the CPUs.
+    self.assertEquals(ninja_jobs.Settings(jobs=10, load=10),
+                      ninja_jobs.compute_settings({}, False, 8, 16384))
+    # A machine with little memory runs fewer jobs.
+    self.assertEquals(3, ninja_jobs.compute_settings(
+        {'job_memory_mb': 1024}, False, 8, 4096).jobs)
+    # With goma, more jobs are run by the ratio of remote jobs.
+    self.assertEquals(50, ninja_jobs.compute_settings(
+        {'remote_ratio': 0.8}, True, 8, 65536).jobs)
+    self.assertEquals(200, ninja_jobs.compute_settings(
+        {'remote_ratio': 1.0}, True, 64, 262144).jobs)
+    self.assertEquals(80, ninja_jobs.compute_settings(
+        {}, True, 64, 262144).load)
+
+  def test_update_history(self):
+    samples = [_make_sample(running_jobs=4, remote_jobs=2,
+                            jobs_memory_mb=1024)] * 10
+    history = ninja_jobs.update_history({}, samples)
+    self.assertEquals({'job_memory_mb': 256, 'remote_ratio': 0.5}, history)
+    history = ninja_jobs.update_history(
+        history, [_make_sample(running_jobs=2, remote_jobs=2,
+                               jobs_memory_mb=1024)] * 10)
+    self.assertEquals({'job_memory_mb': 384, 'remote_ratio': 0.75}, history)
+    # Builds with few jobs do not affect the history.
+    self.assertEquals(history, ninja_jobs.update_history(
+        history, [_make_sample(running_jobs=0)] * 100))
+
+  def test_decide_settings_low_memory(self):
+    settings = ninja_jobs.Settings(jobs=16, load=10)
+    low = _make_sample(available_memory_mb=100, running_jobs=12)
+    self.assertIsNone(ninja_jobs.decide_settings(
+        settings, [_make_sample(), low, low], 8, 16384))
+    self.assertEquals(ninja_jobs.Settings(jobs=6, load=10),
+                      ninja_jobs.decide_settings(
+                          settings, [_make_sample(), low, low, low], 8, 16384))
+
+  def test_decide_settings_idle(self):
+    settings = ninja_jobs.Settings(jobs=10, load=10)
+    idle = _make_sample(load=1.0, running_jobs=10)
+    self.assertIsNone(ninja_jobs.decide_settings(
+        settings, [idle] * 29, 8, 16384))
+    self.assertEquals(ninja_jobs.Settings(jobs=20, load=10),
+                      ninja_jobs.decide_settings(
+                          settings, [idle] * 30, 8, 16384))
+    # ninja is not limited by -j.
+    self.assertIsNone(ninja_jobs.decide_settings(
+        settings, [idle] * 29 + [_make_sample(running_jobs=9)], 8, 16384))
+    # The CPUs are busy.
+    self.assertIsNone(ninja_jobs.decide_settings(
+        settings, [_make_sample(load=6.0, running_jobs=10)] * 30, 8, 16384))
+
+  def test_get_jobs_sample(self):
+    processes = {
+        1: ninja_jobs._Process(ppid=0, name='ninja', rss_mb=10),
+        2: ninja_jobs._Process(ppid=1, name='sh', rss_mb=1),
+        3: ninja_jobs._Process(ppid=2, name='gomacc', rss_mb=5),
+        4: ninja_jobs._Process(ppid=1, name='sh', rss_mb=1),
+        5: ninja_jobs._Process(ppid=4, name='ld', rss_mb=500),
+        6: ninja_jobs._Process(ppid=0, name='chrome', rss_mb=1000),
+    }
+    self.assertEquals((2, 1, 507),
+                      ninja_jobs.get_jobs_sample(processes, 1))
+    self.assertEquals((0, 0, 0), ninja_jobs.get_jobs_sample(processes, 6))
+
+  def test_history_file(self):
+    temp_dir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(temp_dir, 'arc', 'ninja_jobs.json')
+      self.assertEquals({}, ninja_jobs.load_history(False, path=path))
+      ninja_jobs.save_history({'remote_ratio': 0.0}, False, path=path)
+      ninja_jobs.save_history({'remote_ratio': 0.9}, True, path=path)
+      self.assertEquals({'remote_ratio': 0.0},
+                        ninja_jobs.load_history(False, path=path))
+      self.assertEquals({'remote_ratio': 0.9},
+                        ninja_jobs.load_history(True, path=path))
+    finally:
+      shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+  unittest.main()